@@ -11,6 +11,7 @@ from accounts.models import Profile
 from accounts.permissions import IsSuperUserRole
 from rest_framework.decorators import permission_classes
 from rest_framework.permissions import IsAuthenticated
+from loyalty import ledger_rollup, points_engine
 from loyalty.models import Business, Customer, Wallet
 from payments.models import Order
 from rewards.models import PointsTransaction
@@ -181,10 +182,11 @@ def admin_users_list(request):
     # دریافت تمام Customer هایی که Wallet برای Business های ادمین دارند
     wallets = Wallet.objects.filter(business__in=businesses).select_related(
         'customer', 'customer__user', 'business'
-    ).prefetch_related(
-        'points_transactions'
     )
     
+    # مجموع امتیازها برای همه‌ی wallet ها: rollup ماه‌های بسته + ردیف‌های ماه جاری
+    ledger_totals = ledger_rollup.totals(points_engine.REWARDS_LEDGER, wallet__business__in=businesses)
+    
     # دریافت اطلاعات کامل هر Customer
     customers_data = []
     for wallet in wallets:
@@ -202,14 +204,9 @@ def admin_users_list(request):
             wallet=wallet
         ).order_by('-created_at')
         
-        # محاسبه مجموع امتیازها
-        total_points_earned = points_transactions.filter(points__gt=0).aggregate(
-            total=Sum('points')
-        )['total'] or 0
-        
-        total_points_redeemed = abs(points_transactions.filter(points__lt=0).aggregate(
-            total=Sum('points')
-        )['total'] or 0)
+        points_totals = ledger_totals.get(wallet.id, ledger_rollup.LedgerTotals())
+        total_points_earned = points_totals.earned
+        total_points_redeemed = points_totals.redeemed
         
         # مجموع مبلغ خریدها
         total_spent = orders.filter(status=Order.Status.PAID).aggregate(
@@ -229,7 +226,7 @@ def admin_users_list(request):
             'current_balance': wallet.points_balance,
             'total_spent': total_spent,
             'last_order_date': orders.first().created_at if orders.exists() else None,
-            'last_transaction_date': points_transactions.first().created_at if points_transactions.exists() else None,
+            'last_transaction_date': points_totals.last_at,
         })
     
     # مرتب‌سازی بر اساس آخرین فعالیت
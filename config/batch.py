@@ -0,0 +1,171 @@
+"""
+In-process batch of GET sub-requests: ``POST /api/v1/batch/``.
+
+A screen that needs e.g. business detail, menu, reviews and favorite count sends
+one request instead of five::
+
+    {"paths": {"detail": "/api/v1/businesses/3/", "menu": "/api/v1/menu/3/",
+               "reviews": "/api/v1/reviews/business/3/"}}
+
+(a plain list of paths is keyed by the paths themselves). Each path is resolved
+with the project URLconf and its view is called directly with a lightweight GET
+request carrying the already-authenticated user, so the inner calls skip the
+middleware stack (audit log, activity tracking, session, CSRF) and the token
+check. The outer request passes through all of it once.
+
+At most ``settings.BATCH_MAX_ITEMS`` paths are accepted; once
+``settings.BATCH_MAX_SECONDS`` have passed, the remaining items are not run and
+answer 504. Only ``/api/`` paths are allowed and a batch cannot contain a batch.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+# Response headers that are passed through per item
+FORWARDED_HEADERS = ("ETag", "Last-Modified", "X-Cache")
+# Outer request headers that must not apply to the sub-requests
+DROPPED_META = ("CONTENT_TYPE", "CONTENT_LENGTH", "HTTP_IF_NONE_MATCH", "HTTP_IF_MODIFIED_SINCE", "HTTP_IDEMPOTENCY_KEY")
+
+
+def _max_items() -> int:
+    return int(getattr(settings, "BATCH_MAX_ITEMS", 20))
+
+
+def _max_seconds() -> float:
+    return float(getattr(settings, "BATCH_MAX_SECONDS", 5.0))
+
+
+class SubRequest(HttpRequest):
+    """A GET for ``path`` that shares the user, language and headers of ``outer``."""
+
+    def __init__(self, outer: HttpRequest, path: str, query_string: str, user, auth):
+        super().__init__()
+        self.method = "GET"
+        self.path = self.path_info = path
+        self.META = {key: value for key, value in outer.META.items() if key not in DROPPED_META}
+        self.META.update(REQUEST_METHOD="GET", PATH_INFO=path, QUERY_STRING=query_string, HTTP_ACCEPT="application/json")
+        self.GET = QueryDict(query_string)
+        self.COOKIES = outer.COOKIES
+        self._scheme = outer.scheme
+        self.user = user
+        for attr in ("session", "LANGUAGE_CODE"):
+            if hasattr(outer, attr):
+                setattr(self, attr, getattr(outer, attr))
+        if user is not None and user.is_authenticated:
+            # DRF's forced authentication: the user is not looked up again
+            self._force_auth_user, self._force_auth_token = user, auth
+
+    def _get_scheme(self) -> str:
+        return self._scheme
+
+
+def _item(status_code: int, body, headers=None) -> dict:
+    item = {"status": status_code, "body": body}
+    if headers:
+        item["headers"] = headers
+    return item
+
+
+def _error(status_code: int, message: str) -> dict:
+    return _item(status_code, {"error": message})
+
+
+def dispatch(request, path: str) -> dict:
+    """Run one GET sub-request of ``request`` (a DRF request) and return its batch item."""
+    parts = urlsplit(path)
+    if parts.scheme or parts.netloc or not parts.path.startswith("/api/"):
+        return _error(status.HTTP_400_BAD_REQUEST, "Only relative /api/ paths are allowed")
+    try:
+        match = resolve(parts.path)
+    except Resolver404:
+        return _error(status.HTTP_404_NOT_FOUND, "Not found")
+    if getattr(match.func, "view_class", None) is BatchView:
+        return _error(status.HTTP_400_BAD_REQUEST, "A batch cannot contain a batch")
+
+    inner = SubRequest(request._request, parts.path, parts.query, request.user, request.auth)
+    try:
+        response = match.func(inner, *match.args, **match.kwargs)
+        if hasattr(response, "render") and callable(response.render):
+            response.render()
+    except Http404:
+        return _error(status.HTTP_404_NOT_FOUND, "Not found")
+    except PermissionDenied:
+        return _error(status.HTTP_403_FORBIDDEN, "Permission denied")
+    except Exception:
+        # The message may carry internals (SQL, paths); it goes to the log, not to the client
+        logger.exception("Batch sub-request %s failed", parts.path)
+        return _error(status.HTTP_500_INTERNAL_SERVER_ERROR, "Internal server error")
+
+    if response.streaming:
+        return _error(status.HTTP_501_NOT_IMPLEMENTED, "Streaming responses cannot be batched")
+    headers = {name: response[name] for name in FORWARDED_HEADERS if response.has_header(name)}
+    content = response.content
+    if not content:
+        body = None
+    elif response.get("Content-Type", "").startswith("application/json"):
+        body = json.loads(content)
+    else:
+        body = content.decode(response.charset or "utf-8", errors="replace")
+    return _item(response.status_code, body, headers)
+
+
+class BatchView(APIView):
+    """
+    POST /api/v1/batch/
+    Body: {"paths": ["/api/v1/businesses/3/", "/api/v1/menu/3/"]}
+       or {"paths": {"detail": "/api/v1/businesses/3/", "menu": "/api/v1/menu/3/"}}
+
+    Response format:
+    {
+        "responses": {
+            "detail": {"status": 200, "body": {...}, "headers": {"ETag": "..."}},
+            "menu": {"status": 200, "body": {...}}
+        },
+        "duration_ms": 12
+    }
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        paths = request.data.get("paths") if hasattr(request.data, "get") else None
+        if isinstance(paths, list) and all(isinstance(p, str) for p in paths):
+            items = {path: path for path in paths}
+        elif isinstance(paths, dict) and all(isinstance(p, str) for p in paths.values()):
+            items = {str(key): path for key, path in paths.items()}
+        else:
+            return Response(
+                {"error": "Invalid paths", "detail": "paths must be a list of paths or an object of key -> path"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not items or len(items) > _max_items():
+            return Response(
+                {"error": "Invalid paths", "detail": f"Between 1 and {_max_items()} paths are allowed"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        started = time.monotonic()
+        deadline = started + _max_seconds()
+        responses = {}
+        for key, path in items.items():
+            if time.monotonic() >= deadline:
+                responses[key] = _error(status.HTTP_504_GATEWAY_TIMEOUT, "Batch time limit exceeded; not run")
+                continue
+            responses[key] = dispatch(request, path)
+        return Response(
+            {"responses": responses, "duration_ms": int((time.monotonic() - started) * 1000)},
+            status=status.HTTP_200_OK
+        )
@@ -1,6 +1,7 @@
 from pathlib import Path
 from datetime import timedelta
 import os
+from corsheaders.defaults import default_headers as default_cors_headers
 
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -172,6 +173,10 @@ else:
     MEDIA_URL = "/media/"
     MEDIA_ROOT = BASE_DIR / "media"
 
+# Product / slider image URLs in API responses point to /media-cache/... (loyalty.media_cache),
+# served from the database image cache, so they keep working after a deploy wipes MEDIA_ROOT
+MEDIA_CACHE_URLS = os.environ.get("MEDIA_CACHE_URLS", "0" if USE_CLOUDINARY else "1") == "1"
+
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -182,6 +187,68 @@ LOGIN_REDIRECT_URL = "/partners/dashboard/"
 
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_ALLOW_HEADERS = (*default_cors_headers, "idempotency-key")
+
+
+# Cache: Redis when REDIS_URL is set (Django's built-in backend, needs the `redis`
+# package), otherwise per-process memory
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ.get("REDIS_URL"),
+            "KEY_PREFIX": os.environ.get("CACHE_KEY_PREFIX", "bonusweb"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "bonusweb",
+        }
+    }
+
+# How long a stored Idempotency-Key response can be replayed (seconds)
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", str(24 * 3600)))
+
+# How often (seconds) a process checks whether the reward catalog changed (loyalty.reward_index),
+# and after how many seconds it rebuilds its index anyway
+REWARD_INDEX_CHECK_INTERVAL = float(os.environ.get("REWARD_INDEX_CHECK_INTERVAL", "2"))
+REWARD_INDEX_MAX_AGE = float(os.environ.get("REWARD_INDEX_MAX_AGE", "300"))
+
+# Search-as-you-type index (loyalty.suggest_index): how often (seconds) a process checks for
+# name changes, and after how many seconds it refreshes the popularity ranking anyway
+SUGGEST_INDEX_CHECK_INTERVAL = float(os.environ.get("SUGGEST_INDEX_CHECK_INTERVAL", "2"))
+SUGGEST_INDEX_MAX_AGE = float(os.environ.get("SUGGEST_INDEX_MAX_AGE", "900"))
+
+# Lifetime (seconds) of a cached menu / slider / business response (loyalty.response_cache);
+# changes invalidate immediately, this only bounds how long superseded entries occupy the cache
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", str(24 * 3600)))
+
+# POST /api/v1/batch/ (config.batch): most sub-requests per batch, and seconds after which
+# the remaining ones are answered 504 instead of run
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", "20"))
+BATCH_MAX_SECONDS = float(os.environ.get("BATCH_MAX_SECONDS", "5"))
+
+# Image cache (loyalty.image_cache_policy): total bytes of cached images and renditions kept by
+# `python manage.py evict_image_cache` (0: no budget), hours a recently read image is safe from eviction,
+# and seconds between the batched writes of ImageCache.last_accessed
+IMAGE_CACHE_MAX_BYTES = int(float(os.environ.get("IMAGE_CACHE_MAX_MB", "256")) * 1024 * 1024)
+IMAGE_CACHE_EVICT_MIN_IDLE_HOURS = float(os.environ.get("IMAGE_CACHE_EVICT_MIN_IDLE_HOURS", "24"))
+IMAGE_ACCESS_FLUSH_INTERVAL = float(os.environ.get("IMAGE_ACCESS_FLUSH_INTERVAL", "30"))
+
+# Background jobs (loyalty.jobs, run by `python manage.py run_worker`): worker threads per process,
+# seconds between polls of an empty queue, attempts before a job is marked failed, first retry delay
+# (doubled per attempt), seconds after which a running job counts as abandoned, days finished jobs are kept
+JOB_WORKER_CONCURRENCY = int(os.environ.get("JOB_WORKER_CONCURRENCY", "2"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "2"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", "30"))
+JOB_LOCK_TIMEOUT = float(os.environ.get("JOB_LOCK_TIMEOUT", "600"))
+JOB_KEEP_DAYS = float(os.environ.get("JOB_KEEP_DAYS", "7"))
+
+# Ledger rows older than this many months may be moved to the archive tables (rollup_ledgers --archive)
+LEDGER_ARCHIVE_AFTER_MONTHS = int(os.environ.get("LEDGER_ARCHIVE_AFTER_MONTHS", "24"))
 
 
 REST_FRAMEWORK = {
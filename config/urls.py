@@ -1,5 +1,5 @@
 from django.contrib import admin
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.views.generic import TemplateView
 from django.views.i18n import set_language
 from notifications.views import SaveFcmTokenView, SaveDeviceTokenAPIView, AdminSendMessageAPIView
@@ -7,6 +7,10 @@ from django.conf import settings
 from django.conf.urls.static import static
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
+from loyalty import media_cache
+
+from .batch import BatchView
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("i18n/setlang/", set_language, name="set_language"),
@@ -35,6 +39,8 @@ urlpatterns = [
     path("api/v1/analytics/", include("analytics.urls")),
     path("api/v1/notifications/", include("notifications.urls")),
     path("api/v1/security/", include("securityapp.urls")),
+    # Several GETs in one request (config.batch)
+    path("api/v1/batch/", BatchView.as_view(), name="batch"),
     
     # Legacy API routes (backward compatibility - without versioning)
     path("api/", include("loyalty.urls")),
@@ -52,6 +58,7 @@ urlpatterns = [
     path("api/analytics/", include("analytics.urls")),
     path("api/notifications/", include("notifications.urls")),
     path("api/security/", include("securityapp.urls")),
+    path("api/batch/", BatchView.as_view(), name="batch_legacy"),
     
     # API schema and docs (versioned)
     path("api/v1/schema/", SpectacularAPIView.as_view(), name="schema-v1"),
@@ -66,6 +73,15 @@ urlpatterns = [
     # New FCM device token and admin message endpoints
     path("api/device-tokens/", SaveDeviceTokenAPIView.as_view(), name="device_tokens"),
     path("api/admin/send-message/", AdminSendMessageAPIView.as_view(), name="admin_send_message"),
+
+    # Images from the database image cache; they survive a deploy (loyalty.media_cache)
+    re_path(r"^media-cache/(?P<sha256>[0-9a-f]{64})/$", media_cache.blob_view, name="media_cache_blob"),
+    path("media-cache/<str:content_type>/<int:object_id>/", media_cache.object_view, name="media_cache_object"),
+    path(
+        "media-cache/<str:content_type>/<int:object_id>/<str:variant>/",
+        media_cache.object_view,
+        name="media_cache_variant",
+    ),
 ]
 
 # Serve media files
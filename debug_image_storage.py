@@ -194,7 +194,7 @@ def check_image_cache():
                 print(f"  - ID {img_cache.id}: {img_cache.original_path}")
                 print(f"    Model: {img_cache.content_type}")
                 print(f"    Created: {img_cache.created_at}")
-                print(f"    Has Data: {'Yes' if img_cache.image_data else 'No'}")
+                print(f"    Has Data: {'Yes' if img_cache.blob_id else 'No'}")
                 print(f"    Has URL: {'Yes' if img_cache.image_url else 'No'}")
         else:
             print("⚠️ هیچ تصویری در کش وجود ندارد")
@@ -1,7 +1,11 @@
+import base64
+
 from django.contrib import admin
+from django.utils import timezone
 from django.utils.html import format_html
 from django import forms
-from .models import Business, Customer, Product, Wallet, Transaction, Slider, ImageCache
+from . import image_store, jobs
+from .models import BackgroundJob, Business, Customer, CustomerPointsSummary, Product, Wallet, Transaction, Slider, ImageCache
 
 
 class BusinessAdminForm(forms.ModelForm):
@@ -44,7 +48,7 @@ class BusinessAdmin(admin.ModelAdmin):
     list_display = ("id", "name", "owner", "phone", "password_status", "created_at")
     list_filter = ("created_at", "owner")
     search_fields = ("name", "phone", "owner__username")
-    readonly_fields = ("created_at", "password_status")
+    readonly_fields = ("created_at", "password_status", "geohash")
     
     fieldsets = (
         ("Basic Information", {
@@ -53,6 +57,10 @@ class BusinessAdmin(admin.ModelAdmin):
         ("Contact Information", {
             "fields": ("phone", "address", "website")
         }),
+        ("Location", {
+            "fields": ("latitude", "longitude", "geohash"),
+            "description": "Used by /api/v1/businesses/nearby/; the geohash is derived on save."
+        }),
         ("Security", {
             "fields": ("password_display", "password_status"),
             "description": "Password is used for in-person business access. It's securely hashed and never displayed."
@@ -101,6 +109,12 @@ class TransactionAdmin(admin.ModelAdmin):
     list_display = ("id", "wallet", "amount", "created_at")
 
 
+@admin.register(CustomerPointsSummary)
+class CustomerPointsSummaryAdmin(admin.ModelAdmin):
+    list_display = ("customer", "total_balance", "lifetime_earned", "lifetime_redeemed", "wallet_count", "last_activity_at")
+    readonly_fields = ("total_balance", "lifetime_earned", "lifetime_redeemed", "wallet_count", "last_activity_at", "updated_at")
+
+
 @admin.register(Slider)
 class SliderAdmin(admin.ModelAdmin):
     list_display = ("id", "store", "business", "is_active", "order", "created_at")
@@ -115,7 +129,7 @@ class ImageCacheAdmin(admin.ModelAdmin):
     list_display = ("id", "content_type", "object_id", "original_path", "has_data_display", "file_size_display", "created_at", "last_accessed")
     list_filter = ("content_type", "created_at", "last_accessed")
     search_fields = ("original_path", "content_type", "object_id")
-    readonly_fields = ("created_at", "updated_at", "last_accessed", "has_data_display", "image_preview")
+    readonly_fields = ("created_at", "updated_at", "last_accessed", "blob", "has_data_display", "image_preview")
     ordering = ("-last_accessed", "-created_at")
     
     fieldsets = (
@@ -123,7 +137,7 @@ class ImageCacheAdmin(admin.ModelAdmin):
             "fields": ("content_type", "object_id", "original_path")
         }),
         ("داده تصویر", {
-            "fields": ("image_url", "image_data", "content_type_header", "file_size")
+            "fields": ("image_url", "blob", "content_type_header", "file_size")
         }),
         ("پیش‌نمایش", {
             "fields": ("has_data_display", "image_preview")
@@ -134,10 +148,13 @@ class ImageCacheAdmin(admin.ModelAdmin):
     )
     
     def has_data_display(self, obj):
-        """نمایش وضعیت داده"""
+        """نمایش وضعیت داده (بدون خواندن بایت‌های تصویر)"""
         if obj.has_data:
-            if obj.image_data:
-                return format_html('<span style="color: green;">✓ Base64 ({:.1f} KB)</span>', len(obj.image_data) / 1024)
+            if obj.blob_id:
+                return format_html(
+                    '<span style="color: green;">✓ Blob {} ({} KB)</span>',
+                    obj.blob_id[:12], f"{(obj.file_size or 0) / 1024:.1f}"
+                )
             elif obj.image_url:
                 return format_html('<span style="color: blue;">✓ URL</span>')
         return format_html('<span style="color: red;">✗ No Data</span>')
@@ -156,14 +173,31 @@ class ImageCacheAdmin(admin.ModelAdmin):
     file_size_display.short_description = "حجم فایل"
     
     def image_preview(self, obj):
-        """پیش‌نمایش تصویر"""
+        """پیش‌نمایش تصویر (فقط در صفحه‌ی جزئیات، بایت‌ها همین‌جا خوانده می‌شوند)"""
         if obj.image_url:
             return format_html('<img src="{}" style="max-width: 200px; max-height: 200px;" />', obj.image_url)
-        elif obj.image_data:
-            # نمایش base64
-            data_url = f"data:{obj.content_type_header or 'image/jpeg'};base64,{obj.image_data[:100]}..."
-            return format_html('<img src="{}" style="max-width: 200px; max-height: 200px;" />', data_url)
+        elif obj.blob_id:
+            data = image_store.read(obj.blob_id)
+            if data:
+                data_url = f"data:{obj.content_type_header or 'image/jpeg'};base64,{base64.b64encode(data).decode('ascii')}"
+                return format_html('<img src="{}" style="max-width: 200px; max-height: 200px;" />', data_url)
         return "بدون تصویر"
     image_preview.short_description = "پیش‌نمایش"
 
 
+@admin.register(BackgroundJob)
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = ("id", "kind", "key", "status", "attempts", "run_after", "locked_by", "created_at", "finished_at")
+    list_filter = ("status", "kind")
+    search_fields = ("key", "last_error")
+    readonly_fields = ("kind", "key", "payload", "attempts", "locked_by", "locked_at", "last_error", "created_at", "finished_at")
+    ordering = ("-created_at",)
+    actions = ("retry_now",)
+
+    @admin.action(description="Retry now")
+    def retry_now(self, request, queryset):
+        retried = 0
+        for job in queryset.exclude(status=BackgroundJob.Status.RUNNING):
+            jobs.requeue(job, run_after=timezone.now(), attempts=0, finished_at=None)
+            retried += 1
+        self.message_user(request, f"{retried} jobs queued again")
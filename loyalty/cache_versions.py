@@ -0,0 +1,51 @@
+"""
+Version counters shared by every process, kept in the database.
+
+Caches held inside a process (the reward and suggest indexes, the rendered JSON
+of ``loyalty.response_cache``) remember the version of their scope they were
+built for and compare it with the current one. The counters must be the same for
+every process: the Django cache is ``LocMemCache`` (one per process) unless
+``REDIS_URL`` is set, and web, worker and one-off command processes all change
+data. A read is one primary-key lookup; ``bump_on_commit()`` increments the
+counters with one ``UPDATE`` each once the change is committed, so the row lock
+is held for that statement only.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import CacheVersion
+
+
+def get(scope: str) -> int:
+    """Current version of ``scope`` (0 until it is first bumped)."""
+    return CacheVersion.objects.filter(pk=scope).values_list("version", flat=True).first() or 0
+
+
+def get_many(scopes: Iterable[str]) -> Dict[str, int]:
+    """``{scope: version}`` for ``scopes`` in one query."""
+    scopes = list(scopes)
+    found = dict(CacheVersion.objects.filter(pk__in=scopes).values_list("scope", "version"))
+    return {scope: found.get(scope, 0) for scope in scopes}
+
+
+def bump(*scopes: str) -> None:
+    # Sorted: two transactions bumping the same scopes lock them in the same order
+    for scope in sorted(set(scopes)):
+        if CacheVersion.objects.filter(pk=scope).update(version=F("version") + 1):
+            continue
+        try:
+            with transaction.atomic():
+                CacheVersion.objects.create(scope=scope, version=1)
+        except IntegrityError:
+            # Created concurrently
+            CacheVersion.objects.filter(pk=scope).update(version=F("version") + 1)
+
+
+def bump_on_commit(*scopes: str) -> None:
+    """Increment ``scopes`` once the current transaction commits (right away outside one)."""
+    transaction.on_commit(lambda: bump(*scopes))
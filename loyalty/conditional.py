@@ -0,0 +1,73 @@
+"""
+Conditional GET (ETag / Last-Modified / 304) for read-mostly APIViews.
+
+A view mixes in ``ConditionalGetMixin`` and implements ``get_validator()`` (and
+optionally ``get_last_modified()``). Both run after authentication and before the
+handler, so they must be cheap: a version number (``response_cache.version``, one
+primary-key read shared with the handler) or one ``max(updated_at)`` / count query. When the client's ``If-None-Match`` (or,
+without it, ``If-Modified-Since``) still matches, the view answers ``304 Not
+Modified`` without running the handler; otherwise the 200 carries the validators.
+
+The matching rules are Django's (``django.utils.cache.get_conditional_response``);
+the ETag is a weak hash of the view name and the validator, so it reveals nothing
+about the parts (e.g. a user ID) it was built from.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime
+from typing import Optional
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.exceptions import APIException
+
+
+class _Conditional(APIException):
+    """Carries a 304 / 412 response from ``initial()`` past the handler."""
+
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+class ConditionalGetMixin:
+    def get_validator(self, request, *args, **kwargs) -> Optional[tuple]:
+        """Values that change whenever the response body would; None disables the ETag."""
+        return None
+
+    def get_last_modified(self, request, *args, **kwargs) -> Optional[datetime]:
+        return None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._etag = self._last_modified = None
+        if request.method not in ("GET", "HEAD"):
+            return
+        validator = self.get_validator(request, *args, **kwargs)
+        if validator is not None:
+            digest = hashlib.sha1(repr((type(self).__name__, validator)).encode()).hexdigest()[:20]
+            self._etag = "W/" + quote_etag(digest)
+        last_modified = self.get_last_modified(request, *args, **kwargs)
+        if last_modified is not None:
+            self._last_modified = int(last_modified.timestamp())
+        if self._etag is None and self._last_modified is None:
+            return
+        response = get_conditional_response(request, etag=self._etag, last_modified=self._last_modified)
+        if response is not None:
+            raise _Conditional(response)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, _Conditional):
+            return exc.response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if response.status_code in (200, 304):
+            if getattr(self, "_etag", None):
+                response["ETag"] = self._etag
+            if getattr(self, "_last_modified", None) is not None:
+                response["Last-Modified"] = http_date(self._last_modified)
+        return response
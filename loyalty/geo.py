@@ -0,0 +1,149 @@
+"""
+Geohash cells and distances for "businesses near me" (no PostGIS needed).
+
+``Business.geohash`` holds the cell of the business coordinates at ``PRECISION``
+characters. A business lies in a cell of any shorter length exactly when its
+geohash starts with that cell, and a prefix is a plain range on the indexed
+column (``cell <= geohash < cell + "{"``), so SQLite and PostgreSQL both use
+the B-tree index.
+
+A nearby query covers the bounding box of its circle with at most
+``MAX_CELLS`` cells of the longest length that allows it. Only
+id/latitude/longitude of the candidates in those cells are read; the exact
+haversine distance is then computed for the whole batch in one pass.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Iterable, List, Optional, Tuple
+
+from django.db.models import Q
+
+PRECISION = 9
+# Most cells (OR-ed index ranges) one nearby query may scan
+MAX_CELLS = 16
+EARTH_RADIUS_KM = 6371.0088
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {ch: i for i, ch in enumerate(_BASE32)}
+# Sorts after every geohash character: "u33d" <= geohash < "u33d{" is the prefix range
+_AFTER = "{"
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def encode(latitude: float, longitude: float, precision: int = PRECISION) -> str:
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate, starting with longitude
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def bounds(geohash: str) -> Tuple[float, float, float, float]:
+    """``(min_lat, max_lat, min_lng, max_lng)`` of a cell."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for ch in geohash:
+        value = _DECODE[ch]
+        for shift in range(4, -1, -1):
+            interval = lng_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lat_range[1], lng_range[0], lng_range[1]
+
+
+def cell_size_degrees(length: int) -> Tuple[float, float]:
+    """``(lat_degrees, lng_degrees)`` of a cell with ``length`` characters."""
+    bits = 5 * length
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def covering_cells(latitude: float, longitude: float, radius_km: float) -> List[str]:
+    """
+    Cells that together contain every point within ``radius_km``: those covering
+    the circle's bounding box, at the longest cell length that needs at most
+    ``MAX_CELLS`` of them.
+    """
+    lat_span = radius_km / _KM_PER_DEGREE
+    # Cells narrow towards the poles: measure at the box edge farthest from the equator
+    edge = min(abs(latitude) + lat_span, 90.0)
+    lng_span = min(radius_km / (_KM_PER_DEGREE * max(math.cos(math.radians(edge)), 1e-6)), 180.0)
+    south, north = max(latitude - lat_span, -90.0), min(latitude + lat_span, 90.0)
+
+    for length in range(PRECISION, 0, -1):
+        lat_degrees, lng_degrees = cell_size_degrees(length)
+        rows = math.floor((north + 90) / lat_degrees) - math.floor((south + 90) / lat_degrees) + 1
+        columns = min(
+            math.floor((longitude + lng_span + 180) / lng_degrees) - math.floor((longitude - lng_span + 180) / lng_degrees) + 1,
+            round(360 / lng_degrees),
+        )
+        if rows * columns <= MAX_CELLS or length == 1:
+            break
+
+    cells = set()
+    for row in range(rows):
+        # Centre of each cell row / column, so rounding never lands on a border
+        lat = min(math.floor((south + 90) / lat_degrees) * lat_degrees - 90 + (row + 0.5) * lat_degrees, 90.0)
+        for column in range(columns):
+            lng = math.floor((longitude - lng_span + 180) / lng_degrees) * lng_degrees - 180 + (column + 0.5) * lng_degrees
+            # Wrap across the antimeridian
+            cells.add(encode(lat, (lng + 180) % 360 - 180, length))
+    return sorted(cells)
+
+
+def cells_filter(cells: Iterable[str], field: str = "geohash") -> Q:
+    """Index-friendly ``Q`` for "``field`` starts with one of ``cells``"."""
+    condition = Q()
+    for cell in cells:
+        condition |= Q(**{f"{field}__gte": cell, f"{field}__lt": cell + _AFTER})
+    return condition
+
+
+def distances_km(latitude: float, longitude: float, points: List[Tuple[float, float]]) -> List[float]:
+    """Haversine distance from one origin to every ``(latitude, longitude)`` in ``points``."""
+    lat0 = math.radians(latitude)
+    lng0 = math.radians(longitude)
+    cos_lat0 = math.cos(lat0)
+    sin, cos, asin, sqrt, radians = math.sin, math.cos, math.asin, math.sqrt, math.radians
+    result = []
+    append = result.append
+    for lat, lng in points:
+        lat1 = radians(lat)
+        a = sin((lat1 - lat0) / 2) ** 2 + cos_lat0 * cos(lat1) * sin((radians(lng) - lng0) / 2) ** 2
+        append(2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(a))))
+    return result
+
+
+def nearby(queryset, latitude: float, longitude: float, radius_km: float, limit: Optional[int] = None):
+    """
+    ``[(pk, distance_km), ...]`` of the rows of ``queryset`` (with latitude, longitude
+    and geohash columns) within ``radius_km``, nearest first.
+    """
+    candidates = list(
+        queryset.filter(cells_filter(covering_cells(latitude, longitude, radius_km)))
+        .values_list("pk", "latitude", "longitude")
+    )
+    distances = distances_km(latitude, longitude, [(lat, lng) for _, lat, lng in candidates])
+    found = sorted(
+        ((pk, distance) for (pk, _, _), distance in zip(candidates, distances) if distance <= radius_km),
+        key=lambda item: (item[1], item[0]),
+    )
+    return found[:limit] if limit is not None else found
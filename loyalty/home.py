@@ -0,0 +1,149 @@
+"""
+Sections of the app home screen, ``GET /api/v1/home/?include=slider,wallet``.
+
+On cold start the app used to call six endpoints, each repeating authentication,
+the activity middleware and the customer lookup. ``Home`` resolves the customer
+and the favorite IDs once, reads the rows of every requested section (sliders,
+wallets, favorites, reward products) and then loads all businesses they refer to
+in one annotated query, shared by every section. The query count is fixed (see
+``loyalty.tests.test_business_lists``) and, apart from building a
+missing points summary, nothing is written.
+
+Each section has the payload of the endpoint it replaces; the personal sections
+(favorites, wallet, dashboard) are ``None`` for anonymous requests.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Optional
+
+from django.db.models import Count, Sum
+
+from payments.models import Order
+from rewards import eligibility
+
+from . import reward_index
+from .models import Business, Favorite, Product, Slider, Wallet
+from .points_summary import get_points_summary
+from .request_context import FAVORITES_CONTEXT_KEY, request_customer
+from .serializers import SPARSE_FIELDS_CONTEXT_KEY, BusinessSerializer, SliderSerializer, WalletSerializer
+
+SECTIONS = ("slider", "businesses", "favorites", "wallet", "dashboard", "redeemable_products")
+REDEEMABLE_LIMIT = 10
+
+
+def parse_include(value: Optional[str]) -> List[str]:
+    """Sections named in ``?include=`` (all when empty); raises ValueError for unknown names."""
+    if not value:
+        return list(SECTIONS)
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = sorted(set(names) - set(SECTIONS))
+    if unknown:
+        raise ValueError(f"Unknown sections: {', '.join(unknown)}. Available: {', '.join(SECTIONS)}")
+    return [name for name in SECTIONS if name in names]
+
+
+def dashboard(user, customer) -> dict:
+    """Dashboard numbers of ``user``; all zero points when there is no customer yet."""
+    # تعداد و مجموع مبلغ سفارش‌های پرداخت شده (یک کوئری)
+    orders = Order.objects.filter(user=user, status=Order.Status.PAID).aggregate(
+        count=Count("id"), total=Sum("amount_cents")
+    )
+    # امتیازها از CustomerPointsSummary (به‌روزرسانی همزمان با هر تراکنش)
+    summary = get_points_summary(customer) if customer is not None else None
+    return {
+        "total_orders": orders["count"] or 0,
+        "total_points_earned": summary.lifetime_earned if summary else 0,
+        "total_points_redeemed": summary.lifetime_redeemed if summary else 0,
+        "total_points_balance": summary.total_balance if summary else 0,
+        "active_businesses_count": summary.wallet_count if summary else 0,
+        "total_spent_eur": round((orders["total"] or 0) / 100.0, 2),
+    }
+
+
+class Home:
+    def __init__(self, request, include: Iterable[str]):
+        self.request = request
+        self.include = list(include)
+        self.authenticated = request.user.is_authenticated
+        self.customer = request_customer(request) if self.authenticated else None
+
+    def build(self) -> Dict[str, object]:
+        include = set(self.include)
+        personal = self.customer is not None
+
+        # 1. The rows of each section, without their businesses
+        favorite_ids = (
+            list(Favorite.objects.filter(customer=self.customer).values_list("business_id", flat=True))
+            if personal and {"businesses", "favorites", "wallet"} & include else []
+        )
+        wallets = (
+            list(Wallet.objects.filter(customer=self.customer))
+            if personal and {"wallet", "redeemable_products"} & include else []
+        )
+        sliders = list(Slider.objects.filter(is_active=True).order_by("order", "-created_at")) if "slider" in include else []
+        products, product_count = [], 0
+        if "redeemable_products" in include:
+            index = reward_index.get_reward_index()
+            product_count = index.count()
+            ids = index.page(0, REDEEMABLE_LIMIT)
+            by_id = Product.objects.in_bulk(ids)
+            products = [by_id[pk] for pk in ids if pk in by_id]
+
+        # 2. One query for every business any section shows
+        queryset = Business.objects.annotate(favorites_count_value=Count("favorites"))
+        if "businesses" in include:
+            all_businesses = list(queryset)
+            businesses = {b.id: b for b in all_businesses}
+        else:
+            wanted = set(favorite_ids) if "favorites" in include else set()
+            wanted.update(w.business_id for w in wallets if "wallet" in include)
+            wanted.update(s.business_id for s in sliders)
+            wanted.update(p.business_id for p in products)
+            businesses = queryset.in_bulk(wanted) if wanted else {}
+        for row in (*wallets, *sliders, *products):
+            if row.business_id in businesses:
+                row.business = businesses[row.business_id]
+
+        # 3. Serialize; one context, so is_favorite never queries
+        # (?fields= is not meant for the sections: each renders in full)
+        context = {
+            "request": self.request,
+            FAVORITES_CONTEXT_KEY: frozenset(favorite_ids),
+            SPARSE_FIELDS_CONTEXT_KEY: False,
+        }
+        data: Dict[str, object] = {}
+        if "slider" in include:
+            data["slider"] = SliderSerializer(sliders, many=True, context=context).data
+        if "businesses" in include:
+            data["businesses"] = BusinessSerializer(all_businesses, many=True, context=context).data
+        if "favorites" in include:
+            favorites = [businesses[pk] for pk in favorite_ids if pk in businesses]
+            data["favorites"] = BusinessSerializer(favorites, many=True, context=context).data if self.authenticated else None
+        if "wallet" in include:
+            data["wallet"] = WalletSerializer(wallets, many=True, context=context).data if self.authenticated else None
+        if "dashboard" in include:
+            data["dashboard"] = dashboard(self.request.user, self.customer) if self.authenticated else None
+        if "redeemable_products" in include:
+            data["redeemable_products"] = self._redeemable(products, product_count, wallets)
+
+        return data
+
+    def _redeemable(self, products, count: int, wallets) -> dict:
+        balances = None
+        if self.authenticated:
+            by_business = {w.business_id: w.points_balance for w in wallets}
+            balances = eligibility.Balances(by_business, sum(by_business.values()))
+        items = [eligibility.redeemable_item(self.request, entry) for entry in eligibility.evaluate(products, balances)]
+        result = {
+            "products": items,
+            "pagination": {
+                "count": count,
+                "limit": REDEEMABLE_LIMIT,
+                "offset": 0,
+                "has_next": REDEEMABLE_LIMIT < count,
+            },
+        }
+        if balances is not None:
+            result["total_points"] = balances.total
+        return result
@@ -3,25 +3,30 @@
 این ماژول توابعی برای ذخیره و بازیابی تصاویر در کش دیتابیس فراهم می‌کند
 """
 
-import base64
 from typing import Optional, Tuple
+from django.apps import apps
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
 from django.db import transaction
+from django.db.models import Q
+from . import image_cache_policy, image_store, image_variants, jobs
 from .models import ImageCache, Product, Slider
 
+# نوع job برای کش کردن تصویر در پس‌زمینه (python manage.py run_worker)
+CACHE_IMAGE_JOB = "loyalty.cache_image"
+
 
 class ImageCacheManager:
     """مدیریت کش تصاویر"""
     
-    MAX_BASE64_SIZE = 5 * 1024 * 1024  # 5MB - حداکثر حجم برای ذخیره base64
+    MAX_BLOB_SIZE = 5 * 1024 * 1024  # 5MB - حداکثر حجم برای ذخیره بایت‌های تصویر
     
     @staticmethod
     def cache_image(
         model_instance,
         image_field_name: str = 'image',
-        store_base64: bool = True,
-        max_base64_size: int = None
+        store_data: bool = True,
+        max_size: int = None
     ) -> Optional[ImageCache]:
         """
         کش کردن تصویر یک مدل
@@ -29,8 +34,8 @@ class ImageCacheManager:
         Args:
             model_instance: نمونه مدل (مثلاً Product یا Slider)
             image_field_name: نام فیلد تصویر (پیش‌فرض: 'image')
-            store_base64: آیا تصویر را به صورت base64 ذخیره کنیم؟
-            max_base64_size: حداکثر حجم برای ذخیره base64 (پیش‌فرض: 5MB)
+            store_data: آیا بایت‌های تصویر را (به صورت ImageBlob) ذخیره کنیم؟
+            max_size: حداکثر حجم برای ذخیره بایت‌ها (پیش‌فرض: 5MB)
         
         Returns:
             ImageCache instance یا None در صورت خطا
@@ -67,12 +72,12 @@ class ImageCacheManager:
             except Exception:
                 pass
             
-            # ذخیره base64 (فقط برای تصاویر کوچک)
-            image_data = None
+            # ذخیره بایت‌ها در blob مشترک (فقط برای تصاویر تا max_size)
+            blob = None
             content_type_header = None
             
-            if store_base64:
-                max_size = max_base64_size or ImageCacheManager.MAX_BASE64_SIZE
+            if store_data:
+                max_size = max_size or ImageCacheManager.MAX_BLOB_SIZE
                 try:
                     # خواندن فایل
                     if hasattr(image_field, 'read'):
@@ -81,9 +86,9 @@ class ImageCacheManager:
                         file_size = len(file_data)
                         
                         if file_size <= max_size:
-                            # تبدیل به base64
-                            image_data = base64.b64encode(file_data).decode('utf-8')
                             content_type_header = getattr(image_field, 'content_type', 'image/jpeg')
+                            # تصویر تکراری دوباره ذخیره نمی‌شود (کلید: SHA-256 محتوا)
+                            blob = image_store.put(file_data, content_type_header)
                             
                             # بازگشت به ابتدای فایل
                             image_field.seek(0)
@@ -96,8 +101,9 @@ class ImageCacheManager:
             
             # به‌روزرسانی کش
             cache.image_url = image_url
-            cache.image_data = image_data
-            cache.content_type_header = content_type_header
+            cache.blob = blob
+            cache.content_type_header = content_type_header or ''
+
             if hasattr(image_field, 'size'):
                 cache.file_size = image_field.size
             
@@ -142,10 +148,8 @@ class ImageCacheManager:
             ).first()
             
             if cache:
-                # به‌روزرسانی زمان دسترسی
-                from django.utils import timezone
-                cache.last_accessed = timezone.now()
-                cache.save(update_fields=['last_accessed'])
+                # زمان دسترسی دسته‌ای ذخیره می‌شود (یک UPDATE برای همه، نه یک UPDATE در هر خواندن)
+                image_cache_policy.record(cache.pk)
             
             return cache
             
@@ -206,18 +210,18 @@ class ImageCacheManager:
                 if default_storage.exists(image_field.name):
                     return True
             
-            # بازیابی از base64
-            if cache.image_data:
+            # بازیابی از blob
+            if cache.blob_id:
                 try:
-                    image_bytes = base64.b64decode(cache.image_data)
+                    image_bytes = image_store.read(cache.blob_id)
                     content_file = ContentFile(image_bytes, name=cache.original_path)
                     setattr(model_instance, image_field_name, content_file)
                     model_instance.save(update_fields=[image_field_name])
                     return True
                 except Exception as e:
-                    print(f"خطا در بازیابی از base64: {e}")
+                    print(f"خطا در بازیابی از blob: {e}")
             
-            # اگر base64 نبود، URL را برمی‌گردانیم (نیازی به ذخیره مجدد نیست)
+            # اگر blob نبود، URL را برمی‌گردانیم (نیازی به ذخیره مجدد نیست)
             return False
             
         except Exception as e:
@@ -237,5 +241,51 @@ class ImageCacheManager:
         
         cutoff_date = timezone.now() - timedelta(days=days)
         deleted_count = ImageCache.objects.filter(last_accessed__lt=cutoff_date).delete()[0]
+        image_store.collect_garbage()
         return deleted_count
 
+    @staticmethod
+    def enqueue(model_instance, image_field_name: str = 'image') -> bool:
+        """
+        صف کردن کش تصویر برای worker (به جای کش کردن در همان درخواست)
+
+        اگر این فایل قبلاً کش شده باشد یا job آن در صف باشد، کاری انجام نمی‌شود.
+
+        Returns:
+            True اگر job جدید ساخته شد
+        """
+        image_field = getattr(model_instance, image_field_name, None)
+        if not image_field:
+            return False
+        content_type = f"{model_instance._meta.app_label}.{model_instance._meta.model_name}"
+        cached = ImageCache.objects.filter(
+            Q(blob__isnull=False) | Q(image_url__isnull=False),
+            content_type=content_type, object_id=model_instance.pk, original_path=image_field.name,
+        ).exists()
+        if cached:
+            return False
+        return queue_cache_job(content_type, model_instance.pk, image_field_name)
+
+
+def queue_cache_job(content_type: str, object_id: int, image_field_name: str = 'image') -> bool:
+    """صف کردن job کش تصویر یک شیء (اگر job آن در صف نباشد)؛ True اگر job جدید ساخته شد"""
+    return jobs.enqueue(
+        CACHE_IMAGE_JOB,
+        f"{content_type}:{object_id}",
+        {"content_type": content_type, "object_id": object_id, "field": image_field_name},
+    )
+
+
+@jobs.handler(CACHE_IMAGE_JOB)
+def run_cache_image_job(payload: dict) -> None:
+    """کش کردن تصویر و ساخت نسخه‌های کوچک آن (در worker)؛ خطا باعث تلاش مجدد می‌شود"""
+    model = apps.get_model(payload["content_type"])
+    field_name = payload.get("field", "image")
+    instance = model.objects.filter(pk=payload["object_id"]).first()
+    if instance is None or not getattr(instance, field_name):
+        # در این فاصله حذف شده یا تصویرش برداشته شده
+        return
+    cache = ImageCacheManager.cache_image(instance, image_field_name=field_name)
+    if cache is None:
+        raise RuntimeError(f"Image of {payload['content_type']}#{payload['object_id']} could not be cached")
+    image_variants.generate(cache.blob_id)
@@ -0,0 +1,207 @@
+"""
+Access tracking and the size budget of the image cache.
+
+Reads no longer write: ``record()`` notes the ImageCache row (or blob) in an
+in-process map, and at most every ``settings.IMAGE_ACCESS_FLUSH_INTERVAL``
+seconds the next read stores all of them with one bulk ``UPDATE`` of
+``last_accessed`` (also at process exit). ``last_accessed`` is therefore exact
+to that interval, which is plenty for eviction.
+
+``evict()`` keeps the bytes of all blobs (originals and their WebP
+renditions) under ``settings.IMAGE_CACHE_MAX_BYTES`` (0: no budget). Bytes belong to blobs, and
+a blob is shared by every row with the same content, so it is scored as a whole:
+idle time since its most recent access times its size with renditions, highest
+first. A large picture nobody looked at for a week goes before a small one idle
+for a month. Blobs accessed within ``IMAGE_CACHE_EVICT_MIN_IDLE_HOURS`` are
+never evicted, and neither are blobs whose original file is gone from the
+storage (e.g. ``MEDIA_ROOT`` wiped by a deploy): the cache holds the only copy.
+Evicting deletes the ImageCache rows of the blob and then the now unreferenced
+blobs; the next ``/media-cache/`` request for the image redirects to the
+storage URL and queues a job that caches it again.
+Run by ``python manage.py evict_image_cache``, which prints the result; the
+current size against the budget is in ``image-cache/status/``.
+"""
+
+from __future__ import annotations
+
+import atexit
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import DatabaseError
+from django.db.models import Count, Max, Min, Q, Sum
+from django.utils import timezone
+
+from . import image_store
+from .models import ImageBlob, ImageCache, ImageVariant
+
+# Rows deleted per statement while evicting
+DELETE_BATCH = 500
+
+_lock = threading.Lock()
+_caches: Dict[int, int] = {}
+_blobs: Dict[str, int] = {}
+_flushed_at = time.monotonic()
+
+
+def _flush_interval() -> float:
+    return float(getattr(settings, "IMAGE_ACCESS_FLUSH_INTERVAL", 30.0))
+
+
+def max_bytes() -> int:
+    return int(getattr(settings, "IMAGE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+def min_idle() -> timedelta:
+    return timedelta(hours=float(getattr(settings, "IMAGE_CACHE_EVICT_MIN_IDLE_HOURS", 24)))
+
+
+def record(cache_id: Optional[int] = None, blob: Optional[str] = None) -> None:
+    """Note a read of an ImageCache row (or of every row of a blob); flushed in batches."""
+    with _lock:
+        if cache_id is not None:
+            _caches[cache_id] = _caches.get(cache_id, 0) + 1
+        if blob is not None:
+            _blobs[blob] = _blobs.get(blob, 0) + 1
+        due = time.monotonic() - _flushed_at >= _flush_interval()
+    if due:
+        flush()
+
+
+def pending() -> int:
+    """Reads recorded in this process and not written yet."""
+    with _lock:
+        return sum(_caches.values()) + sum(_blobs.values())
+
+
+def flush() -> int:
+    """Write the recorded reads with one UPDATE; returns the rows updated."""
+    global _flushed_at
+    with _lock:
+        cache_ids, blobs = list(_caches), list(_blobs)
+        _caches.clear()
+        _blobs.clear()
+        _flushed_at = time.monotonic()
+    if not cache_ids and not blobs:
+        return 0
+    condition = Q(pk__in=cache_ids) if cache_ids else Q()
+    if blobs:
+        condition |= Q(blob_id__in=blobs)
+    try:
+        return ImageCache.objects.filter(condition).update(last_accessed=timezone.now())
+    except DatabaseError:
+        # Access times are a hint for eviction: losing one batch is harmless
+        return 0
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        pass
+
+
+atexit.register(_flush_at_exit)
+
+
+def stored_bytes() -> int:
+    return ImageBlob.objects.aggregate(total=Sum("size"))["total"] or 0
+
+
+def stats() -> dict:
+    """Size of the cache against its budget, for ``image-cache/status/``."""
+    blobs = ImageBlob.objects.aggregate(count=Count("pk"), total=Sum("size"))
+    renditions = ImageBlob.objects.filter(pk__in=ImageVariant.objects.values("blob_id")).aggregate(
+        count=Count("pk"), total=Sum("size")
+    )
+    rows = ImageCache.objects.filter(blob__isnull=False).aggregate(
+        count=Count("pk"), oldest=Min("last_accessed"), newest=Max("last_accessed")
+    )
+    total, budget = blobs["total"] or 0, max_bytes()
+    return {
+        "stored_bytes": total,
+        "budget_bytes": budget,
+        "usage_percent": round(100.0 * total / budget, 1) if budget else None,
+        "blobs": blobs["count"],
+        "rendition_blobs": renditions["count"],
+        "rendition_bytes": renditions["total"] or 0,
+        "rows_with_blob": rows["count"],
+        "oldest_access": rows["oldest"],
+        "newest_access": rows["newest"],
+        "pending_accesses": pending(),
+    }
+
+
+def _originals_exist(sha256: str) -> bool:
+    """Whether every file cached in blob ``sha256`` can still be read from the storage."""
+    paths = ImageCache.objects.filter(blob_id=sha256).values_list("original_path", flat=True).distinct()
+    try:
+        return all(default_storage.exists(path) for path in paths)
+    except Exception:
+        # Unknown counts as gone: keeping an image is the safe side
+        return False
+
+
+def evict(budget: Optional[int] = None, idle: Optional[timedelta] = None, dry_run: bool = False) -> dict:
+    """Evict the highest scoring blobs until the cache fits ``budget`` bytes."""
+    budget = max_bytes() if budget is None else budget
+    idle = min_idle() if idle is None else idle
+    now = timezone.now()
+    flush()
+    if not dry_run:
+        # Unreferenced blobs first: they cost nothing to drop
+        image_store.collect_garbage()
+    before = stored_bytes()
+
+    candidates = []
+    if 0 < budget < before:
+        rendition_bytes: Dict[str, int] = {}
+        for source, size in ImageVariant.objects.values_list("source_id", "blob__size"):
+            rendition_bytes[source] = rendition_bytes.get(source, 0) + size
+        blobs = (
+            ImageCache.objects.filter(blob__isnull=False)
+            .values("blob_id", "blob__size")
+            .annotate(last=Max("last_accessed"), rows=Count("pk"))
+            .values_list("blob_id", "last", "rows", "blob__size")
+        )
+        for sha256, last, rows, size in blobs:
+            idle_for = now - last
+            if idle_for < idle:
+                continue
+            freed = size + rendition_bytes.get(sha256, 0)
+            candidates.append((idle_for.total_seconds() * freed, sha256, freed, rows))
+        candidates.sort(reverse=True)
+
+    chosen, freed, rows, only_copies = [], 0, 0, 0
+    for _, sha256, size, count in candidates:
+        if before - freed <= budget:
+            break
+        if not _originals_exist(sha256):
+            only_copies += 1
+            continue
+        chosen.append(sha256)
+        freed += size
+        rows += count
+
+    if not dry_run:
+        for start in range(0, len(chosen), DELETE_BATCH):
+            batch = chosen[start:start + DELETE_BATCH]
+            ImageCache.objects.filter(blob_id__in=batch).delete()
+            image_store.collect_garbage(batch)
+    after = before - freed if dry_run else stored_bytes()
+
+    return {
+        "at": now.isoformat(),
+        "dry_run": dry_run,
+        "budget_bytes": budget,
+        "before_bytes": before,
+        "after_bytes": after,
+        "evicted_images": len(chosen),
+        "evicted_rows": rows,
+        "kept_without_original": only_copies,
+        "over_budget": 0 < budget < after,
+    }
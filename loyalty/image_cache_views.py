@@ -11,6 +11,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.db.models import Count, Q
 from .models import ImageCache, Product, Slider
+from . import image_cache_policy
 from .image_cache import ImageCacheManager
 
 
@@ -24,7 +25,7 @@ def cache_status_view(request):
         # آمار کلی
         total_cache = ImageCache.objects.count()
         cache_with_data = ImageCache.objects.filter(
-            Q(image_data__isnull=False) | Q(image_url__isnull=False)
+            Q(blob__isnull=False) | Q(image_url__isnull=False)
         ).count()
         
         # آمار بر اساس نوع مدل
@@ -52,7 +53,8 @@ def cache_status_view(request):
                 'sliders': {
                     'cached': sliders_cache,
                     'without_cache': max(0, sliders_without_cache)
-                }
+                },
+                'storage': image_cache_policy.stats()
             }
         })
     except Exception as e:
@@ -91,7 +93,7 @@ def api_cache_status(request):
     try:
         total_cache = ImageCache.objects.count()
         cache_with_data = ImageCache.objects.filter(
-            Q(image_data__isnull=False) | Q(image_url__isnull=False)
+            Q(blob__isnull=False) | Q(image_url__isnull=False)
         ).count()
         
         products_cache = ImageCache.objects.filter(content_type='loyalty.product').count()
@@ -101,7 +103,8 @@ def api_cache_status(request):
             'total_cached': total_cache,
             'cache_with_data': cache_with_data,
             'products_cached': products_cache,
-            'sliders_cached': sliders_cache
+            'sliders_cached': sliders_cache,
+            'storage': image_cache_policy.stats()
         })
     except Exception as e:
         return Response({
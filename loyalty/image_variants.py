@@ -0,0 +1,128 @@
+"""
+Resized WebP renditions of product and slider images.
+
+Partners upload multi-megabyte phone photos; a menu list only needs an 80 px
+thumbnail. Every cached image blob gets one rendition per ``VARIANTS`` width
+(never upscaled): EXIF orientation is applied, then all metadata is dropped and
+the result is encoded as WebP. Renditions are blobs themselves (content
+addressed, served by ``/media-cache/``) and tracked as ``ImageVariant`` rows of
+their source blob, so products sharing a picture share its renditions too.
+
+``render()`` is pure Pillow work (bytes in, bytes out) so the backfill command
+(``python manage.py build_image_variants``) can run it in a process pool;
+``store()`` writes the results; ``generate()`` does both for one blob and runs
+in the background job that caches an uploaded image (``loyalty.image_cache``).
+
+API responses pick a rendition with ``?img=thumb|card|full``, or get all of
+them with ``?img=srcset`` (see ``media_cache.image_url``).
+"""
+
+from __future__ import annotations
+
+import io
+import math
+from typing import Dict, List, NamedTuple, Optional
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from . import image_store
+from .models import ImageBlob, ImageVariant
+
+# Name -> width in pixels (2x the largest size the app shows them at)
+VARIANTS: Dict[str, int] = {"thumb": 160, "card": 480, "full": 1280}
+# ``?img=`` value that returns every rendition (and the original)
+SRCSET = "srcset"
+ORIGINAL = "original"
+WEBP_QUALITY = 80
+# 0 (fastest) .. 6 (smallest); 4 is Pillow's default trade-off
+WEBP_METHOD = 4
+# EXIF orientations that swap width and height
+_TRANSPOSED = {5, 6, 7, 8}
+
+
+class Rendition(NamedTuple):
+    name: str
+    width: int
+    height: int
+    data: bytes
+
+
+def render(data: bytes) -> List[Rendition]:
+    """Every rendition of the image ``data``; [] if it is not an image Pillow reads."""
+    try:
+        image = Image.open(io.BytesIO(data))
+        # JPEG decodes straight at 1/2, 1/4 or 1/8 scale when the largest rendition allows
+        width, height = image.size
+        shown_width = height if image.getexif().get(0x0112, 1) in _TRANSPOSED else width
+        scale = min(1.0, max(VARIANTS.values()) / shown_width)
+        if scale < 1.0:
+            image.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except (UnidentifiedImageError, OSError, ValueError, Image.DecompressionBombError):
+        return []
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    renditions = []
+    # Largest first: each rendition is resized from the previous, smaller, one
+    for name, target in sorted(VARIANTS.items(), key=lambda item: -item[1]):
+        if image.width > target:
+            image = image.resize((target, max(1, round(image.height * target / image.width))), Image.LANCZOS)
+        out = io.BytesIO()
+        # No exif= / icc_profile= arguments: the metadata is not written
+        image.save(out, "WEBP", quality=WEBP_QUALITY, method=WEBP_METHOD)
+        renditions.append(Rendition(name, image.width, image.height, out.getvalue()))
+    return renditions
+
+
+def store(source: str, renditions: List[Rendition]) -> int:
+    """Save ``renditions`` of blob ``source``; returns how many were new."""
+    created = 0
+    try:
+        with transaction.atomic():
+            for rendition in renditions:
+                blob = image_store.put(rendition.data, "image/webp")
+                _, new = ImageVariant.objects.update_or_create(
+                    source_id=source, name=rendition.name,
+                    defaults={"blob": blob, "width": rendition.width, "height": rendition.height},
+                )
+                created += new
+    except IntegrityError:
+        # The source blob was deleted meanwhile, or another process stored the same renditions
+        return 0
+    return created
+
+
+def missing(source: str) -> bool:
+    return ImageVariant.objects.filter(source_id=source).count() < len(VARIANTS)
+
+
+def generate(source: Optional[str], force: bool = False) -> int:
+    """Render and store the renditions of one blob unless it has them all."""
+    if not source or (not force and not missing(source)):
+        return 0
+    data = image_store.read(source)
+    if data is None:
+        return 0
+    return store(source, render(data))
+
+
+def pending_sources(force: bool = False):
+    """Blobs of cached images that lack renditions (every cached image with ``force``)."""
+    sources = ImageBlob.objects.filter(caches__isnull=False).distinct()
+    if not force:
+        sources = sources.exclude(pk__in=_complete_sources())
+    return sources.order_by("pk").values_list("pk", flat=True)
+
+
+def _complete_sources():
+    return (
+        ImageVariant.objects.values("source_id")
+        .annotate(n=Count("id"))
+        .filter(n__gte=len(VARIANTS))
+        .values("source_id")
+    )
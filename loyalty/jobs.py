@@ -0,0 +1,225 @@
+"""
+Database-backed background jobs, run by ``python manage.py run_worker``.
+
+Work that does not have to finish inside the request (caching an uploaded image,
+rendering its thumbnails) is queued as a ``BackgroundJob`` row instead::
+
+    jobs.enqueue("loyalty.cache_image", "loyalty.product:12", {...})
+
+and done by a function registered for its kind with ``@jobs.handler(kind)``.
+Enqueueing is one insert in the caller's transaction, so a job exists exactly
+when the change that needs it was committed. There is at most one *pending* job
+per (kind, key): queueing the same work again before a worker picks it up is a
+no-op, while a change made during a run queues a new job that runs after it.
+
+A worker claims a job with a conditional ``UPDATE`` (pending -> running), which
+is safe with any number of workers on SQLite and PostgreSQL alike. A failing job
+is retried after ``JOB_RETRY_DELAY`` seconds, doubling each time, until
+``JOB_MAX_ATTEMPTS``; a job whose worker died is retried once it has been
+running for ``JOB_LOCK_TIMEOUT`` seconds. The outcome of a run is only recorded
+while its worker still holds the job, so a worker that was merely slow cannot
+overwrite the state of a job released and claimed again elsewhere. Finished
+jobs are deleted after ``JOB_KEEP_DAYS`` days.
+"""
+
+from __future__ import annotations
+
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import BackgroundJob
+
+Status = BackgroundJob.Status
+
+HANDLERS: Dict[str, Callable[[dict], None]] = {}
+# Most candidates one claim attempt looks at
+CLAIM_BATCH = 10
+MAX_RETRY_DELAY = 3600
+
+
+def handler(kind: str):
+    """Register the function that runs jobs of ``kind``; it gets the job payload."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def _setting(name: str, default):
+    return type(default)(getattr(settings, name, default))
+
+
+def enqueue(kind: str, key: str, payload: Optional[dict] = None, delay: float = 0) -> bool:
+    """Queue a job unless one for (kind, key) is already pending; True if queued."""
+    try:
+        with transaction.atomic():
+            BackgroundJob.objects.create(
+                kind=kind, key=key, payload=payload or {}, run_after=timezone.now() + timedelta(seconds=delay)
+            )
+    except IntegrityError:
+        return False
+    return True
+
+
+def claim(worker: str) -> Optional[BackgroundJob]:
+    """The next due pending job, marked running by ``worker``; None if there is none."""
+    now = timezone.now()
+    candidates = list(
+        BackgroundJob.objects.filter(status=Status.PENDING, run_after__lte=now)
+        .order_by("run_after", "pk")
+        .values_list("pk", flat=True)[:CLAIM_BATCH]
+    )
+    for pk in candidates:
+        # Another worker may have taken it since: only one UPDATE matches
+        claimed = BackgroundJob.objects.filter(pk=pk, status=Status.PENDING).update(
+            status=Status.RUNNING, locked_by=worker, locked_at=now, attempts=F("attempts") + 1
+        )
+        if claimed:
+            return BackgroundJob.objects.get(pk=pk)
+    return None
+
+
+def _held(job: BackgroundJob, worker: str):
+    """The row of ``job`` while ``worker`` still has it running (not released and claimed again)."""
+    return BackgroundJob.objects.filter(pk=job.pk, status=Status.RUNNING, locked_by=worker)
+
+
+def run(job: BackgroundJob, worker: str) -> bool:
+    """Run a job claimed by ``worker`` and record the outcome; True if it succeeded."""
+    try:
+        func = HANDLERS.get(job.kind)
+        if func is None:
+            raise LookupError(f"No handler for job kind {job.kind!r}")
+        func(job.payload)
+    except Exception as e:
+        fail(job, "".join(traceback.format_exception(type(e), e, e.__traceback__))[-4000:], worker)
+        return False
+    _held(job, worker).update(status=Status.DONE, finished_at=timezone.now(), last_error="")
+    return True
+
+
+def fail(job: BackgroundJob, error: str, worker: str) -> None:
+    """Schedule a retry of ``job`` with backoff, or mark it failed after its last attempt."""
+    now = timezone.now()
+    if job.attempts >= _setting("JOB_MAX_ATTEMPTS", 5):
+        _held(job, worker).update(status=Status.FAILED, finished_at=now, last_error=error)
+        return
+    delay = min(_setting("JOB_RETRY_DELAY", 30.0) * 2 ** max(job.attempts - 1, 0), MAX_RETRY_DELAY)
+    requeue(job, worker=worker, run_after=now + timedelta(seconds=delay), last_error=error)
+
+
+def requeue(job: BackgroundJob, worker: Optional[str] = None, **fields) -> None:
+    """Make ``job`` pending again; with ``worker``, only while that worker has it running."""
+    rows = BackgroundJob.objects.filter(pk=job.pk) if worker is None else _held(job, worker)
+    try:
+        with transaction.atomic():
+            rows.update(status=Status.PENDING, locked_by="", locked_at=None, **fields)
+    except IntegrityError:
+        # A newer pending job for the same key will do the work
+        rows.update(status=Status.DONE, finished_at=timezone.now(), last_error="Superseded by a newer job")
+
+
+def release_stale() -> int:
+    """Retry (or fail) jobs still running after ``JOB_LOCK_TIMEOUT``: their worker died."""
+    timeout = _setting("JOB_LOCK_TIMEOUT", 600.0)
+    stale = list(BackgroundJob.objects.filter(
+        status=Status.RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=timeout)
+    ))
+    for job in stale:
+        # Skipped if the worker finished it meanwhile
+        fail(job, f"Worker {job.locked_by} did not finish the job within {timeout:.0f} s", job.locked_by)
+    return len(stale)
+
+
+def purge() -> int:
+    """Delete jobs that finished more than ``JOB_KEEP_DAYS`` days ago."""
+    cutoff = timezone.now() - timedelta(days=_setting("JOB_KEEP_DAYS", 7.0))
+    return BackgroundJob.objects.filter(status__in=[Status.DONE, Status.FAILED], finished_at__lt=cutoff).delete()[0]
+
+
+class Worker:
+    """
+    ``concurrency`` threads that claim and run jobs until ``stop`` is set (or,
+    with ``burst``, until no job is due). Each thread has its own database
+    connection.
+    """
+
+    def __init__(self, concurrency: int = 1, poll_interval: float = 2.0, burst: bool = False,
+                 max_jobs: Optional[int] = None, log: Callable[[str], None] = print):
+        self.concurrency = max(1, concurrency)
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.max_jobs = max_jobs
+        self.log = log
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.stop = threading.Event()
+        self.succeeded = self.failed = 0
+        self._count_lock = threading.Lock()
+
+    def run(self) -> None:
+        threads = [
+            threading.Thread(target=self._loop, args=(f"{self.name}:{i}",), name=f"job-worker-{i}", daemon=True)
+            for i in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        # Housekeeping in the main thread while the workers run
+        housekeeping_interval = max(self.poll_interval, min(60.0, _setting("JOB_LOCK_TIMEOUT", 600.0) / 2))
+        next_housekeeping = 0.0
+        try:
+            while True:
+                alive = [thread for thread in threads if thread.is_alive()]
+                if not alive:
+                    break
+                if time.monotonic() >= next_housekeeping:
+                    released = release_stale()
+                    if released:
+                        self.log(f"{released} stale jobs released")
+                    purge()
+                    next_housekeeping = time.monotonic() + housekeeping_interval
+                alive[0].join(timeout=0.5)
+        finally:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+            connections.close_all()
+
+    def _loop(self, worker: str) -> None:
+        try:
+            while not self.stop.is_set():
+                try:
+                    job = claim(worker)
+                except DatabaseError as e:
+                    # e.g. the database restarted: reconnect on the next attempt
+                    self.log(f"{worker}: could not claim a job: {e}")
+                    connections.close_all()
+                    self.stop.wait(self.poll_interval)
+                    continue
+                if job is None:
+                    if self.burst:
+                        return
+                    self.stop.wait(self.poll_interval)
+                    continue
+                ok = run(job, worker)
+                with self._count_lock:
+                    if ok:
+                        self.succeeded += 1
+                    else:
+                        self.failed += 1
+                    done = self.succeeded + self.failed
+                if not ok:
+                    self.log(f"job {job.pk} ({job.kind} {job.key}) failed, attempt {job.attempts}")
+                if self.max_jobs is not None and done >= self.max_jobs:
+                    self.stop.set()
+        finally:
+            connections.close_all()
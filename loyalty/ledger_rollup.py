@@ -0,0 +1,189 @@
+"""
+Monthly rollups (and optional archival) of the points ledgers.
+
+``loyalty.Transaction`` and ``rewards.PointsTransaction`` only grow. ``roll_up()``
+aggregates every closed month into ``LedgerMonth`` (wallet, month, earned,
+redeemed, count) and moves the ledger's ``LedgerRollupCheckpoint`` to the start
+of the current month. ``totals()`` then answers "earned / redeemed / count / last
+activity" as rollups before the checkpoint plus live rows after it, so its cost
+depends on the months of activity rather than on the number of transactions.
+
+``archive()`` moves live rows that are already rolled up and older than a
+horizon into ``TransactionArchive`` / ``PointsTransactionArchive``; the totals
+do not change. Run both with ``python manage.py rollup_ledgers``.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Count, DateField, Max, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import LedgerMonth, LedgerRollupCheckpoint
+from .points_engine import LOYALTY_LEDGER, REWARDS_LEDGER
+
+# ledger -> (live model, amount field, archive model)
+LEDGERS = {
+    LOYALTY_LEDGER: ("loyalty.Transaction", "amount", "loyalty.TransactionArchive"),
+    REWARDS_LEDGER: ("rewards.PointsTransaction", "points", "rewards.PointsTransactionArchive"),
+}
+
+BATCH_SIZE = 2000
+
+
+class LedgerTotals(NamedTuple):
+    earned: int = 0
+    redeemed: int = 0  # positive
+    count: int = 0
+    last_at: Optional[datetime] = None
+
+    def __add__(self, other: "LedgerTotals") -> "LedgerTotals":
+        last = [at for at in (self.last_at, other.last_at) if at is not None]
+        return LedgerTotals(
+            self.earned + other.earned,
+            self.redeemed + other.redeemed,
+            self.count + other.count,
+            max(last) if last else None,
+        )
+
+
+def ledger_models(ledger: str):
+    """``(live model, amount field, archive model)`` of ``ledger``."""
+    live, field, archive = LEDGERS[ledger]
+    return apps.get_model(live), field, apps.get_model(archive)
+
+
+def month_start(at: datetime) -> datetime:
+    """Start of ``at``'s month in the current time zone (the month boundaries TruncMonth uses)."""
+    return timezone.localtime(at).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(start: datetime, months: int) -> datetime:
+    """``start`` (a month start) shifted by ``months``, which may be negative."""
+    index = start.year * 12 + start.month - 1 + months
+    naive = start.replace(tzinfo=None, year=index // 12, month=index % 12 + 1)
+    return timezone.make_aware(naive, start.tzinfo)
+
+
+def checkpoint(ledger: str) -> Optional[datetime]:
+    return LedgerRollupCheckpoint.objects.filter(ledger=ledger).values_list("rolled_until", flat=True).first()
+
+
+def totals(ledger: str, group_by: str = "wallet_id", **filters) -> Dict[int, LedgerTotals]:
+    """
+    ``{group key: LedgerTotals}`` over the whole history of ``ledger``.
+
+    ``group_by`` and ``filters`` are expressed relative to the ledger row, e.g.
+    ``totals(REWARDS_LEDGER, "wallet__customer_id", wallet__business=business)``;
+    both the live table and LedgerMonth have a ``wallet`` foreign key.
+    """
+    model, field, _ = ledger_models(ledger)
+    result: Dict[int, LedgerTotals] = {}
+
+    live = model.objects.filter(**filters)
+    until = checkpoint(ledger)
+    if until is not None:
+        rolled = (
+            LedgerMonth.objects.filter(ledger=ledger, **filters)
+            .values(group_by)
+            .annotate(earned=Sum("earned"), redeemed=Sum("redeemed"), rows=Sum("count"), last=Max("last_at"))
+            .order_by()
+        )
+        for row in rolled:
+            result[row[group_by]] = LedgerTotals(row["earned"] or 0, row["redeemed"] or 0, row["rows"] or 0, row["last"])
+        live = live.filter(created_at__gte=until)
+
+    rows = (
+        live.values(group_by)
+        .annotate(
+            earned=Sum(field, filter=Q(**{f"{field}__gt": 0})),
+            redeemed=Sum(field, filter=Q(**{f"{field}__lt": 0})),
+            rows=Count("id"),
+            last=Max("created_at"),
+        )
+        .order_by()
+    )
+    for row in rows:
+        current = LedgerTotals(row["earned"] or 0, abs(row["redeemed"] or 0), row["rows"], row["last"])
+        key = row[group_by]
+        result[key] = result[key] + current if key in result else current
+    return result
+
+
+def roll_up(ledger: str, now: Optional[datetime] = None) -> int:
+    """
+    Aggregate every closed month after the checkpoint into LedgerMonth and advance
+    the checkpoint to the start of the current month. Returns the rows written.
+    """
+    model, field, _ = ledger_models(ledger)
+    until = month_start(now or timezone.now())
+    with transaction.atomic():
+        state = LedgerRollupCheckpoint.objects.select_for_update().filter(ledger=ledger).first()
+        if state is not None and state.rolled_until >= until:
+            return 0
+
+        live = model.objects.filter(created_at__lt=until)
+        if state is not None:
+            live = live.filter(created_at__gte=state.rolled_until)
+        rows = (
+            live.annotate(month=TruncMonth("created_at", output_field=DateField()))
+            .values("wallet_id", "month")
+            .annotate(
+                earned=Sum(field, filter=Q(**{f"{field}__gt": 0})),
+                redeemed=Sum(field, filter=Q(**{f"{field}__lt": 0})),
+                rows=Count("id"),
+                last=Max("created_at"),
+            )
+            .order_by()
+        )
+        # Months before the checkpoint are never rolled up twice, so these are all new rows
+        written = 0
+        batch = []
+        for row in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append(LedgerMonth(
+                wallet_id=row["wallet_id"],
+                ledger=ledger,
+                month=row["month"],
+                earned=row["earned"] or 0,
+                redeemed=abs(row["redeemed"] or 0),
+                count=row["rows"],
+                last_at=row["last"],
+            ))
+            if len(batch) >= BATCH_SIZE:
+                LedgerMonth.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        LedgerMonth.objects.bulk_create(batch)
+        written += len(batch)
+
+        LedgerRollupCheckpoint.objects.update_or_create(ledger=ledger, defaults={"rolled_until": until})
+    return written
+
+
+def archive(ledger: str, before: datetime, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Move live rows created before ``before`` (and before the checkpoint, i.e.
+    already rolled up) to the archive table. Returns the number of rows moved.
+    """
+    model, _, archive_model = ledger_models(ledger)
+    until = checkpoint(ledger)
+    if until is None:
+        return 0
+    cutoff = min(before, until)
+    columns = [f.attname for f in model._meta.concrete_fields]
+
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(model.objects.filter(created_at__lt=cutoff).order_by("id").values(*columns)[:batch_size])
+            if not rows:
+                break
+            archive_model.objects.bulk_create([archive_model(**row) for row in rows])
+            model.objects.filter(id__in=[row["id"] for row in rows]).delete()
+        moved += len(rows)
+    return moved
@@ -0,0 +1,75 @@
+"""
+Create the WebP renditions (thumb / card / full) of cached images that lack them.
+
+New uploads get their renditions right after they are cached; this backfills
+images cached before that, or all of them again with ``--force`` (e.g. after
+changing ``image_variants.VARIANTS``). Resizing runs in a pool of
+``--workers`` processes; this process reads the source bytes, hands them to the
+pool and stores the results, so only it talks to the database.
+
+Usage:
+    python manage.py build_image_variants
+    python manage.py build_image_variants --workers 4 --limit 500
+    python manage.py build_image_variants --force
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from loyalty import image_store, image_variants
+
+
+class Command(BaseCommand):
+    help = "Render missing WebP renditions of cached product and slider images"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Resizing processes")
+        parser.add_argument("--limit", type=int, default=None, help="Process at most this many images")
+        parser.add_argument("--force", action="store_true", help="Render every cached image again")
+
+    def handle(self, *args, **options):
+        sources = list(image_variants.pending_sources(force=options["force"]))
+        if options["limit"] is not None:
+            sources = sources[:options["limit"]]
+        if not sources:
+            self.stdout.write("Every cached image has its renditions")
+            return
+        workers = max(1, options["workers"])
+        self.stdout.write(f"Rendering {len(sources)} images with {workers} processes")
+
+        # Forked workers must not inherit this process's database connections
+        connections.close_all()
+        started = time.monotonic()
+        done = created = failed = source_bytes = rendered_bytes = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # A few images per worker in flight: memory stays bounded by the batch
+            batch_size = workers * 2
+            for offset in range(0, len(sources), batch_size):
+                batch = [(sha256, image_store.read(sha256)) for sha256 in sources[offset:offset + batch_size]]
+                batch = [(sha256, data) for sha256, data in batch if data is not None]
+                for (sha256, data), renditions in zip(batch, pool.map(image_variants.render, [d for _, d in batch])):
+                    done += 1
+                    if not renditions:
+                        failed += 1
+                        continue
+                    created += image_variants.store(sha256, renditions)
+                    source_bytes += len(data)
+                    rendered_bytes += sum(len(r.data) for r in renditions if r.name == "thumb")
+                self.stdout.write(f"  {done}/{len(sources)}")
+
+        if options["force"]:
+            # Renditions replaced by new ones
+            image_store.collect_garbage()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"{done} images in {elapsed:.1f} s ({done / elapsed:.1f}/s): {created} renditions created, "
+            f"{failed} not readable as images"
+        ))
+        if source_bytes:
+            self.stdout.write(
+                f"originals {source_bytes / 1e6:.1f} MB, thumbnails {rendered_bytes / 1e3:.1f} kB "
+                f"({rendered_bytes / source_bytes:.2%} of the bytes a list screen downloaded before)"
+            )
@@ -0,0 +1,53 @@
+"""
+Keep the database image cache within its size budget (loyalty.image_cache_policy).
+
+Evicts the least recently used images, weighted by size, until the stored
+blobs fit ``--max-mb`` (default ``settings.IMAGE_CACHE_MAX_BYTES``). Images read
+within ``--min-idle-hours``, and images whose original file is no longer in the
+storage, are kept even over budget. Run it daily, e.g. from the Scalingo
+scheduler or after ``run_worker --burst``.
+
+Usage:
+    python manage.py evict_image_cache
+    python manage.py evict_image_cache --dry-run
+    python manage.py evict_image_cache --max-mb 128 --min-idle-hours 72
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from loyalty import image_cache_policy
+
+
+def _mb(value: int) -> str:
+    return f"{value / (1024 * 1024):.1f} MB"
+
+
+class Command(BaseCommand):
+    help = "Evict least recently used images from the database image cache until it fits its budget"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-mb", type=float, default=None, help="Budget in MB (0: no budget)")
+        parser.add_argument("--min-idle-hours", type=float, default=None, help="Keep images read this recently")
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be evicted")
+
+    def handle(self, *args, **options):
+        budget = int(options["max_mb"] * 1024 * 1024) if options["max_mb"] is not None else None
+        idle = timedelta(hours=options["min_idle_hours"]) if options["min_idle_hours"] is not None else None
+        result = image_cache_policy.evict(budget, idle, dry_run=options["dry_run"])
+
+        verb = "would evict" if result["dry_run"] else "evicted"
+        self.stdout.write(
+            f"{_mb(result['before_bytes'])} stored, budget {_mb(result['budget_bytes'])}: {verb} "
+            f"{result['evicted_images']} images ({result['evicted_rows']} cache rows), "
+            f"{_mb(result['after_bytes'])} left"
+        )
+        if result["kept_without_original"]:
+            self.stdout.write(
+                f"Kept {result['kept_without_original']} images whose original file is gone from the storage"
+            )
+        if result["over_budget"]:
+            self.stdout.write(self.style.WARNING(
+                "Still over budget: the remaining images were read too recently to evict"
+                " or are the only copy left"
+            ))
@@ -0,0 +1,100 @@
+"""
+Set Business.latitude / longitude (and geohash) from a local CSV; no network
+geocoding. The default file, loyalty/fixtures/business_locations.csv, covers
+the addresses of add_fake_businesses.
+
+The CSV needs ``latitude`` and ``longitude`` columns plus one of ``id``,
+``slug`` or ``address`` to find the business (addresses are compared case- and
+whitespace-insensitively and may match several businesses). Businesses that
+already have coordinates are left alone unless --overwrite is given.
+
+Usage:
+    python manage.py geocode_businesses
+    python manage.py geocode_businesses locations.csv --overwrite
+    python manage.py geocode_businesses locations.csv --dry-run
+"""
+import csv
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from loyalty import response_cache
+from loyalty.models import Business
+
+DEFAULT_CSV = Path(__file__).resolve().parents[2] / "fixtures" / "business_locations.csv"
+
+
+def _address_key(address):
+    return " ".join(address.casefold().split())
+
+
+class Command(BaseCommand):
+    help = "Import business coordinates from a CSV file and compute their geohash"
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path", nargs="?", default=str(DEFAULT_CSV))
+        parser.add_argument("--overwrite", action="store_true", help="Replace coordinates that are already set")
+        parser.add_argument("--dry-run", action="store_true", help="Report matches without saving")
+
+    def handle(self, *args, **options):
+        rows = self._read(options["csv_path"])
+        businesses = list(Business.objects.only("id", "slug", "address", "latitude", "longitude", "geohash"))
+        by_id = {b.id: b for b in businesses}
+        by_slug = {b.slug: b for b in businesses if b.slug}
+        by_address = {}
+        for business in businesses:
+            if business.address:
+                by_address.setdefault(_address_key(business.address), []).append(business)
+
+        changed, unmatched, skipped = {}, 0, 0
+        for line, row in rows:
+            if row.get("id"):
+                matches = [by_id[int(row["id"])]] if int(row["id"]) in by_id else []
+            elif row.get("slug"):
+                matches = [by_slug[row["slug"]]] if row["slug"] in by_slug else []
+            else:
+                matches = by_address.get(_address_key(row.get("address") or ""), [])
+            if not matches:
+                unmatched += 1
+                self.stdout.write(self.style.WARNING(f"line {line}: no business for {dict(row)}"))
+                continue
+            for business in matches:
+                if business.latitude is not None and not options["overwrite"]:
+                    skipped += 1
+                    continue
+                business.latitude, business.longitude = row["latitude"], row["longitude"]
+                business.geohash = business.compute_geohash()
+                changed[business.id] = business
+
+        if not options["dry_run"] and changed:
+            with transaction.atomic():
+                # bulk_update sends no signals: drop the cached responses explicitly
+                Business.objects.bulk_update(changed.values(), ["latitude", "longitude", "geohash"], batch_size=500)
+                for business_id in changed:
+                    response_cache.invalidate(business_id)
+
+        verb = "would be geocoded" if options["dry_run"] else "geocoded"
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(changed)} businesses {verb}, {skipped} already had coordinates, {unmatched} CSV rows unmatched"
+        ))
+
+    def _read(self, path):
+        try:
+            with open(path, newline="", encoding="utf-8-sig") as handle:
+                reader = csv.DictReader(handle)
+                missing = {"latitude", "longitude"} - set(reader.fieldnames or ())
+                if missing or not {"id", "slug", "address"} & set(reader.fieldnames or ()):
+                    raise CommandError("The CSV needs latitude, longitude and one of id, slug, address")
+                rows = []
+                for line, row in enumerate(reader, start=2):
+                    try:
+                        row["latitude"], row["longitude"] = float(row["latitude"]), float(row["longitude"])
+                    except (TypeError, ValueError):
+                        raise CommandError(f"line {line}: latitude / longitude must be numbers")
+                    if not (-90 <= row["latitude"] <= 90 and -180 <= row["longitude"] <= 180):
+                        raise CommandError(f"line {line}: coordinates out of range")
+                    rows.append((line, row))
+                return rows
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
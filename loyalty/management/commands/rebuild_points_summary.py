@@ -0,0 +1,65 @@
+"""
+Backfill / reconcile the CustomerPointsSummary read model.
+Usage:
+    python manage.py rebuild_points_summary            # rebuild every customer
+    python manage.py rebuild_points_summary --check    # only report drifted rows
+    python manage.py rebuild_points_summary --customer 12 --customer 15
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from loyalty.models import Customer, CustomerPointsSummary
+from loyalty.points_summary import compute_summaries
+
+FIELDS = ["total_balance", "lifetime_earned", "lifetime_redeemed", "wallet_count", "last_activity_at"]
+
+
+class Command(BaseCommand):
+    help = "Backfill or reconcile CustomerPointsSummary from Wallet and the points ledgers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--customer", type=int, action="append", dest="customers", help="Only rebuild these customer IDs")
+        parser.add_argument("--check", action="store_true", help="Report drift without writing")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        customer_ids = options["customers"] or list(Customer.objects.order_by("id").values_list("id", flat=True))
+        batch_size = max(1, options["batch_size"])
+        check_only = options["check"]
+
+        created = updated = unchanged = 0
+        for start in range(0, len(customer_ids), batch_size):
+            batch = customer_ids[start:start + batch_size]
+            computed = compute_summaries(batch)
+            existing = CustomerPointsSummary.objects.in_bulk(batch)
+
+            to_create, to_update = [], []
+            for customer_id in batch:
+                values = computed.get(customer_id) or {field: 0 for field in FIELDS[:-1]}
+                values.setdefault("last_activity_at", None)
+                row = existing.get(customer_id)
+                if row is None:
+                    to_create.append(CustomerPointsSummary(customer_id=customer_id, **values))
+                    continue
+                drift = {field: (getattr(row, field), values[field]) for field in FIELDS if getattr(row, field) != values[field]}
+                if not drift:
+                    unchanged += 1
+                    continue
+                if check_only:
+                    self.stdout.write(f"customer {customer_id}: " + ", ".join(f"{k} {old} -> {new}" for k, (old, new) in drift.items()))
+                for field, (_, new) in drift.items():
+                    setattr(row, field, new)
+                to_update.append(row)
+
+            created += len(to_create)
+            updated += len(to_update)
+            if check_only:
+                continue
+            with transaction.atomic():
+                CustomerPointsSummary.objects.bulk_create(to_create, ignore_conflicts=True)
+                CustomerPointsSummary.objects.bulk_update(to_update, FIELDS)
+
+        verb = "would be" if check_only else "were"
+        self.stdout.write(self.style.SUCCESS(
+            f"{created} summaries {verb} created, {updated} {verb} corrected, {unchanged} already in sync"
+        ))
@@ -0,0 +1,31 @@
+"""
+Recreate every SearchDocument from Business / Product / Service (see loyalty.search).
+
+The signals keep the documents current for normal saves; run this after bulk
+imports (bulk_create / QuerySet.update send no signals), e.g. add_fake_businesses.
+On SQLite it also rebuilds the FTS5 index itself.
+
+Usage:
+    python manage.py rebuild_search_index
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from loyalty import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search documents"
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            written = search.rebuild()
+            if search.backend() == "sqlite":
+                with connection.cursor() as cursor:
+                    cursor.execute(f"INSERT INTO {search.FTS_TABLE}({search.FTS_TABLE}) VALUES ('rebuild')")
+        self.stdout.write(self.style.SUCCESS(
+            f"{written} search documents written in {time.monotonic() - started:.1f}s ({search.backend()} backend)"
+        ))
@@ -0,0 +1,156 @@
+"""
+Recompute every wallet balance from the points ledgers, report the drift and
+(with --apply) correct it. See loyalty.reconcile.
+
+Businesses are split into shards; each shard is checked with one SQL statement
+and shards run in parallel in a process pool. Finished shards are recorded in a
+state file, so an interrupted run continues with --resume.
+
+Usage:
+    python manage.py reconcile_wallets                          # dry run, report only
+    python manage.py reconcile_wallets --apply
+    python manage.py reconcile_wallets --apply --workers 8 --shard-size 100
+    python manage.py reconcile_wallets --apply --resume         # skip shards already done
+"""
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.utils.dateparse import parse_datetime
+
+from loyalty import reconcile
+from loyalty.models import Business
+
+REPORT_FIELDS = ["wallet_id", "customer_id", "business_id", "stored_balance", "ledger_balance", "difference", "action"]
+
+
+def _init_worker():
+    # Under the "spawn" start method (Windows, macOS) the child starts without Django
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def _run_shard(index, business_ids, apply, checkpoints):
+    try:
+        return index, business_ids, reconcile.reconcile_shard(business_ids, apply, checkpoints)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Reconcile wallet balances with the Transaction / PointsTransaction ledgers"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--apply", action="store_true", help="Write the corrections (default: report only)")
+        parser.add_argument("--shard-size", type=int, default=200, help="Businesses per shard")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Worker processes (default: CPU count; 1 on SQLite)",
+        )
+        parser.add_argument("--report", default="reconcile_wallets_report.csv", help="CSV file with one row per drifted wallet")
+        parser.add_argument("--state", default="reconcile_wallets_state.json", help="Progress file used by --resume")
+        parser.add_argument("--resume", action="store_true", help="Skip shards the state file marks as done")
+
+    def handle(self, *args, **options):
+        apply = options["apply"]
+        shard_size = max(1, options["shard_size"])
+        workers = options["workers"]
+        if workers is None:
+            workers = 1 if connection.vendor == "sqlite" else (os.cpu_count() or 1)
+        workers = max(1, workers)
+        if apply and workers > 1 and connection.vendor == "sqlite":
+            self.stdout.write(self.style.WARNING("SQLite allows a single writer; applying with 1 worker"))
+            workers = 1
+
+        state = self._load_state(options) if options["resume"] else None
+        if state is None:
+            state = {"apply": apply, "checkpoints": None, "done": []}
+        elif state["apply"] != apply:
+            raise CommandError("The state file belongs to a run with a different --apply setting")
+
+        # Every shard uses the same rollup checkpoints, also across a resume
+        current = {
+            ledger: until.isoformat() if until else None
+            for ledger, until in reconcile.current_checkpoints().items()
+        }
+        if state["checkpoints"] is None:
+            state["checkpoints"] = current
+        elif state["checkpoints"] != current:
+            # rollup_ledgers ran in between and may have archived live rows the frozen checkpoints still count
+            raise CommandError(
+                "rollup_ledgers moved the checkpoints since the interrupted run "
+                f"({state['checkpoints']} -> {current}); start again without --resume"
+            )
+        checkpoints = {
+            ledger: (None if until is None else parse_datetime(until)) for ledger, until in state["checkpoints"].items()
+        }
+
+        done = {tuple(r) for r in state["done"]}
+        business_ids = [
+            pk for pk in Business.objects.order_by("pk").values_list("pk", flat=True)
+            if not any(first <= pk <= last for first, last in done)
+        ]
+        shards = [business_ids[i:i + shard_size] for i in range(0, len(business_ids), shard_size)]
+        self.stdout.write(
+            f"{len(business_ids)} businesses in {len(shards)} shards, {workers} worker(s), "
+            f"{'applying corrections' if apply else 'dry run'}"
+        )
+
+        started = time.monotonic()
+        counts = {}
+        report_mode = "a" if options["resume"] and os.path.exists(options["report"]) else "w"
+        with open(options["report"], report_mode, newline="", encoding="utf-8") as report_file:
+            report = csv.writer(report_file)
+            if report_mode == "w":
+                report.writerow(REPORT_FIELDS)
+
+            def finish(index, shard, drift):
+                for d in drift:
+                    report.writerow([*d[:5], d.difference, d.action])
+                    counts[d.action] = counts.get(d.action, 0) + 1
+                report_file.flush()
+                state["done"].append([shard[0], shard[-1]])
+                self._save_state(options, state)
+                self.stdout.write(f"shard {index + 1}/{len(shards)}: {len(drift)} drifted wallets")
+
+            if workers == 1 or len(shards) <= 1:
+                for index, shard in enumerate(shards):
+                    finish(*_run_shard(index, shard, apply, checkpoints))
+            else:
+                # Children must not share the parent's database connection
+                connections.close_all()
+                with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                    futures = [pool.submit(_run_shard, i, shard, apply, checkpoints) for i, shard in enumerate(shards)]
+                    for future in as_completed(futures):
+                        finish(*future.result())
+
+        summary = ", ".join(f"{action}: {n}" for action, n in sorted(counts.items())) or "no drift"
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {time.monotonic() - started:.1f}s ({summary}); report: {options['report']}"
+        ))
+        if os.path.exists(options["state"]):
+            os.remove(options["state"])
+
+    def _load_state(self, options):
+        try:
+            with open(options["state"], encoding="utf-8") as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return None
+        except ValueError as exc:
+            raise CommandError(f"Unreadable state file {options['state']}: {exc}")
+
+    def _save_state(self, options, state):
+        tmp = options["state"] + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(state, fh)
+        os.replace(tmp, options["state"])
@@ -0,0 +1,29 @@
+"""
+Hit / miss counts of the cached menu, slider and business-detail responses
+(see loyalty.response_cache). The counters live in the Django cache, so with
+REDIS_URL set they cover every process.
+
+Usage:
+    python manage.py response_cache_stats
+    python manage.py response_cache_stats --reset
+"""
+from django.core.management.base import BaseCommand
+
+from loyalty import response_cache
+
+
+class Command(BaseCommand):
+    help = "Show the hit / miss counters of the public response cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="Set the counters back to zero afterwards")
+
+    def handle(self, *args, **options):
+        for endpoint, counts in response_cache.stats().items():
+            hits, misses = counts[response_cache.HIT], counts[response_cache.MISS]
+            total = hits + misses
+            ratio = f"{hits / total:.1%}" if total else "-"
+            self.stdout.write(f"{endpoint:>16}: {hits} hits, {misses} misses, hit ratio {ratio}")
+        if options["reset"]:
+            response_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS("Counters reset"))
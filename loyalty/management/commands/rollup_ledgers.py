@@ -0,0 +1,50 @@
+"""
+Roll closed months of the points ledgers up into LedgerMonth and optionally
+archive old detail rows (see loyalty.ledger_rollup).
+
+Usage:
+    python manage.py rollup_ledgers
+    python manage.py rollup_ledgers --archive                          # horizon: LEDGER_ARCHIVE_AFTER_MONTHS
+    python manage.py rollup_ledgers --archive --archive-after-months 12
+    python manage.py rollup_ledgers --ledger rewards
+
+Safe to run repeatedly (e.g. daily); a month is only rolled up once it is over.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from loyalty import ledger_rollup
+
+
+class Command(BaseCommand):
+    help = "Roll up closed months of Transaction / PointsTransaction and optionally archive old rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ledger", choices=sorted(ledger_rollup.LEDGERS), help="Only this ledger")
+        parser.add_argument("--archive", action="store_true", help="Move rolled-up rows older than the horizon to the archive tables")
+        parser.add_argument(
+            "--archive-after-months",
+            type=int,
+            default=None,
+            help="Archive horizon in months (default: settings.LEDGER_ARCHIVE_AFTER_MONTHS)",
+        )
+
+    def handle(self, *args, **options):
+        ledgers = [options["ledger"]] if options["ledger"] else list(ledger_rollup.LEDGERS)
+        horizon = options["archive_after_months"]
+        if horizon is None:
+            horizon = settings.LEDGER_ARCHIVE_AFTER_MONTHS
+        if horizon < 1:
+            raise CommandError("--archive-after-months must be at least 1")
+
+        now = timezone.now()
+        for ledger in ledgers:
+            written = ledger_rollup.roll_up(ledger, now=now)
+            until = ledger_rollup.checkpoint(ledger)
+            self.stdout.write(f"{ledger}: {written} monthly rows written, rolled up until {until:%Y-%m-%d}")
+            if options["archive"]:
+                before = ledger_rollup.add_months(ledger_rollup.month_start(now), -horizon)
+                moved = ledger_rollup.archive(ledger, before)
+                self.stdout.write(f"{ledger}: {moved} rows before {before:%Y-%m-%d} archived")
+        self.stdout.write(self.style.SUCCESS("Done"))
@@ -0,0 +1,59 @@
+"""
+Run background jobs (loyalty.jobs), e.g. caching and resizing uploaded images.
+
+Runs until stopped (SIGTERM / Ctrl+C finish the jobs in progress first) with
+``--concurrency`` jobs at a time. ``--burst`` exits once no job is due, e.g.
+for a one-off run after a deploy.
+
+Usage:
+    python manage.py run_worker
+    python manage.py run_worker --concurrency 4
+    python manage.py run_worker --burst
+"""
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from loyalty import jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=getattr(settings, "JOB_WORKER_CONCURRENCY", 2),
+            help="Jobs run at the same time (threads)",
+        )
+        parser.add_argument("--burst", action="store_true", help="Exit when no job is due")
+        parser.add_argument("--max-jobs", type=int, default=None, help="Exit after this many jobs")
+
+    def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        if connection.vendor == "sqlite" and concurrency > 1:
+            # One writer at a time: parallel jobs would only fail with "database is locked"
+            self.stdout.write("SQLite: running one job at a time")
+            concurrency = 1
+        worker = jobs.Worker(
+            concurrency=concurrency,
+            poll_interval=getattr(settings, "JOB_POLL_INTERVAL", 2.0),
+            burst=options["burst"],
+            max_jobs=options["max_jobs"],
+            log=self.stdout.write,
+        )
+        if threading.current_thread() is threading.main_thread():
+            def shutdown(signum, frame):
+                self.stdout.write("Stopping after the jobs in progress...")
+                worker.stop.set()
+
+            signal.signal(signal.SIGTERM, shutdown)
+            signal.signal(signal.SIGINT, shutdown)
+
+        self.stdout.write(
+            f"Worker {worker.name}: {worker.concurrency} at a time, kinds: {', '.join(sorted(jobs.HANDLERS)) or '-'}"
+        )
+        worker.run()
+        self.stdout.write(self.style.SUCCESS(f"{worker.succeeded} jobs done, {worker.failed} failed"))
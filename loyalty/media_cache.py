@@ -0,0 +1,274 @@
+"""
+Images served straight from the image cache (``ImageBlob``), so they survive a
+deploy that wipes ``MEDIA_ROOT`` without a restore step on the request path.
+
+Two URLs:
+
+``/media-cache/<sha256>/``
+    The bytes of one blob. The content never changes, so the response carries a
+    strong ETag (the SHA-256 itself) and ``Cache-Control: immutable``.
+``/media-cache/<content_type>/<object_id>/?v=<version>``
+    The cached image of a Product / Slider. ``v`` is a short hash of the file
+    name, which changes with every new upload, so a matching URL is immutable
+    too; without (or with an outdated) ``v`` the current image is served with
+    ``no-cache``. If the image is not cached (never, or evicted since) the
+    client is redirected to the storage URL and a job is queued to cache it.
+
+``/media-cache/<content_type>/<object_id>/<variant>/?v=<version>``
+    A resized WebP rendition of it (``loyalty.image_variants``); until the
+    rendition exists, the original is served with ``no-cache``.
+
+Serializers emit the object form (``image_url()``): it is built from the object
+alone, without a query. ``?img=thumb|card|full`` on the API request selects a
+rendition, ``?img=srcset`` returns a dict of all of them plus the original. Both answer ``HEAD``, ``If-None-Match`` /
+``If-Modified-Since`` (304) and a single ``Range`` (206 / 416). The bytes are
+read in ``CHUNK_SIZE`` slices by ``image_store.BlobReader``, so a 206 only reads
+its slice and a 304 or ``HEAD`` reads no image data at all.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_safe
+
+from . import image_cache, image_cache_policy, image_store, image_variants
+from .models import ImageBlob, ImageCache, ImageVariant
+
+# Models whose images ImageCacheManager caches, and their image field
+CACHED_FIELDS = {"loyalty.product": "image", "loyalty.slider": "image"}
+CHUNK_SIZE = 256 * 1024
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+# Seconds before this process queues caching of the same uncached image again
+RECACHE_INTERVAL = 300.0
+
+_recache_queued: Dict[Tuple[str, int], float] = {}
+
+
+def path_version(name: str) -> str:
+    """``?v=`` of a stored file name."""
+    return hashlib.sha1(name.encode()).hexdigest()[:12]
+
+
+def blob_url(sha256: str) -> str:
+    return reverse("media_cache_blob", args=[sha256])
+
+
+def object_url(instance, field_name: str = "image", variant: Optional[str] = None) -> Optional[str]:
+    """``/media-cache/<content_type>/<id>/[<variant>/]?v=...`` of ``instance``'s image; no query."""
+    file = getattr(instance, field_name, None)
+    if not file:
+        return None
+    content_type = f"{instance._meta.app_label}.{instance._meta.model_name}"
+    if variant:
+        path = reverse("media_cache_variant", args=[content_type, instance.pk, variant])
+    else:
+        path = reverse("media_cache_object", args=[content_type, instance.pk])
+    return f"{path}?v={path_version(file.name)}"
+
+
+def requested_variant(request) -> Optional[str]:
+    """``?img=`` of the API request: a ``VARIANTS`` name, ``srcset`` or None (unknown values too)."""
+    value = request.GET.get("img") if request is not None else None
+    if value in image_variants.VARIANTS or value == image_variants.SRCSET:
+        return value
+    return None
+
+
+def image_url(request, instance, field_name: str = "image"):
+    """
+    The URL an API response should give for ``instance``'s image: the rendition
+    named by ``?img=`` (a dict of all of them for ``?img=srcset``), else the
+    original, from the cache when ``settings.MEDIA_CACHE_URLS`` is on and from
+    the storage otherwise; absolute if there is a request.
+    """
+    file = getattr(instance, field_name, None)
+    if not file:
+        return None
+
+    def absolute(url):
+        return request.build_absolute_uri(url) if request is not None and url else url
+
+    variant = requested_variant(request)
+    if variant == image_variants.SRCSET:
+        urls = {name: absolute(object_url(instance, field_name, name)) for name in image_variants.VARIANTS}
+        urls[image_variants.ORIGINAL] = absolute(_original_url(instance, field_name))
+        return urls
+    if variant:
+        # Renditions only exist in the database
+        return absolute(object_url(instance, field_name, variant))
+    return absolute(_original_url(instance, field_name))
+
+
+def _original_url(instance, field_name: str) -> Optional[str]:
+    if getattr(settings, "MEDIA_CACHE_URLS", False):
+        return object_url(instance, field_name)
+    try:
+        return getattr(instance, field_name).url
+    except Exception:
+        return None
+
+
+def parse_range(header: str, size: int):
+    """
+    ``(start, end)`` (end exclusive) of a single ``bytes=`` range, ``False`` if it
+    cannot be satisfied, ``None`` if the header is to be ignored (malformed or
+    several ranges: the full content is a valid answer to both).
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    first, last = first.strip(), last.strip()
+    if not dash or not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        suffix = int(last)
+        return (max(size - suffix, 0), size) if suffix and size else False
+    start = int(first)
+    end = min(int(last) + 1, size) if last else size
+    if last and end <= start and start < size:
+        return None
+    if start >= size:
+        return False
+    return start, end
+
+
+class BlobResponse(FileResponse):
+    block_size = CHUNK_SIZE
+
+
+def _safe_content_type(content_type: str) -> str:
+    # Only raster images render inline; SVG can carry scripts
+    if content_type.startswith("image/") and "svg" not in content_type:
+        return content_type
+    return "application/octet-stream"
+
+
+def serve(request, sha256: str, size: int, content_type: str, created_at: datetime, cache_control: str):
+    """Response for one blob, honouring conditional and Range headers."""
+    etag = quote_etag(sha256)
+    last_modified = int(created_at.timestamp())
+
+    def finish(response):
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        response["Cache-Control"] = cache_control
+        response["Accept-Ranges"] = "bytes"
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return finish(not_modified)
+
+    content_type = _safe_content_type(content_type)
+    span: Optional[Tuple[int, int]] = None
+    range_header = request.META.get("HTTP_RANGE")
+    if_range = request.META.get("HTTP_IF_RANGE")
+    # A Range with an outdated If-Range gets the whole (new) content
+    if range_header and request.method == "GET" and (not if_range or if_range.strip() == etag):
+        span = parse_range(range_header, size)
+        if span is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return finish(response)
+
+    if request.method == "HEAD":
+        response = HttpResponse(content_type=content_type)
+        response["Content-Length"] = size
+        return finish(response)
+
+    start, end = span or (0, size)
+    response = BlobResponse(
+        image_store.BlobReader(sha256, start, end), content_type=content_type, status=206 if span else 200
+    )
+    if span:
+        response["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    return finish(response)
+
+
+@require_safe
+def blob_view(request, sha256: str):
+    """GET /media-cache/<sha256>/"""
+    meta = ImageBlob.objects.filter(pk=sha256).values_list("size", "content_type", "created_at").first()
+    if meta is None:
+        raise Http404("Image not found")
+    size, content_type, created_at = meta
+    image_cache_policy.record(blob=sha256)
+    return serve(request, sha256, size, content_type, created_at, IMMUTABLE)
+
+
+@require_safe
+def object_view(request, content_type: str, object_id: int, variant: Optional[str] = None):
+    """GET /media-cache/<content_type>/<object_id>/[<variant>/]?v=<version>"""
+    field_name = CACHED_FIELDS.get(content_type)
+    if field_name is None or (variant is not None and variant not in image_variants.VARIANTS):
+        raise Http404("Image not found")
+    columns = ("blob_id", "blob__size", "blob__content_type", "blob__created_at")
+    # Every cached version of the object's image (usually one), and of the rendition
+    originals, cache_ids = {}, {}
+    for pk, path, *row in ImageCache.objects.filter(
+        content_type=content_type, object_id=object_id, blob__isnull=False
+    ).values_list("pk", "original_path", *columns):
+        originals[path_version(path)], cache_ids[path_version(path)] = row, pk
+    renditions = {}
+    if variant is not None and originals:
+        renditions = {
+            path_version(path): row
+            for path, *row in ImageVariant.objects.filter(
+                source__caches__content_type=content_type, source__caches__object_id=object_id, name=variant
+            ).values_list("source__caches__original_path", *columns)
+        }
+
+    def pick(version):
+        """``(row, final)``; a rendition not made yet falls back to the original, not final."""
+        if version in cache_ids:
+            # last_accessed of the cache row, written in batches (LRU eviction)
+            image_cache_policy.record(cache_ids[version])
+        if variant is None:
+            return (originals[version], True) if version in originals else None
+        if version in renditions:
+            return renditions[version], True
+        return (originals[version], False) if version in originals else None
+
+    found = pick(request.GET.get("v"))
+    if found is not None:
+        row, final = found
+        return serve(request, *row, IMMUTABLE if final else REVALIDATE)
+
+    # No / outdated version: serve whatever the object shows now
+    model = apps.get_model(content_type)
+    name = model.objects.filter(pk=object_id).values_list(field_name, flat=True).first()
+    if not name:
+        raise Http404("Image not found")
+    found = pick(path_version(name))
+    if found is not None:
+        return serve(request, *found[0], REVALIDATE)
+    # Not cached (yet, or evicted): the storage may still have it
+    _queue_recache(content_type, object_id, field_name)
+    response = HttpResponseRedirect(default_storage.url(name))
+    response["Cache-Control"] = REVALIDATE
+    return response
+
+
+def _queue_recache(content_type: str, object_id: int, field_name: str) -> None:
+    """Queue caching of an uncached image, at most every ``RECACHE_INTERVAL`` seconds per object."""
+    now = time.monotonic()
+    last = _recache_queued.get((content_type, object_id))
+    if last is not None and now - last < RECACHE_INTERVAL:
+        return
+    _recache_queued[content_type, object_id] = now
+    # A no-op while a job for the object is pending
+    image_cache.queue_cache_job(content_type, object_id, field_name)
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-17 10:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0011_product_description'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerPointsSummary',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='points_summary', serialize=False, to='loyalty.customer')),
+                ('total_balance', models.IntegerField(default=0, help_text='Sum of points_balance across all wallets')),
+                ('lifetime_earned', models.PositiveIntegerField(default=0)),
+                ('lifetime_redeemed', models.PositiveIntegerField(default=0)),
+                ('wallet_count', models.PositiveIntegerField(default=0)),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Customer points summaries',
+            },
+        ),
+    ]
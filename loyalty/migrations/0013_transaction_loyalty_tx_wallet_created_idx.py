@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-17 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0012_customerpointssummary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['wallet', 'created_at', 'id'], name='loyalty_tx_wallet_created_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-17 10:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0013_transaction_loyalty_tx_wallet_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerRollupCheckpoint',
+            fields=[
+                ('ledger', models.CharField(max_length=16, primary_key=True, serialize=False)),
+                ('rolled_until', models.DateTimeField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TransactionArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.IntegerField()),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='loyalty.wallet')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ledger', models.CharField(max_length=16)),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('earned', models.PositiveIntegerField(default=0)),
+                ('redeemed', models.PositiveIntegerField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('last_at', models.DateTimeField(blank=True, null=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_months', to='loyalty.wallet')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'ledger', 'month'), name='loyalty_ledger_month_unique')],
+            },
+        ),
+    ]
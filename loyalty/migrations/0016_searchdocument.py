@@ -0,0 +1,110 @@
+# Generated by Django 5.1.2 on 2026-10-17 10:44
+
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+FTS_TABLE = 'loyalty_searchdocument_fts'
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE loyalty_searchdocument ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(body, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX loyalty_search_vector_gin ON loyalty_searchdocument USING GIN (search_vector)",
+]
+
+SQLITE_FORWARD = [
+    f"""
+    CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        title, body, content='loyalty_searchdocument', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER loyalty_searchdocument_ai AFTER INSERT ON loyalty_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    f"""
+    CREATE TRIGGER loyalty_searchdocument_ad AFTER DELETE ON loyalty_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    f"""
+    CREATE TRIGGER loyalty_searchdocument_au AFTER UPDATE ON loyalty_searchdocument BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO {FTS_TABLE}(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for sql in POSTGRES_FORWARD:
+            schema_editor.execute(sql)
+    elif vendor == 'sqlite':
+        try:
+            for sql in SQLITE_FORWARD:
+                schema_editor.execute(sql)
+        except OperationalError:
+            # SQLite built without FTS5: loyalty.search falls back to LIKE
+            pass
+
+
+def drop_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS loyalty_search_vector_gin')
+        schema_editor.execute('ALTER TABLE loyalty_searchdocument DROP COLUMN IF EXISTS search_vector')
+    elif vendor == 'sqlite':
+        for trigger in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS loyalty_searchdocument_{trigger}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def populate_search_documents(apps, schema_editor):
+    SearchDocument = apps.get_model('loyalty', 'SearchDocument')
+    Business = apps.get_model('loyalty', 'Business')
+    Product = apps.get_model('loyalty', 'Product')
+    Service = apps.get_model('reviews', 'Service')
+
+    def documents():
+        for pk, name, description, address in Business.objects.values_list('pk', 'name', 'description', 'address').iterator():
+            body = '\n'.join(part for part in (description, address) if part)
+            yield SearchDocument(kind='business', object_id=pk, title=name[:255], body=body)
+        for pk, title in Product.objects.filter(active=True).values_list('pk', 'title').iterator():
+            yield SearchDocument(kind='product', object_id=pk, title=title[:255], body='')
+        for pk, name, description in Service.objects.filter(is_active=True).values_list('pk', 'name', 'description').iterator():
+            yield SearchDocument(kind='service', object_id=pk, title=name[:255], body=description or '')
+
+    SearchDocument.objects.bulk_create(documents(), batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0015_rating_stats'),
+        ('reviews', '0005_service_rating_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('business', 'Business'), ('product', 'Product'), ('service', 'Service')], max_length=16)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='loyalty_search_document_unique')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+        migrations.RunPython(populate_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.1.2 on 2026-10-17 11:00
+
+import base64
+import binascii
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def move_base64_to_blobs(apps, schema_editor):
+    """Decode every ImageCache.image_data into a shared ImageBlob, one row at a time."""
+    ImageCache = apps.get_model('loyalty', 'ImageCache')
+    ImageBlob = apps.get_model('loyalty', 'ImageBlob')
+    ids = list(ImageCache.objects.exclude(image_data__isnull=True).exclude(image_data='').values_list('pk', flat=True))
+    for pk in ids:
+        encoded, content_type = ImageCache.objects.filter(pk=pk).values_list('image_data', 'content_type_header').get()
+        try:
+            data = base64.b64decode(encoded, validate=True)
+        except (binascii.Error, ValueError):
+            continue
+        sha256 = hashlib.sha256(data).hexdigest()
+        if not ImageBlob.objects.filter(pk=sha256).exists():
+            ImageBlob.objects.create(sha256=sha256, data=data, size=len(data), content_type=content_type or '')
+        ImageCache.objects.filter(pk=pk).update(blob_id=sha256, file_size=len(data))
+
+
+def restore_base64(apps, schema_editor):
+    ImageCache = apps.get_model('loyalty', 'ImageCache')
+    ImageBlob = apps.get_model('loyalty', 'ImageBlob')
+    for pk, sha256 in ImageCache.objects.exclude(blob__isnull=True).values_list('pk', 'blob_id'):
+        data = ImageBlob.objects.filter(pk=sha256).values_list('data', flat=True).get()
+        ImageCache.objects.filter(pk=pk).update(image_data=base64.b64encode(bytes(data)).decode('ascii'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0017_business_location'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+                ('content_type', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'base_manager_name': 'objects',
+            },
+        ),
+        migrations.AddField(
+            model_name='imagecache',
+            name='blob',
+            field=models.ForeignKey(blank=True, help_text='محتوای تصویر (SHA-256)', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='caches', to='loyalty.imageblob'),
+        ),
+        migrations.RunPython(move_base64_to_blobs, restore_base64),
+        migrations.RemoveField(
+            model_name='imagecache',
+            name='image_data',
+        ),
+    ]
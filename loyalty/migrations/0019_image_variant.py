@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-17 11:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0018_image_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=16)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('blob', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='variant_of', to='loyalty.imageblob')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='loyalty.imageblob')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('source', 'name'), name='loyalty_image_variant_unique')],
+            },
+        ),
+    ]
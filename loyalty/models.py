@@ -1,18 +1,64 @@
 from __future__ import annotations
 
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.hashers import make_password, check_password
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
-from django.db.models import Avg
 
+from . import geo
+
+
+class RatingStats(models.Model):
+    """
+    Approved-review totals of a business / product / service, kept up to date by
+    ``reviews.rating_stats`` (signals on Review); rebuild with
+    ``python manage.py rebuild_rating_stats``.
+
+    ``save()`` of a loaded row never writes these columns, so editing e.g. a
+    business cannot overwrite counts that changed after it was read.
+    """
+    RATING_FIELDS = ("rating_sum", "rating_count")
+
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            skip = set(self.RATING_FIELDS) | self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in skip and f.attname not in skip
+            ]
+        super().save(*args, **kwargs)
+
+    @property
+    def average_rating(self):
+        """Average of the approved reviews, or None without any."""
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+
+class Business(RatingStats):
+    RATING_FIELDS = RatingStats.RATING_FIELDS + ("question_rating_sum", "question_rating_count")
 
-class Business(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=220, unique=True, blank=True, null=True)
     description = models.TextField(blank=True)
     address = models.CharField(max_length=300, blank=True)
+    latitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)]
+    )
+    longitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)]
+    )
+    # Cell of (latitude, longitude), kept by save(); see loyalty.geo
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     website = models.URLField(blank=True)
     phone = models.CharField(max_length=20, blank=True, help_text="Business phone number")
     email = models.EmailField(blank=True, help_text="Business contact email")
@@ -24,6 +70,9 @@ class Business(models.Model):
         help_text="Points required for the default reward",
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # Question ratings (reviews.QuestionRating) of this business; see RatingStats
+    question_rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    question_rating_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:  # pragma: no cover - readable admin
         return self.name
@@ -37,17 +86,20 @@ class Business(models.Model):
                 slug = f"{base_slug}-{counter}"
                 counter += 1
             self.slug = slug
+        self.geohash = self.compute_geohash()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"latitude", "longitude"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "geohash"}
         super().save(*args, **kwargs)
 
-    @property
-    def average_rating(self):
-        from reviews.models import Review
+    def compute_geohash(self) -> str:
+        if self.latitude is None or self.longitude is None:
+            return ""
+        return geo.encode(self.latitude, self.longitude)
 
-        return (
-            self.reviews.filter(status=Review.Status.APPROVED)
-            .aggregate(avg=Avg("rating"))
-            .get("avg")
-        )
+    @property
+    def question_rating_average(self):
+        return self.question_rating_sum / self.question_rating_count if self.question_rating_count else None
     
     def set_password(self, raw_password):
         """Set password with hashing"""
@@ -70,7 +122,7 @@ class Customer(models.Model):
         return self.user.get_username()
 
 
-class Product(models.Model):
+class Product(RatingStats):
     business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name="products")
     title = models.CharField(max_length=200)
     description = models.TextField(blank=True, help_text="Product description")
@@ -120,6 +172,92 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     note = models.CharField(max_length=200, blank=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a customer's history (loyalty.pagination)
+            models.Index(fields=["wallet", "created_at", "id"], name="loyalty_tx_wallet_created_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        creating = self._state.adding
+        # No savepoint: the summary update must share the caller's transaction, and
+        # SAVEPOINT/RELEASE would add two round trips to every ledger insert.
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if creating:
+                from .points_summary import record_ledger_entry
+
+                record_ledger_entry(self.wallet.customer_id, self.amount, self.created_at)
+
+
+class TransactionArchive(models.Model):
+    """Transaction rows moved out of the live table by ``rollup_ledgers --archive`` (same ids and values)."""
+    id = models.BigIntegerField(primary_key=True)
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="+")
+    amount = models.IntegerField()
+    created_at = models.DateTimeField(db_index=True)
+    note = models.CharField(max_length=200, blank=True)
+
+
+class LedgerMonth(models.Model):
+    """
+    Per-wallet monthly totals of one ledger (loyalty.Transaction or rewards.PointsTransaction).
+
+    Written by ``python manage.py rollup_ledgers`` for closed months only; rows
+    after ``LedgerRollupCheckpoint.rolled_until`` are still read from the live
+    table (see ``loyalty.ledger_rollup``).
+    """
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="ledger_months")
+    ledger = models.CharField(max_length=16)
+    month = models.DateField(help_text="First day of the month")
+    earned = models.PositiveIntegerField(default=0)
+    redeemed = models.PositiveIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+    last_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["wallet", "ledger", "month"], name="loyalty_ledger_month_unique"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.ledger} {self.month:%Y-%m} @ {self.wallet_id}"
+
+
+class LedgerRollupCheckpoint(models.Model):
+    """Ledger rows created before ``rolled_until`` are counted in LedgerMonth."""
+    ledger = models.CharField(max_length=16, primary_key=True)
+    rolled_until = models.DateTimeField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.ledger} < {self.rolled_until:%Y-%m-%d}"
+
+
+class CustomerPointsSummary(models.Model):
+    """
+    Denormalized points totals for one customer (read model).
+
+    Updated in the same DB transaction as every Transaction / PointsTransaction
+    insert, so dashboards can read it with a single primary-key lookup.
+    Rebuild with ``python manage.py rebuild_points_summary``.
+    """
+    customer = models.OneToOneField(
+        Customer, on_delete=models.CASCADE, primary_key=True, related_name="points_summary"
+    )
+    total_balance = models.IntegerField(default=0, help_text="Sum of points_balance across all wallets")
+    lifetime_earned = models.PositiveIntegerField(default=0)
+    lifetime_redeemed = models.PositiveIntegerField(default=0)
+    wallet_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "Customer points summaries"
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.customer_id}: {self.total_balance} pts"
+
 
 class Slider(models.Model):
     """Slider model for home page carousel"""
@@ -140,11 +278,66 @@ class Slider(models.Model):
         return f"{self.store} - Slider"
 
 
+class ImageBlobQuerySet(models.QuerySet):
+    def with_data(self):
+        return self.defer(None)
+
+
+class ImageBlobManager(models.Manager.from_queryset(ImageBlobQuerySet)):
+    def get_queryset(self):
+        # Bytes are only read on purpose (``with_data()`` / ``loyalty.image_store.read``)
+        return super().get_queryset().defer("data")
+
+
+class ImageBlob(models.Model):
+    """
+    Raw image bytes, stored once per distinct content and addressed by their
+    SHA-256 (see ``loyalty.image_store``). ``ImageCache`` rows reference blobs;
+    a blob nobody references any more is removed by ``image_store.collect_garbage``.
+    """
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField()
+    content_type = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = ImageBlobManager()
+
+    class Meta:
+        # ImageCache.blob uses the base manager: it must not load the bytes either
+        base_manager_name = "objects"
+
+    def __str__(self) -> str:  # pragma: no cover - readable admin
+        return f"{self.sha256[:12]} ({self.size} B)"
+
+
+class ImageVariant(models.Model):
+    """
+    A resized WebP rendition (thumb / card / full, see ``loyalty.image_variants``)
+    of an image blob. Renditions belong to the content, not to a product: every
+    ImageCache row with the same blob shares them.
+    """
+    source = models.ForeignKey(ImageBlob, on_delete=models.CASCADE, related_name="variants")
+    name = models.CharField(max_length=16)
+    blob = models.ForeignKey(ImageBlob, on_delete=models.PROTECT, related_name="variant_of")
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["source", "name"], name="loyalty_image_variant_unique"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.source_id[:12]} {self.name} ({self.width}x{self.height})"
+
+
 class ImageCache(models.Model):
     """
     مدل برای کش کردن تصاویر در دیتابیس
-    این مدل تصاویر را به صورت base64 یا URL در دیتابیس ذخیره می‌کند
-    تا از پاک شدن بعد از deploy جلوگیری شود
+    این مدل تصاویر را به صورت blob (ImageBlob، بر اساس SHA-256) یا URL در دیتابیس
+    ذخیره می‌کند تا از پاک شدن بعد از deploy جلوگیری شود؛ تصاویر یکسان فقط یک بار ذخیره می‌شوند
     """
     # اطلاعات مدل اصلی
     content_type = models.CharField(max_length=100, help_text="نوع مدل (مثلاً Product یا Slider)")
@@ -153,8 +346,11 @@ class ImageCache(models.Model):
     # مسیر اصلی فایل
     original_path = models.CharField(max_length=500, help_text="مسیر اصلی فایل در storage")
     
-    # ذخیره تصویر به صورت base64 (برای تصاویر کوچک)
-    image_data = models.TextField(blank=True, null=True, help_text="تصویر به صورت base64")
+    # بایت‌های تصویر (برای تصاویر تا ۵ مگابایت)؛ چند ردیف می‌توانند یک blob مشترک داشته باشند
+    blob = models.ForeignKey(
+        ImageBlob, null=True, blank=True, on_delete=models.PROTECT, related_name="caches",
+        help_text="محتوای تصویر (SHA-256)",
+    )
     
     # URL تصویر (اگر در Cloudinary یا storage دیگر باشد)
     image_url = models.URLField(blank=True, null=True, help_text="URL تصویر در storage")
@@ -183,15 +379,93 @@ class ImageCache(models.Model):
     @property
     def has_data(self) -> bool:
         """بررسی اینکه آیا داده تصویر وجود دارد"""
-        return bool(self.image_data or self.image_url)
+        return bool(self.blob_id or self.image_url)
     
     def get_image_url(self) -> str:
-        """بازیابی URL تصویر"""
-        if self.image_url:
-            return self.image_url
-        elif self.image_data:
-            # اگر base64 است، می‌توانیم data URL بسازیم
-            return f"data:{self.content_type_header or 'image/jpeg'};base64,{self.image_data[:100]}..."
-        return ""
+        """بازیابی URL تصویر؛ اگر blob داریم آدرس /media-cache/ (بعد از deploy هم کار می‌کند)"""
+        if self.blob_id:
+            return reverse("media_cache_blob", args=[self.blob_id])
+        return self.image_url or ""
+
 
 
+
+class SearchDocument(models.Model):
+    """
+    Denormalized search text of a Business, an active Product or an active
+    reviews.Service, kept in step by signals (see ``loyalty.search``).
+
+    The full-text index is not a Django field: PostgreSQL has a generated
+    ``search_vector`` tsvector column with a GIN index, SQLite an FTS5 table
+    ``loyalty_searchdocument_fts``; both are created in migration 0016.
+    """
+    class Kind(models.TextChoices):
+        BUSINESS = "business", "Business"
+        PRODUCT = "product", "Product"
+        SERVICE = "service", "Service"
+
+    kind = models.CharField(max_length=16, choices=Kind.choices)
+    object_id = models.PositiveBigIntegerField()
+    title = models.CharField(max_length=255)
+    body = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="loyalty_search_document_unique"),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.kind}#{self.object_id} {self.title}"
+
+
+class BackgroundJob(models.Model):
+    """
+    A unit of work run outside the request by ``python manage.py run_worker``
+    (see ``loyalty.jobs``). At most one pending job exists per (kind, key), so
+    enqueueing the same work twice before it runs is a no-op.
+    """
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    kind = models.CharField(max_length=64)
+    key = models.CharField(max_length=255, help_text="Deduplication key within the kind")
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now, help_text="Not picked up before this time (retry backoff)")
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "key"], condition=models.Q(status="pending"), name="loyalty_background_job_pending_unique"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.kind} {self.key} ({self.status})"
+
+
+class CacheVersion(models.Model):
+    """
+    Version counter of an in-process cache scope (see ``loyalty.cache_versions``).
+    Kept in the database so every process (web, worker, one-off commands) sees
+    the same value whatever the Django cache backend is.
+    """
+    scope = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.scope} v{self.version}"
@@ -0,0 +1,101 @@
+"""
+Keyset (cursor) pagination for the points ledgers.
+
+Pages are ordered newest first by ``(created_at, id)`` and the next page starts
+strictly after the last row of the previous one, so page N costs the same as
+page 1 (an index range scan on ``(wallet, created_at, id)``) instead of an
+``OFFSET`` that reads and discards every earlier row. The cursor is opaque to
+clients. The total count is only computed with ``?with_count=1``.
+"""
+
+from __future__ import annotations
+
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    raw = f"{created_at.isoformat()}|{pk}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Return ``(created_at, pk)``; raises ValueError for anything that is not one of our cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(pk)
+    except (TypeError, UnicodeError, ValueError) as exc:
+        raise ValueError("invalid cursor") from exc
+
+
+class KeysetPagination(BasePagination):
+    """
+    ``?cursor=&limit=&with_count=1`` over a queryset of rows with ``created_at`` and ``id``.
+
+    Usable as a DRF ``pagination_class`` or by hand from an APIView
+    (``paginate_queryset`` + ``get_pagination_data``).
+    """
+    default_limit = 50
+    max_limit = 200
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+    count_query_param = "with_count"
+
+    def get_limit(self, request) -> int:
+        try:
+            limit = int(request.query_params.get(self.limit_query_param, self.default_limit))
+        except (TypeError, ValueError):
+            limit = self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def wants_count(self, request) -> bool:
+        return request.query_params.get(self.count_query_param) in ("1", "true", "yes")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.limit = self.get_limit(request)
+        self.count = queryset.order_by().count() if self.wants_count(request) else None
+
+        queryset = queryset.order_by("-created_at", "-id")
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            try:
+                created_at, pk = decode_cursor(cursor)
+            except ValueError:
+                raise ValidationError({self.cursor_query_param: "invalid cursor"})
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+
+        # One extra row tells us whether there is a next page without counting
+        page = list(queryset[: self.limit + 1])
+        self.has_next = len(page) > self.limit
+        page = page[: self.limit]
+        self.next_cursor = encode_cursor(page[-1].created_at, page[-1].id) if self.has_next else None
+        return page
+
+    def get_pagination_data(self) -> dict:
+        return {
+            "limit": self.limit,
+            "has_next": self.has_next,
+            "next_cursor": self.next_cursor,
+            "count": self.count,
+        }
+
+    def get_paginated_response(self, data):
+        return Response({"results": data, **self.get_pagination_data()})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "results": schema,
+                "limit": {"type": "integer"},
+                "has_next": {"type": "boolean"},
+                "next_cursor": {"type": "string", "nullable": True},
+                "count": {"type": "integer", "nullable": True, "description": "Only with ?with_count=1"},
+            },
+        }
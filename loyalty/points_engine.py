@@ -0,0 +1,147 @@
+"""
+Single entry point for awarding and redeeming points.
+
+Every scan / payment / redeem endpoint used to run its own sequence of
+``Customer.get_or_create`` -> ``Wallet.get_or_create`` -> ``reward_point_cost``
+save -> ledger insert -> ``Sum`` over wallets. ``award()`` / ``redeem()`` do the
+same work in three statements for an existing wallet:
+
+1. ``UPDATE wallet ... WHERE customer_id = %s AND business_id = %s RETURNING ...``
+   (balance change + reward cost sync, see ``wallet_service``)
+2. ``INSERT`` of one ledger row
+3. ``UPDATE`` of the customer's points summary (done by the ledger ``save()``)
+
+The wallet is only created when step 1 matches no row. Callers keep writing the
+ledger their history endpoints read: ``LOYALTY_LEDGER`` (loyalty.Transaction) or
+``REWARDS_LEDGER`` (rewards.PointsTransaction).
+"""
+
+from __future__ import annotations
+
+from typing import NamedTuple, Optional
+
+from . import wallet_service
+from .models import Customer, Transaction, Wallet
+from .points_summary import get_points_summary
+
+LOYALTY_LEDGER = "loyalty"
+REWARDS_LEDGER = "rewards"
+
+
+class InsufficientPoints(Exception):
+    def __init__(self, current_balance: int, required: int):
+        super().__init__(f"User points ({current_balance}) are less than required ({required})")
+        self.current_balance = current_balance
+        self.required = required
+
+
+class PointsResult(NamedTuple):
+    wallet_id: int
+    points_balance: int
+    reward_point_cost: int
+    entry: object  # the ledger row that was written
+    wallet_created: bool
+
+    @property
+    def achieved(self) -> bool:
+        return self.points_balance >= self.reward_point_cost
+
+
+def resolve_customer(user, phone: str = "") -> Customer:
+    """Customer for ``user``; stores ``phone`` if the customer has none yet."""
+    customer, _ = Customer.objects.get_or_create(user=user)
+    if phone and not customer.phone:
+        Customer.objects.filter(pk=customer.pk, phone="").update(phone=phone)
+        customer.phone = phone
+    return customer
+
+
+def wallet_balance(customer, business) -> int:
+    """Current balance of the customer's wallet at ``business`` (0 if there is none; nothing is created)."""
+    return (
+        Wallet.objects.filter(customer=customer, business=business)
+        .values_list("points_balance", flat=True)
+        .first()
+        or 0
+    )
+
+
+def _wallet_row(customer, business):
+    """``(wallet_id, points_balance)`` or None; used to explain a failed update."""
+    return Wallet.objects.filter(customer=customer, business=business).values_list("id", "points_balance").first()
+
+
+def total_points(customer) -> int:
+    """Sum of the customer's balances over all businesses (one summary read)."""
+    return get_points_summary(customer).total_balance
+
+
+def apply(
+    customer,
+    business,
+    delta: int,
+    note: str = "",
+    ledger: str = REWARDS_LEDGER,
+    campaign=None,
+    reward_point_cost: Optional[int] = None,
+    overwrite_reward_cost: bool = False,
+) -> PointsResult:
+    """
+    Change the customer's balance at ``business`` by ``delta`` and write the ledger row.
+
+    ``reward_point_cost`` defaults to the business's cost and fills an unset wallet
+    cost (or replaces it with ``overwrite_reward_cost``). Raises ``InsufficientPoints``
+    when a debit would take the balance below zero. Call inside ``transaction.atomic``.
+    """
+    if reward_point_cost is None:
+        reward_point_cost = business.reward_point_cost
+
+    wallet_created = False
+    balance = wallet_service.apply_points_for(
+        customer.pk, business.pk, delta, reward_point_cost, overwrite_reward_cost
+    )
+    if balance is None:
+        current = _wallet_row(customer, business)
+        if current is not None or delta < 0:
+            raise InsufficientPoints(current[1] if current else 0, -delta)
+        wallet, wallet_created = Wallet.objects.get_or_create(
+            customer=customer,
+            business=business,
+            defaults={"reward_point_cost": reward_point_cost},
+        )
+        balance = wallet_service.apply_points(wallet.id, delta, reward_point_cost, overwrite_reward_cost)
+
+    # Ledger rows need wallet.customer_id; hand them the wallet we already know about
+    wallet = Wallet(
+        id=balance.wallet_id,
+        customer=customer,
+        business=business,
+        points_balance=balance.points_balance,
+        reward_point_cost=balance.reward_point_cost,
+    )
+    if ledger == LOYALTY_LEDGER:
+        entry = Transaction.objects.create(wallet=wallet, amount=delta, note=note)
+    else:
+        from rewards.models import PointsTransaction
+
+        entry = PointsTransaction.objects.create(wallet=wallet, campaign=campaign, points=delta, note=note)
+
+    return PointsResult(balance.wallet_id, balance.points_balance, balance.reward_point_cost, entry, wallet_created)
+
+
+def _unsigned(points: int) -> int:
+    # Callers validate request amounts; a signed one reaching here must not change direction
+    if points < 0:
+        raise ValueError(f"points must not be negative, got {points}")
+    return points
+
+
+def award(customer, business, points: int, **kwargs) -> PointsResult:
+    """Add ``points`` (>= 0) to the customer's wallet at ``business``, creating the wallet if needed."""
+    return apply(customer, business, _unsigned(points), **kwargs)
+
+
+def redeem(customer, business, points: int, **kwargs) -> PointsResult:
+    """Spend ``points`` (>= 0); raises ``InsufficientPoints`` if the balance does not cover them."""
+    return apply(customer, business, -_unsigned(points), **kwargs)
+
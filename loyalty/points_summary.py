@@ -0,0 +1,178 @@
+"""
+Maintenance of the CustomerPointsSummary read model.
+
+Every ledger insert (loyalty.Transaction / rewards.PointsTransaction) calls
+``record_ledger_entry`` inside the same DB transaction, and wallet creation is
+tracked from signals. The update is a single ``UPDATE ... SET x = x + n`` on the
+summary row; if the row does not exist yet it is rebuilt from the source tables.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import CustomerPointsSummary, Wallet
+
+
+def record_activity(customer_id: int, earned: int = 0, redeemed: int = 0, balance_delta: Optional[int] = None, at=None) -> None:
+    """
+    Apply aggregated deltas to a customer's summary row.
+
+    ``balance_delta`` defaults to ``earned - redeemed``; ``redeemed`` is a positive number.
+    """
+    if balance_delta is None:
+        balance_delta = earned - redeemed
+    changes = {
+        "total_balance": F("total_balance") + balance_delta,
+        "updated_at": timezone.now(),
+    }
+    if earned or redeemed:
+        changes.update(
+            lifetime_earned=F("lifetime_earned") + earned,
+            lifetime_redeemed=F("lifetime_redeemed") + redeemed,
+            last_activity_at=at or timezone.now(),
+        )
+    updated = CustomerPointsSummary.objects.filter(customer_id=customer_id).update(**changes)
+    if not updated:
+        rebuild_summary(customer_id)
+
+
+def record_activity_bulk(changes: Dict[int, Tuple[int, int]], at=None, chunk_size: int = 100) -> None:
+    """
+    ``record_activity`` for many customers: ``{customer_id: (earned, redeemed)}``
+    applied with one ``UPDATE ... CASE`` per chunk. Missing summary rows are rebuilt.
+    """
+    changes = {cid: values for cid, values in changes.items() if values[0] or values[1]}
+    now = timezone.now()
+    at = at or now
+    customer_ids = list(changes)
+    for start in range(0, len(customer_ids), chunk_size):
+        chunk = customer_ids[start:start + chunk_size]
+
+        def case(value_of):
+            whens = [When(customer_id=cid, then=Value(value_of(*changes[cid]))) for cid in chunk]
+            return Case(*whens, default=Value(0), output_field=IntegerField())
+
+        updated = CustomerPointsSummary.objects.filter(customer_id__in=chunk).update(
+            total_balance=F("total_balance") + case(lambda earned, redeemed: earned - redeemed),
+            lifetime_earned=F("lifetime_earned") + case(lambda earned, redeemed: earned),
+            lifetime_redeemed=F("lifetime_redeemed") + case(lambda earned, redeemed: redeemed),
+            last_activity_at=at,
+            updated_at=now,
+        )
+        if updated < len(chunk):
+            existing = set(
+                CustomerPointsSummary.objects.filter(customer_id__in=chunk).values_list("customer_id", flat=True)
+            )
+            for customer_id in chunk:
+                if customer_id not in existing:
+                    rebuild_summary(customer_id)
+
+
+def refresh_total_balances(customer_ids: Iterable[int], chunk_size: int = 500) -> None:
+    """
+    Set ``total_balance`` to the sum of the customers' wallets (one UPDATE per chunk),
+    after wallet balances were corrected outside the ledgers, e.g. by reconcile_wallets.
+    """
+    customer_ids = list(customer_ids)
+    wallet_total = Subquery(
+        Wallet.objects.filter(customer_id=OuterRef("customer_id"))
+        .order_by()
+        .values("customer_id")
+        .annotate(total=Sum("points_balance"))
+        .values("total"),
+        output_field=IntegerField(),
+    )
+    now = timezone.now()
+    for start in range(0, len(customer_ids), chunk_size):
+        CustomerPointsSummary.objects.filter(customer_id__in=customer_ids[start:start + chunk_size]).update(
+            total_balance=Coalesce(wallet_total, Value(0)),
+            updated_at=now,
+        )
+
+
+def record_ledger_entry(customer_id: int, amount: int, at=None) -> None:
+    """Account for one ledger row (positive = earned, negative = redeemed)."""
+    record_activity(customer_id, earned=max(amount, 0), redeemed=max(-amount, 0), at=at)
+
+
+def record_wallet_created(customer_id: int, initial_balance: int = 0) -> None:
+    updated = CustomerPointsSummary.objects.filter(customer_id=customer_id).update(
+        wallet_count=F("wallet_count") + 1,
+        total_balance=F("total_balance") + initial_balance,
+        updated_at=timezone.now(),
+    )
+    if not updated:
+        rebuild_summary(customer_id)
+
+
+def record_wallet_deleted(customer_id: int, balance: int = 0) -> None:
+    # Only adjust an existing row: the customer itself may be in the middle of a cascade delete.
+    CustomerPointsSummary.objects.filter(customer_id=customer_id).update(
+        wallet_count=F("wallet_count") - 1,
+        total_balance=F("total_balance") - balance,
+        updated_at=timezone.now(),
+    )
+
+
+def compute_summaries(customer_ids: Optional[Iterable[int]] = None) -> Dict[int, dict]:
+    """
+    Compute summary values from Wallet and both ledgers with grouped aggregates.
+
+    Ledger totals include rolled-up and archived history (``ledger_rollup.totals``).
+    Returns ``{customer_id: {field: value}}``. Customers without wallets are omitted.
+    """
+    from . import ledger_rollup
+
+    wallets = Wallet.objects.all()
+    ledger_filter = {}
+    if customer_ids is not None:
+        customer_ids = list(customer_ids)
+        wallets = wallets.filter(customer_id__in=customer_ids)
+        ledger_filter["wallet__customer_id__in"] = customer_ids
+
+    result: Dict[int, dict] = {}
+    for row in wallets.values("customer_id").annotate(total=Sum("points_balance"), count=Count("id")).order_by():
+        result[row["customer_id"]] = {
+            "total_balance": row["total"] or 0,
+            "wallet_count": row["count"],
+            "lifetime_earned": 0,
+            "lifetime_redeemed": 0,
+            "last_activity_at": None,
+        }
+
+    for ledger in ledger_rollup.LEDGERS:
+        for customer_id, totals in ledger_rollup.totals(ledger, "wallet__customer_id", **ledger_filter).items():
+            values = result.get(customer_id)
+            if values is None:
+                continue
+            values["lifetime_earned"] += totals.earned
+            values["lifetime_redeemed"] += totals.redeemed
+            if totals.last_at and (values["last_activity_at"] is None or totals.last_at > values["last_activity_at"]):
+                values["last_activity_at"] = totals.last_at
+    return result
+
+
+def rebuild_summary(customer_id: int) -> CustomerPointsSummary:
+    """Recompute one customer's summary from the source tables and store it."""
+    values = compute_summaries([customer_id]).get(customer_id) or {}
+    try:
+        with transaction.atomic():
+            summary, _ = CustomerPointsSummary.objects.update_or_create(customer_id=customer_id, defaults=values)
+    except IntegrityError:
+        # Concurrent first write for the same customer; the other one won.
+        summary = CustomerPointsSummary.objects.get(customer_id=customer_id)
+    return summary
+
+
+def get_points_summary(customer) -> CustomerPointsSummary:
+    """Return the customer's summary with one primary-key read (built on first access)."""
+    summary = CustomerPointsSummary.objects.filter(pk=customer.pk).first()
+    if summary is None:
+        summary = rebuild_summary(customer.pk)
+    return summary
@@ -0,0 +1,145 @@
+"""
+Set-based reconciliation of wallet balances against the points ledgers.
+
+A wallet's balance should equal the sum of its ``loyalty.Transaction`` and
+``rewards.PointsTransaction`` rows (rolled-up months included, see
+``ledger_rollup``). ``reconcile_shard()`` checks the wallets of a group of
+businesses with one SQL statement: every wallet row carries its ledger balance
+as correlated subqueries, which use the ``(wallet, created_at, id)`` indexes.
+
+Corrections are applied per chunk inside a transaction: the drifted wallets are
+locked with ``SELECT ... FOR UPDATE`` and re-checked, because every award / redeem
+updates the wallet before writing its ledger row, so a locked wallet has no ledger
+write in flight. The wallets are then written with ``bulk_update`` and the
+customers' ``CustomerPointsSummary.total_balance`` is set to their new wallet sum.
+
+The rollup checkpoints are read once per run and passed to every shard. Months
+rolled up after that are ignored and their rows still read from the live table,
+so a rollup during the run cannot count them twice; rows *archived* meanwhile
+would be missed, which is why ``reconcile_wallets --resume`` refuses to continue
+once a checkpoint has moved.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import ledger_rollup
+from .models import LedgerMonth, Wallet
+from .points_summary import refresh_total_balances
+
+APPLY_CHUNK_SIZE = 500
+
+# Report actions
+WOULD_CORRECT = "would_correct"
+CORRECTED = "corrected"
+NEGATIVE_LEDGER = "negative_ledger"  # the ledgers sum below zero; left for a human
+RESOLVED = "resolved"  # drift was gone when the wallet was locked
+
+
+class Drift(NamedTuple):
+    wallet_id: int
+    customer_id: int
+    business_id: int
+    stored_balance: int
+    ledger_balance: int
+    action: str
+
+    @property
+    def difference(self) -> int:
+        return self.ledger_balance - self.stored_balance
+
+
+def _sum(queryset, expression):
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values("wallet_id").annotate(total=Sum(expression)).values("total"),
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def ledger_balance_expression(checkpoints: Dict[str, Optional[object]]):
+    """Expression for a Wallet queryset: the wallet's balance according to both ledgers."""
+    parts = []
+    for ledger in ledger_rollup.LEDGERS:
+        model, field, _ = ledger_rollup.ledger_models(ledger)
+        live = model.objects.filter(wallet_id=OuterRef("pk"))
+        until = checkpoints.get(ledger)
+        if until is not None:
+            live = live.filter(created_at__gte=until)
+            # Only months before the given checkpoint: later ones are still counted as live rows
+            rolled = LedgerMonth.objects.filter(
+                wallet_id=OuterRef("pk"), ledger=ledger, month__lt=timezone.localtime(until).date()
+            )
+            parts.append(_sum(rolled, F("earned") - F("redeemed")))
+        parts.append(_sum(live, F(field)))
+    expression = parts[0]
+    for part in parts[1:]:
+        expression = expression + part
+    return expression
+
+
+def current_checkpoints() -> Dict[str, Optional[object]]:
+    return {ledger: ledger_rollup.checkpoint(ledger) for ledger in ledger_rollup.LEDGERS}
+
+
+def _with_ledger_balance(queryset, checkpoints):
+    return queryset.annotate(ledger_balance=ledger_balance_expression(checkpoints))
+
+
+def find_drift(business_ids: Iterable[int], checkpoints) -> List[Drift]:
+    """Wallets of ``business_ids`` whose balance differs from their ledgers (one statement)."""
+    rows = (
+        _with_ledger_balance(Wallet.objects.filter(business_id__in=list(business_ids)), checkpoints)
+        .exclude(points_balance=F("ledger_balance"))
+        .order_by("pk")
+        .values_list("pk", "customer_id", "business_id", "points_balance", "ledger_balance")
+    )
+    return [
+        Drift(*row, action=WOULD_CORRECT if row[4] >= 0 else NEGATIVE_LEDGER)
+        for row in rows
+    ]
+
+
+def apply_corrections(drift: List[Drift], checkpoints, chunk_size: int = APPLY_CHUNK_SIZE) -> List[Drift]:
+    """Lock, re-check and correct the drifted wallets; returns what was actually done per wallet."""
+    result = []
+    candidates = [d.wallet_id for d in drift if d.action == WOULD_CORRECT]
+    for start in range(0, len(candidates), chunk_size):
+        chunk = candidates[start:start + chunk_size]
+        with transaction.atomic():
+            wallets = list(
+                _with_ledger_balance(Wallet.objects.select_for_update().filter(pk__in=chunk), checkpoints).order_by("pk")
+            )
+            now = timezone.now()
+            to_update = []
+            for wallet in wallets:
+                stored = wallet.points_balance
+                if stored == wallet.ledger_balance:
+                    action = RESOLVED
+                elif wallet.ledger_balance < 0:
+                    action = NEGATIVE_LEDGER
+                else:
+                    action = CORRECTED
+                    wallet.points_balance = wallet.ledger_balance
+                    wallet.updated_at = now
+                    to_update.append(wallet)
+                result.append(Drift(wallet.pk, wallet.customer_id, wallet.business_id, stored, wallet.ledger_balance, action))
+            Wallet.objects.bulk_update(to_update, ["points_balance", "updated_at"])
+            refresh_total_balances({wallet.customer_id for wallet in to_update})
+    result.extend(d for d in drift if d.action != WOULD_CORRECT)
+    return result
+
+
+def reconcile_shard(business_ids: List[int], apply: bool, checkpoints) -> List[Drift]:
+    drift = find_drift(business_ids, checkpoints)
+    if apply and drift:
+        drift = apply_corrections(drift, checkpoints)
+    return drift
@@ -0,0 +1,47 @@
+"""
+Per-request lookups shared by the views and serializers of a request.
+
+``request_customer()`` finds the Customer of the logged-in user without creating
+one, so listing endpoints (GET) never write. ``favorite_business_ids()`` loads the
+customer's favorite business IDs once as a frozenset; ``BusinessSerializer`` uses
+it for ``is_favorite``, so a page of N businesses costs one query instead of 2N.
+
+Both results are memoised on the request object and live exactly as long as it.
+"""
+
+from __future__ import annotations
+
+from typing import FrozenSet, Optional
+
+from .models import Customer, Favorite
+
+_CUSTOMER_ATTR = "_loyalty_customer"
+_FAVORITES_ATTR = "_loyalty_favorite_business_ids"
+
+FAVORITES_CONTEXT_KEY = "favorite_business_ids"
+
+
+def request_customer(request) -> Optional[Customer]:
+    """Customer of ``request.user``, or None (anonymous, or no customer yet). Never writes."""
+    if request is None:
+        return None
+    if not hasattr(request, _CUSTOMER_ATTR):
+        user = getattr(request, "user", None)
+        customer = None
+        if user is not None and user.is_authenticated:
+            customer = Customer.objects.filter(user=user).first()
+        setattr(request, _CUSTOMER_ATTR, customer)
+    return getattr(request, _CUSTOMER_ATTR)
+
+
+def favorite_business_ids(request) -> FrozenSet[int]:
+    """IDs of the businesses the current customer has favorited (empty when there is none)."""
+    if request is None:
+        return frozenset()
+    if not hasattr(request, _FAVORITES_ATTR):
+        customer = request_customer(request)
+        ids = frozenset()
+        if customer is not None:
+            ids = frozenset(Favorite.objects.filter(customer=customer).values_list("business_id", flat=True))
+        setattr(request, _FAVORITES_ATTR, ids)
+    return getattr(request, _FAVORITES_ATTR)
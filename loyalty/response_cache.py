@@ -0,0 +1,156 @@
+"""
+Versioned cache of rendered JSON for the public menu, slider and business endpoints.
+
+Every business has a version number, and so has the "all businesses" scope used
+by the unfiltered lists. The versions are ``loyalty.cache_versions`` rows in the
+database, so every process (and the ETags built from them, see
+``loyalty.conditional``) agrees on them whatever the cache backend is. A
+response is stored in the Django cache under ``(endpoint, scope, version[,
+host])`` as the rendered JSON bytes, so a hit is one primary-key read of the
+version, one cache read and no serializer work at all.
+
+``invalidate(business_id)`` (called from the Product / Slider / Business /
+Review / QuestionRating signals) increments the business's version and the "all"
+version after the transaction commits; entries under old versions are simply
+never read again and expire after ``RESPONSE_CACHE_TTL``. No key scan is needed.
+With the default per-process cache each process renders a response once per
+version.
+
+Endpoints whose JSON contains ``build_absolute_uri`` URLs pass
+``absolute_uri=True``, which adds the request's scheme and host to the key.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from typing import Callable, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from . import cache_versions, media_cache
+
+ALL = "all"
+# Not used for stored responses: only versions the favorite counts (ETag of the business list)
+FAVORITES = "favorites"
+
+_ENTRY_KEY = "loyalty:response:{endpoint}:{scope}:{version}{variant}"
+_STATS_KEY = "loyalty:response:stats:{endpoint}:{outcome}"
+
+HIT = "hit"
+MISS = "miss"
+
+# Endpoint names used in keys and statistics
+ENDPOINTS = ("menu", "slider", "business_detail")
+
+
+def _scope_key(scope) -> str:
+    return f"response:{scope}"
+
+
+def versions(*scopes, request=None) -> tuple:
+    """
+    Current versions of ``scopes`` (business IDs, ``ALL`` or ``FAVORITES``), read in
+    one query. With ``request`` they are read once per request: the validator of
+    ``ConditionalGetMixin`` and ``cached_json`` share them.
+    """
+    memo = getattr(request, "_response_cache_versions", None) if request is not None else None
+    if memo is None:
+        memo = {}
+        if request is not None:
+            request._response_cache_versions = memo
+    missing = [scope for scope in scopes if scope not in memo]
+    if missing:
+        found = cache_versions.get_many(_scope_key(scope) for scope in missing)
+        for scope in missing:
+            memo[scope] = found[_scope_key(scope)]
+    return tuple(memo[scope] for scope in scopes)
+
+
+def version(scope, request=None) -> int:
+    """Current version of ``scope`` (a business ID, ``ALL`` or ``FAVORITES``)."""
+    return versions(scope, request=request)[0]
+
+
+def invalidate(business_id) -> None:
+    """Drop the cached responses of ``business_id`` (and the all-businesses lists) on commit."""
+    scopes = [ALL] if business_id is None else [business_id, ALL]
+    cache_versions.bump_on_commit(*(_scope_key(scope) for scope in scopes))
+
+
+def invalidate_favorites() -> None:
+    cache_versions.bump_on_commit(_scope_key(FAVORITES))
+
+
+def _count(endpoint: str, outcome: str) -> None:
+    key = _STATS_KEY.format(endpoint=endpoint, outcome=outcome)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """``{endpoint: {"hit": n, "miss": n}}`` since the last ``reset_stats()``."""
+    keys = {
+        _STATS_KEY.format(endpoint=endpoint, outcome=outcome): (endpoint, outcome)
+        for endpoint in ENDPOINTS
+        for outcome in (HIT, MISS)
+    }
+    values = cache.get_many(list(keys))
+    result = {endpoint: {HIT: 0, MISS: 0} for endpoint in ENDPOINTS}
+    for key, (endpoint, outcome) in keys.items():
+        result[endpoint][outcome] = values.get(key, 0)
+    return result
+
+
+def reset_stats() -> None:
+    cache.delete_many([
+        _STATS_KEY.format(endpoint=endpoint, outcome=outcome) for endpoint in ENDPOINTS for outcome in (HIT, MISS)
+    ])
+
+
+def _json_response(body: bytes, outcome: str) -> HttpResponse:
+    response = HttpResponse(body, content_type="application/json", status=status.HTTP_200_OK)
+    response["X-Cache"] = outcome.upper()
+    return response
+
+
+def cached_json(
+    request, endpoint: str, business_id: Optional[int], build: Callable, absolute_uri: bool = False, fields: str = ""
+):
+    """
+    The cached JSON of ``endpoint`` for ``business_id`` (None: all businesses),
+    or ``build()``'s response, stored when it is a 200.
+
+    ``build`` returns a DRF Response; errors are passed through and not cached.
+    ``fields`` names the sparse fieldset (``SparseFieldsMixin.selection_key``), if any.
+    """
+    scope = ALL if business_id is None else business_id
+    parts = []
+    if absolute_uri:
+        # Image URLs contain the host the client used, and point to /media-cache/ or the storage
+        parts.append(request.build_absolute_uri("/"))
+        parts.append("media-cache" if getattr(settings, "MEDIA_CACHE_URLS", False) else "storage")
+        parts.append(media_cache.requested_variant(request) or "")
+    if fields:
+        parts.append(fields)
+    variant = ":" + hashlib.sha1("|".join(parts).encode()).hexdigest()[:12] if parts else ""
+    key = _ENTRY_KEY.format(endpoint=endpoint, scope=scope, version=version(scope, request), variant=variant)
+
+    body = cache.get(key)
+    if body is not None:
+        _count(endpoint, HIT)
+        return _json_response(body, HIT)
+
+    _count(endpoint, MISS)
+    response = build()
+    if response.status_code != status.HTTP_200_OK:
+        return response
+    body = JSONRenderer().render(response.data)
+    cache.set(key, body, settings.RESPONSE_CACHE_TTL)
+    return _json_response(body, MISS)
@@ -0,0 +1,137 @@
+"""
+In-process index of the reward catalog (active products with ``is_reward=True``).
+
+The catalog changes rarely but every eligibility / redeemable-products request
+used to filter and count it in the database. Each process now keeps the reward
+products as sorted arrays of ``(points_reward, product_id)``, one per business
+plus one for the whole catalog, so "rewards costing at most N points" is a
+``bisect`` and a slice. Only the page of products being shown is loaded from the
+database, by primary key.
+
+Invalidation: ``Product`` post_save / post_delete (see ``loyalty.signals``) bump
+the ``reward_index`` counter of ``loyalty.cache_versions`` (a database row, so
+all processes see it) after the transaction commits. A process compares its
+index with that counter at most every ``settings.REWARD_INDEX_CHECK_INTERVAL``
+seconds and rebuilds lazily, on the next read, when it changed or the index is
+older than ``settings.REWARD_INDEX_MAX_AGE`` seconds. Code that changes products
+without signals (``bulk_create``, ``QuerySet.update``) must call
+``invalidate()`` itself; the max age bounds how long a change it missed stays
+visible.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+
+from . import cache_versions
+from .models import Product
+
+VERSION_SCOPE = "reward_index"
+
+
+def _check_interval() -> float:
+    return float(getattr(settings, "REWARD_INDEX_CHECK_INTERVAL", 2.0))
+
+
+def _max_age() -> float:
+    return float(getattr(settings, "REWARD_INDEX_MAX_AGE", 300))
+
+
+class RewardIndex:
+    """Immutable snapshot of the reward catalog ordered by ``(points_reward, id)``."""
+
+    def __init__(self, rows):
+        """``rows``: ``(business_id, points_reward, product_id)`` sorted by ``(points_reward, product_id)``."""
+        self.built_at = time.monotonic()
+        self._all: Tuple[array, array] = (array("q"), array("q"))
+        self._by_business: Dict[int, Tuple[array, array]] = {}
+        for business_id, points, product_id in rows:
+            bucket = self._by_business.get(business_id)
+            if bucket is None:
+                bucket = self._by_business[business_id] = (array("q"), array("q"))
+            for points_arr, ids_arr in (self._all, bucket):
+                points_arr.append(points)
+                ids_arr.append(product_id)
+
+    def __len__(self) -> int:
+        return len(self._all[0])
+
+    def _bucket(self, business_id: Optional[int]) -> Tuple[array, array]:
+        if business_id is None:
+            return self._all
+        return self._by_business.get(business_id) or (array("q"), array("q"))
+
+    def count(self, max_points: Optional[int] = None, business_id: Optional[int] = None) -> int:
+        """Number of rewards (optionally at one business) costing at most ``max_points``."""
+        points, _ = self._bucket(business_id)
+        return len(points) if max_points is None else bisect_right(points, max_points)
+
+    def page(
+        self,
+        offset: int,
+        limit: int,
+        max_points: Optional[int] = None,
+        business_id: Optional[int] = None,
+    ) -> List[int]:
+        """Product ids of one page, cheapest first."""
+        _, ids = self._bucket(business_id)
+        end = min(offset + limit, self.count(max_points, business_id))
+        return ids[offset:end].tolist() if offset < end else []
+
+
+_lock = threading.Lock()
+_index: Optional[RewardIndex] = None
+_index_version = None
+_checked_at = 0.0
+
+
+def build() -> RewardIndex:
+    rows = (
+        Product.objects.filter(active=True, is_reward=True)
+        .order_by("points_reward", "id")
+        .values_list("business_id", "points_reward", "id")
+        .iterator(chunk_size=5000)
+    )
+    return RewardIndex(rows)
+
+
+def get_reward_index() -> RewardIndex:
+    """This process's index, rebuilt first if another process changed the catalog."""
+    global _index, _index_version, _checked_at
+    now = time.monotonic()
+    index = _index
+    if index is not None and now - _checked_at < _check_interval():
+        return index
+
+    version = cache_versions.get(VERSION_SCOPE)
+    with _lock:
+        if _index is None or version != _index_version or now - _index.built_at > _max_age():
+            _index = build()
+            _index_version = version
+        _checked_at = now
+        return _index
+
+
+def _drop_local():
+    global _index
+    _index = None
+
+
+def invalidate():
+    """Mark the index stale in every process once the current transaction commits."""
+    cache_versions.bump_on_commit(VERSION_SCOPE)
+    # This process rebuilds on its next read, without waiting for the check interval
+    transaction.on_commit(_drop_local)
+
+
+def load_products(product_ids: List[int]) -> List[Product]:
+    """Products (with their business) in the order of ``product_ids``; ids deleted meanwhile are skipped."""
+    by_id = Product.objects.select_related("business").in_bulk(product_ids)
+    return [by_id[pk] for pk in product_ids if pk in by_id]
@@ -0,0 +1,234 @@
+"""
+Full-text search over businesses, products and services.
+
+Every searchable object has one ``SearchDocument`` row (``title`` + ``body``),
+written by the post_save / post_delete signals through ``index()`` / ``remove()``.
+The documents are indexed by the database itself:
+
+* PostgreSQL: generated ``search_vector`` tsvector column (title weight A, body
+  weight B, ``simple`` configuration) with a GIN index; ranked by ``ts_rank``.
+* SQLite: FTS5 table ``loyalty_searchdocument_fts`` (external content, kept in
+  sync by triggers); ranked by ``bm25`` with the title weighted 10:1.
+* anything else, or SQLite without FTS5: ``LIKE`` over the documents, unranked.
+
+Each query term matches as a prefix ("caf" finds "Cafe") and all terms must
+match. ``search()`` returns one page of one kind ordered by ``(score, id)``
+descending, continuing after a ``Hit`` for keyset pagination; ``counts()`` returns
+the matches of every kind in one query. Bulk writes send no signals; run
+``python manage.py rebuild_search_index`` after them.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+from django.apps import apps
+from django.db import connection
+from django.db.models import Count, Q
+
+from .models import Business, Product, SearchDocument
+
+Kind = SearchDocument.Kind
+KINDS = (Kind.BUSINESS, Kind.PRODUCT, Kind.SERVICE)
+
+FTS_TABLE = "loyalty_searchdocument_fts"
+MAX_TERMS = 8
+# Source fields a document is built from; saves with other update_fields skip indexing
+INDEXED_FIELDS = frozenset({"name", "description", "address", "title", "active", "is_active"})
+REBUILD_BATCH_SIZE = 2000
+
+_TERM = re.compile(r"[^\W_]+")
+_fts5_available = None
+
+
+class Hit(NamedTuple):
+    kind: str
+    object_id: int
+    score: float
+    doc_id: int
+
+
+# -- indexing -----------------------------------------------------------------
+
+def _service_model():
+    return apps.get_model("reviews", "Service")
+
+
+def document_fields(instance) -> Optional[tuple]:
+    """``(kind, title, body)`` for a searchable instance, None if it should not be found."""
+    if isinstance(instance, Business):
+        body = "\n".join(part for part in (instance.description, instance.address) if part)
+        return Kind.BUSINESS, instance.name, body
+    if isinstance(instance, Product):
+        return (Kind.PRODUCT, instance.title, "") if instance.active else None
+    if isinstance(instance, _service_model()):
+        return (Kind.SERVICE, instance.name, instance.description or "") if instance.is_active else None
+    raise TypeError(f"{type(instance).__name__} is not searchable")
+
+
+def document_kind(model) -> str:
+    if issubclass(model, Business):
+        return Kind.BUSINESS
+    if issubclass(model, Product):
+        return Kind.PRODUCT
+    if issubclass(model, _service_model()):
+        return Kind.SERVICE
+    raise TypeError(f"{model.__name__} is not searchable")
+
+
+def index(instance) -> None:
+    """Create, update or (for inactive objects) delete the instance's document."""
+    fields = document_fields(instance)
+    if fields is None:
+        remove(document_kind(type(instance)), instance.pk)
+        return
+    kind, title, body = fields
+    SearchDocument.objects.update_or_create(
+        kind=kind, object_id=instance.pk, defaults={"title": title[:255], "body": body}
+    )
+
+
+def remove(kind: str, object_id: int) -> None:
+    SearchDocument.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild() -> int:
+    """Recreate every document from the source tables; returns the number written."""
+    SearchDocument.objects.all().delete()
+    sources = (
+        Business.objects.only("name", "description", "address"),
+        Product.objects.filter(active=True).only("title", "active"),
+        _service_model().objects.filter(is_active=True).only("name", "description", "is_active"),
+    )
+    written = 0
+    for queryset in sources:
+        batch = []
+        for instance in queryset.order_by("pk").iterator(chunk_size=REBUILD_BATCH_SIZE):
+            kind, title, body = document_fields(instance)
+            batch.append(SearchDocument(kind=kind, object_id=instance.pk, title=title[:255], body=body))
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                SearchDocument.objects.bulk_create(batch)
+                written += len(batch)
+                batch = []
+        SearchDocument.objects.bulk_create(batch)
+        written += len(batch)
+    return written
+
+
+# -- querying -----------------------------------------------------------------
+
+def parse_terms(query: str) -> List[str]:
+    """Lower-cased word terms of a user query (punctuation and operators dropped)."""
+    return _TERM.findall(query.lower())[:MAX_TERMS]
+
+
+def backend() -> str:
+    """"postgresql", "sqlite" (FTS5) or "like"."""
+    global _fts5_available
+    if connection.vendor == "postgresql":
+        return "postgresql"
+    if connection.vendor == "sqlite":
+        if _fts5_available is None:
+            _fts5_available = FTS_TABLE in connection.introspection.table_names()
+        if _fts5_available:
+            return "sqlite"
+    return "like"
+
+
+def _pg_query(terms):
+    return " & ".join(f"{term}:*" for term in terms)
+
+
+def _fts5_query(terms):
+    return " AND ".join(f'"{term}"*' for term in terms)
+
+
+def _ranked_sql(engine: str, terms) -> tuple:
+    """``(sql, params)`` of a subquery with columns id, kind, object_id, score over the matches."""
+    table = SearchDocument._meta.db_table
+    if engine == "postgresql":
+        return (
+            f"SELECT d.id, d.kind, d.object_id, ts_rank(d.search_vector, q) AS score "
+            f"FROM {table} d, to_tsquery('simple', %s) q WHERE d.search_vector @@ q",
+            [_pg_query(terms)],
+        )
+    # bm25() is lower for better matches; negate it so both backends sort score descending
+    return (
+        f"SELECT d.id, d.kind, d.object_id, -bm25({FTS_TABLE}, 10.0, 1.0) AS score "
+        f"FROM {FTS_TABLE} JOIN {table} d ON d.id = {FTS_TABLE}.rowid WHERE {FTS_TABLE} MATCH %s",
+        [_fts5_query(terms)],
+    )
+
+
+def _like_queryset(terms):
+    queryset = SearchDocument.objects.all()
+    for term in terms:
+        queryset = queryset.filter(Q(title__icontains=term) | Q(body__icontains=term))
+    return queryset
+
+
+def search(query: str, kind: str, limit: int, after: Optional[Hit] = None) -> List[Hit]:
+    """Up to ``limit`` best matches of ``kind``, after ``after`` when continuing a listing."""
+    terms = parse_terms(query)
+    if not terms:
+        return []
+    engine = backend()
+    if engine == "like":
+        queryset = _like_queryset(terms).filter(kind=kind)
+        if after is not None:
+            queryset = queryset.filter(id__lt=after.doc_id)
+        rows = queryset.order_by("-id").values_list("kind", "object_id", "id")[:limit]
+        return [Hit(k, object_id, 0.0, doc_id) for k, object_id, doc_id in rows]
+
+    sql, params = _ranked_sql(engine, terms)
+    sql = f"SELECT kind, object_id, score, id FROM ({sql}) m WHERE kind = %s"
+    params = [*params, kind]
+    if after is not None:
+        sql += " AND (score < %s OR (score = %s AND id < %s))"
+        params += [after.score, after.score, after.doc_id]
+    sql += " ORDER BY score DESC, id DESC LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [Hit(*row) for row in cursor.fetchall()]
+
+
+def counts(query: str) -> Dict[str, int]:
+    """``{kind: matches}`` for every kind, in one query."""
+    result = {kind: 0 for kind in KINDS}
+    terms = parse_terms(query)
+    if not terms:
+        return result
+    engine = backend()
+    if engine == "like":
+        rows = _like_queryset(terms).order_by().values_list("kind").annotate(n=Count("id"))
+    else:
+        sql, params = _ranked_sql(engine, terms)
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT kind, COUNT(*) FROM ({sql}) m GROUP BY kind", params)
+            rows = cursor.fetchall()
+    for kind, n in rows:
+        result[kind] = n
+    return result
+
+
+# -- cursors ------------------------------------------------------------------
+
+def encode_cursor(hit: Hit) -> str:
+    raw = json.dumps([hit.kind, hit.score, hit.doc_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Hit:
+    """The ``Hit`` a listing continues after; raises ValueError for anything that is not one of our cursors."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        kind, score, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if kind not in KINDS:
+            raise ValueError(kind)
+        return Hit(kind, 0, float(score), int(doc_id))
+    except (TypeError, UnicodeError, ValueError) as exc:
+        raise ValueError("invalid cursor") from exc
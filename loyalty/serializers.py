@@ -1,9 +1,80 @@
+from typing import FrozenSet, Optional
+
 from django.contrib.auth.models import User
-from django.db.models import Avg
 from rest_framework import serializers
 
-from reviews.models import Review, QuestionRating
-from .models import Business, Product, Customer, Wallet, Transaction, Slider, Favorite
+from . import media_cache
+from .models import Business, Product, Customer, Wallet, Transaction, Slider
+from .request_context import FAVORITES_CONTEXT_KEY, favorite_business_ids
+
+# Context key: False renders every field whatever the request asks for
+SPARSE_FIELDS_CONTEXT_KEY = "sparse_fields"
+COMPACT = "compact"
+
+
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets from the request: ``?fields=id,name`` renders only those
+    fields, ``?omit=description`` all but those, and ``fields=compact`` (which may
+    be combined, e.g. ``fields=compact,phone``) expands to ``COMPACT_FIELDS``, the
+    preset for list screens. Unknown names are ignored.
+
+    Fields that are not rendered are never evaluated, so their
+    ``SerializerMethodField`` (and any query it makes) is skipped. Only the
+    top-level serializer (or the child of a top-level ``many=True``) is affected;
+    nested serializers and contexts with ``sparse_fields=False`` render everything.
+    """
+    COMPACT_FIELDS: tuple = ()
+
+    @classmethod
+    def selected_fields(cls, request) -> Optional[FrozenSet[str]]:
+        """Field names rendered for ``request``; None means all of them."""
+        params = getattr(request, "query_params", None)
+        if params is None:
+            return None
+        requested, omitted = params.get("fields"), params.get("omit")
+        if not requested and not omitted:
+            return None
+        available = set(cls.Meta.fields)
+        selected = set(available)
+        if requested:
+            names = {name.strip() for name in requested.split(",")}
+            if COMPACT in names:
+                names.update(cls.COMPACT_FIELDS)
+            selected &= names
+        if omitted:
+            selected -= {name.strip() for name in omitted.split(",")}
+        return frozenset(selected)
+
+    @classmethod
+    def renders(cls, request, name: str) -> bool:
+        """Whether ``name`` is rendered for ``request``; views use it to skip unneeded joins."""
+        selected = cls.selected_fields(request)
+        return selected is None or name in selected
+
+    @classmethod
+    def selection_key(cls, request) -> str:
+        """Stable text of the selection for cache keys ("" when every field is rendered)."""
+        selected = cls.selected_fields(request)
+        return "" if selected is None else ",".join(sorted(selected))
+
+    def _selection(self) -> Optional[FrozenSet[str]]:
+        if not hasattr(self, "_sparse_selection"):
+            parent = self.parent
+            if isinstance(parent, serializers.ListSerializer):
+                parent = parent.parent
+            selected = None
+            if parent is None and self.context.get(SPARSE_FIELDS_CONTEXT_KEY, True):
+                selected = self.selected_fields(self.context.get("request"))
+            self._sparse_selection = selected
+        return self._sparse_selection
+
+    @property
+    def _readable_fields(self):
+        selected = self._selection()
+        for field in super()._readable_fields:
+            if selected is None or field.field_name in selected:
+                yield field
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -12,7 +83,9 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "first_name", "last_name"]
 
 
-class BusinessSerializer(serializers.ModelSerializer):
+class BusinessSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    COMPACT_FIELDS = ("id", "slug", "name", "address", "average_rating", "review_count")
+
     average_rating = serializers.SerializerMethodField()
     review_count = serializers.SerializerMethodField()
     slug = serializers.CharField(read_only=True)
@@ -27,6 +100,8 @@ class BusinessSerializer(serializers.ModelSerializer):
             "name",
             "description",
             "address",
+            "latitude",
+            "longitude",
             "website",
             "phone",
             "average_rating",
@@ -36,22 +111,14 @@ class BusinessSerializer(serializers.ModelSerializer):
         ]
 
     def get_average_rating(self, obj):
-        avg = getattr(obj, "average_rating_value", None) or getattr(obj, "average_rating", None)
-        if avg is not None:
-            return round(float(avg), 2)
-        # Fallback 1: classic reviews approved
-        result = obj.reviews.filter(status=Review.Status.APPROVED).aggregate(avg=Avg("rating")).get("avg")
-        if result is not None:
-            return round(float(result), 2)
-        # Fallback 2: question-based ratings average
-        qr_avg = QuestionRating.objects.filter(business=obj).aggregate(avg=Avg("rating")).get("avg")
-        return round(float(qr_avg), 2) if qr_avg is not None else None
+        # Approved reviews, else question-based ratings (precomputed columns, no query)
+        avg = obj.average_rating
+        if avg is None:
+            avg = obj.question_rating_average
+        return round(float(avg), 2) if avg is not None else None
 
     def get_review_count(self, obj):
-        count = getattr(obj, "review_count_value", None)
-        if count is not None:
-            return count
-        return obj.reviews.filter(status=Review.Status.APPROVED).count()
+        return obj.rating_count
 
     def get_favorites_count(self, obj):
         try:
@@ -63,14 +130,13 @@ class BusinessSerializer(serializers.ModelSerializer):
             return 0
 
     def get_is_favorite(self, obj):
-        request = self.context.get("request")
-        if not request or not getattr(request, "user", None) or not request.user.is_authenticated:
-            return False
-        try:
-            customer, _ = Customer.objects.get_or_create(user=request.user)
-            return Favorite.objects.filter(customer=customer, business=obj).exists()
-        except Exception:
-            return False
+        # A view may pass the set itself; otherwise it is loaded once per request
+        # (the context dict is shared by every item of a list and by nested serializers)
+        ids = self.context.get(FAVORITES_CONTEXT_KEY)
+        if ids is None:
+            ids = favorite_business_ids(self.context.get("request"))
+            self.context[FAVORITES_CONTEXT_KEY] = ids
+        return obj.id in ids
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -101,8 +167,10 @@ class TransactionSerializer(serializers.ModelSerializer):
         fields = ["id", "wallet", "amount", "created_at", "note"]
 
 
-class SliderSerializer(serializers.ModelSerializer):
+class SliderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for Slider - returns image, store, address, description, business_id, stars"""
+    COMPACT_FIELDS = ("image", "store", "business_id")
+
     image = serializers.SerializerMethodField()
     business_id = serializers.IntegerField(source='business.id', read_only=True)
     stars = serializers.SerializerMethodField()
@@ -113,38 +181,27 @@ class SliderSerializer(serializers.ModelSerializer):
         fields = ["image", "store", "address", "description", "business_id", "stars", "reviews_count"]
     
     def get_image(self, obj):
-        """Return full URL for image"""
-        if obj.image:
-            request = self.context.get('request')
-            if request:
-                return request.build_absolute_uri(obj.image.url)
-            return obj.image.url
-        return None
+        """Return full URL for image (from the image cache, see loyalty.media_cache)"""
+        return media_cache.image_url(self.context.get('request'), obj)
 
     def get_stars(self, obj):
         """Average star rating (0-5) for the slider's business; fallback to question ratings."""
-        try:
-            if not obj.business:
-                return 0.0
-            avg = obj.business.reviews.filter(status=Review.Status.APPROVED).aggregate(avg=Avg("rating")).get("avg")
-            if avg is not None:
-                return round(float(avg), 2)
-            qr_avg = QuestionRating.objects.filter(business=obj.business).aggregate(avg=Avg("rating")).get("avg")
-            return round(float(qr_avg), 2) if qr_avg is not None else 0.0
-        except Exception as e:
+        business = obj.business
+        if not business:
             return 0.0
+        avg = business.average_rating
+        if avg is None:
+            avg = business.question_rating_average
+        return round(float(avg), 2) if avg is not None else 0.0
 
     def get_reviews_count(self, obj):
-        try:
-            if not obj.business:
-                return 0
-            return obj.business.reviews.filter(status=Review.Status.APPROVED).count()
-        except Exception as e:
-            return 0
+        return obj.business.rating_count if obj.business else 0
 
 
-class MenuProductSerializer(serializers.ModelSerializer):
+class MenuProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for Menu Products - returns id, title, description, image, price, reward, point, stars"""
+    COMPACT_FIELDS = ("id", "title", "image", "price", "point", "is_reward")
+
     id = serializers.SerializerMethodField()
     title = serializers.CharField(read_only=True)
     description = serializers.CharField(read_only=True)
@@ -181,36 +238,18 @@ class MenuProductSerializer(serializers.ModelSerializer):
         return str(obj.points_reward)
     
     def get_image(self, obj):
-        """Return full URL for image"""
-        try:
-            if obj.image and hasattr(obj.image, 'url'):
-                request = self.context.get('request')
-                if request:
-                    return request.build_absolute_uri(obj.image.url)
-                return obj.image.url
-        except Exception:
-            pass
-        return None
+        """Return full URL for image (from the image cache, see loyalty.media_cache)"""
+        return media_cache.image_url(self.context.get('request'), obj)
 
     def get_stars(self, obj):
         """Average star rating (0-5). Prefer product reviews; fallback to business question ratings."""
-        try:
-            avg = Review.objects.filter(product=obj, status=Review.Status.APPROVED).aggregate(avg=Avg("rating")).get("avg")
-            if avg is not None:
-                return round(float(avg), 2)
-            qr_avg = QuestionRating.objects.filter(business=obj.business).aggregate(avg=Avg("rating")).get("avg")
-            return round(float(qr_avg), 2) if qr_avg is not None else 0.0
-        except Exception:
-            return 0.0
+        avg = obj.average_rating
+        if avg is None:
+            avg = obj.business.question_rating_average
+        return round(float(avg), 2) if avg is not None else 0.0
 
     def get_reviews_count(self, obj):
-        try:
-            count = Review.objects.filter(product=obj, status=Review.Status.APPROVED).count()
-            if count:
-                return count
-            return QuestionRating.objects.filter(business=obj.business).count()
-        except Exception:
-            return 0
+        return obj.rating_count or obj.business.question_rating_count
 
 
 class BusinessManagementSerializer(serializers.ModelSerializer):
@@ -225,15 +264,8 @@ class BusinessManagementSerializer(serializers.ModelSerializer):
     def get_restaurant_images(self, obj):
         """Return list of restaurant images (sliders) for this business"""
         sliders = obj.sliders.filter(is_active=True).order_by('order', '-created_at')
-        images = []
-        for slider in sliders:
-            if slider.image:
-                request = self.context.get('request')
-                if request:
-                    images.append(request.build_absolute_uri(slider.image.url))
-                else:
-                    images.append(slider.image.url)
-        return images
+        request = self.context.get('request')
+        return [media_cache.image_url(request, slider) for slider in sliders if slider.image]
     
     def update(self, instance, validated_data):
         """Update business fields"""
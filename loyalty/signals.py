@@ -3,42 +3,48 @@ Signal handlers for automatic image caching
 این signal ها به صورت خودکار تصاویر را در کش ذخیره می‌کنند
 """
 
-from django.db.models.signals import post_save, pre_delete
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
-from .models import Product, Slider, ImageCache
+from .models import Business, Favorite, Product, Slider, ImageCache, Wallet
 from .image_cache import ImageCacheManager
+from . import image_store, points_summary, response_cache, reward_index, search, suggest_index
+
+
+def _enqueue_image_cache(instance, update_fields):
+    """کش کردن تصویر در پس‌زمینه (run_worker)؛ ذخیره‌ی مدل منتظر خواندن فایل نمی‌ماند"""
+    if not instance.image:
+        return
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    try:
+        ImageCacheManager.enqueue(instance, image_field_name='image')
+    except Exception as e:
+        # در صورت خطا، لاگ می‌کنیم اما خطا را بالا نمی‌فرستیم
+        print(f"خطا در صف کردن کش تصویر {instance._meta.model_name} ID {instance.id}: {e}")
 
 
 @receiver(post_save, sender=Product)
-def cache_product_image(sender, instance, created, **kwargs):
-    """کش کردن تصویر Product بعد از ذخیره"""
-    if instance.image:
-        try:
-            ImageCacheManager.cache_image(instance, image_field_name='image')
-        except Exception as e:
-            # در صورت خطا، لاگ می‌کنیم اما خطا را بالا نمی‌فرستیم
-            print(f"خطا در کش کردن تصویر Product ID {instance.id}: {e}")
+def cache_product_image(sender, instance, created, update_fields=None, **kwargs):
+    """کش کردن تصویر Product بعد از ذخیره (در صف job ها)"""
+    _enqueue_image_cache(instance, update_fields)
 
 
 @receiver(post_save, sender=Slider)
-def cache_slider_image(sender, instance, created, **kwargs):
-    """کش کردن تصویر Slider بعد از ذخیره"""
-    if instance.image:
-        try:
-            ImageCacheManager.cache_image(instance, image_field_name='image')
-        except Exception as e:
-            # در صورت خطا، لاگ می‌کنیم اما خطا را بالا نمی‌فرستیم
-            print(f"خطا در کش کردن تصویر Slider ID {instance.id}: {e}")
+def cache_slider_image(sender, instance, created, update_fields=None, **kwargs):
+    """کش کردن تصویر Slider بعد از ذخیره (در صف job ها)"""
+    _enqueue_image_cache(instance, update_fields)
 
 
 @receiver(pre_delete, sender=Product)
 def cleanup_product_image_cache(sender, instance, **kwargs):
     """پاک کردن کش تصویر Product قبل از حذف"""
     try:
-        ImageCache.objects.filter(
-            content_type='loyalty.product',
-            object_id=instance.pk
-        ).delete()
+        caches = ImageCache.objects.filter(content_type='loyalty.product', object_id=instance.pk)
+        blobs = list(caches.values_list("blob_id", flat=True))
+        caches.delete()
+        # blob هایی که دیگر هیچ ردیفی به آن‌ها اشاره نمی‌کند
+        transaction.on_commit(lambda: image_store.collect_garbage(blobs))
     except Exception:
         pass
 
@@ -47,10 +53,68 @@ def cleanup_product_image_cache(sender, instance, **kwargs):
 def cleanup_slider_image_cache(sender, instance, **kwargs):
     """پاک کردن کش تصویر Slider قبل از حذف"""
     try:
-        ImageCache.objects.filter(
-            content_type='loyalty.slider',
-            object_id=instance.pk
-        ).delete()
+        caches = ImageCache.objects.filter(content_type='loyalty.slider', object_id=instance.pk)
+        blobs = list(caches.values_list("blob_id", flat=True))
+        caches.delete()
+        # blob هایی که دیگر هیچ ردیفی به آن‌ها اشاره نمی‌کند
+        transaction.on_commit(lambda: image_store.collect_garbage(blobs))
     except Exception:
         pass
 
+
+@receiver(post_save, sender=Wallet)
+def track_wallet_created(sender, instance, created, **kwargs):
+    """Keep CustomerPointsSummary.wallet_count/total_balance in step with new wallets"""
+    if created:
+        points_summary.record_wallet_created(instance.customer_id, instance.points_balance or 0)
+
+
+@receiver(post_delete, sender=Wallet)
+def track_wallet_deleted(sender, instance, **kwargs):
+    points_summary.record_wallet_deleted(instance.customer_id, instance.points_balance or 0)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_reward_index(sender, instance, **kwargs):
+    """Rebuild the in-process reward catalog index after a product change"""
+    reward_index.invalidate()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Slider)
+@receiver(post_delete, sender=Slider)
+def invalidate_business_responses(sender, instance, **kwargs):
+    """New version for the business's cached menu / slider responses"""
+    response_cache.invalidate(instance.business_id)
+
+
+@receiver(post_save, sender=Business)
+@receiver(post_delete, sender=Business)
+def invalidate_business_detail(sender, instance, **kwargs):
+    response_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+def invalidate_favorites(sender, instance, **kwargs):
+    """favorites_count / is_favorite in the business list changed (its ETag)"""
+    response_cache.invalidate_favorites()
+
+
+@receiver(post_save, sender=Business)
+@receiver(post_save, sender=Product)
+def index_search_document(sender, instance, update_fields=None, **kwargs):
+    """Keep the SearchDocument and the suggest index of the business / product in step"""
+    if update_fields is None or search.INDEXED_FIELDS.intersection(update_fields):
+        search.index(instance)
+    if update_fields is None or suggest_index.NAME_FIELDS.intersection(update_fields):
+        suggest_index.invalidate()
+
+
+@receiver(post_delete, sender=Business)
+@receiver(post_delete, sender=Product)
+def remove_search_document(sender, instance, **kwargs):
+    search.remove(search.document_kind(sender), instance.pk)
+    suggest_index.invalidate()
@@ -0,0 +1,237 @@
+"""
+In-process prefix index for search-as-you-type (``/api/v1/search/suggest/``).
+
+Every business, active product and active service name is normalized (lower
+case, umlauts folded, other accents stripped) and stored once per word start,
+so "mül", "muel" and "mul" all find "Café Müller" and so does "caf". The keys
+live in one sorted list; a query is a ``bisect`` over it. Top-k by popularity
+(favorites + wallets of the business; products and services inherit it) is
+precomputed for every prefix that matches more than ``SCAN_LIMIT`` keys; any other
+prefix selects from its (small) range directly.
+Answers are prebuilt dicts, so a lookup touches neither the database nor a
+serializer.
+
+Freshness: Business / Product / Service signals bump the ``suggest_index``
+counter of ``loyalty.cache_versions`` (a database row, shared by every process)
+after commit (see ``loyalty.signals``). A process compares its index with the
+counter at most every ``settings.SUGGEST_INDEX_CHECK_INTERVAL`` seconds,
+and popularity is refreshed after ``settings.SUGGEST_INDEX_MAX_AGE`` seconds. A
+stale index is rebuilt in a background thread while requests keep using the
+previous snapshot; only the very first lookup in a process waits for a build.
+"""
+
+from __future__ import annotations
+
+import heapq
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.apps import apps
+from django.db import connections
+from django.db.models import Count
+
+from . import cache_versions
+from .models import Business, Product, SearchDocument
+
+VERSION_SCOPE = "suggest_index"
+
+Kind = SearchDocument.Kind
+
+# Prefixes matching more keys than this have their best entries precomputed
+SCAN_LIMIT = 128
+MAX_RESULTS = 20
+NAME_FIELDS = frozenset({"name", "title", "active", "is_active"})
+
+_GERMAN = str.maketrans({"ä": "ae", "ö": "oe", "ü": "ue", "ß": "ss"})
+_GERMAN_SHORT = str.maketrans({"ä": "a", "ö": "o", "ü": "u", "ß": "ss"})
+# Key suffix that sorts after every other character of the same prefix
+_HIGH = "\U0010ffff"
+
+
+def _strip_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def _words(text: str) -> str:
+    return " ".join("".join(ch if ch.isalnum() else " " for ch in text).split())
+
+
+def normalize(text: str) -> str:
+    """Lower case, ä/ö/ü/ß -> ae/oe/ue/ss, other accents removed, punctuation -> spaces."""
+    return _words(_strip_accents(text.casefold().translate(_GERMAN)))
+
+
+def _spellings(text: str) -> set:
+    """The normalized spellings of a name: "Müller" -> {"mueller", "muller"}."""
+    lowered = unicodedata.normalize("NFC", text.casefold())
+    return {
+        _words(_strip_accents(lowered.translate(_GERMAN))),
+        _words(_strip_accents(lowered.translate(_GERMAN_SHORT))),
+    }
+
+
+class SuggestIndex:
+    """
+    Immutable snapshot: sorted ``(key, entry)`` pairs, plus the best entries of
+    every prefix that matches more than ``SCAN_LIMIT`` keys (a prefix trie pruned
+    at small ranges); smaller ranges are scanned.
+    """
+
+    def __init__(self, entries: List[Tuple[dict, int]]):
+        """``entries``: ``(payload, popularity)``; the payload is returned as is."""
+        self.built_at = time.monotonic()
+        self._payloads = [payload for payload, _ in entries]
+        self._kinds = [payload["type"] for payload in self._payloads]
+        # Rank: more popular first, then shorter, then alphabetical
+        order = sorted(
+            range(len(entries)),
+            key=lambda i: (-entries[i][1], len(entries[i][0]["name"]), entries[i][0]["name"].casefold()),
+        )
+        self._rank = [0] * len(entries)
+        for rank, i in enumerate(order):
+            self._rank[i] = rank
+
+        pairs = set()
+        for i, (payload, _) in enumerate(entries):
+            for spelling in _spellings(payload["name"]):
+                words = spelling.split(" ")
+                for start in range(len(words)):
+                    pairs.add((" ".join(words[start:]), i))
+        pairs = sorted(pairs)
+        self._keys = [key for key, _ in pairs]
+        self._entries = [i for _, i in pairs]
+
+        # (prefix, type or None) -> best entries, for prefixes with large ranges
+        self._top: Dict[Tuple[str, Optional[str]], List[int]] = {}
+        self._collect("", 0, len(self._keys))
+
+    def __len__(self) -> int:
+        return len(self._payloads)
+
+    def _best(self, members, kind: Optional[str], limit: int) -> List[int]:
+        if kind is not None:
+            members = [i for i in members if self._kinds[i] == kind]
+        return heapq.nsmallest(limit, set(members), key=self._rank.__getitem__)
+
+    def _collect(self, prefix: str, start: int, end: int) -> Dict[Optional[str], List[int]]:
+        """Best entries per type of ``keys[start:end]`` (all starting with ``prefix``); stored if the range is large."""
+        if end - start <= SCAN_LIMIT:
+            members = self._entries[start:end]
+            return {kind: self._best(members, kind, MAX_RESULTS) for kind in (None, *Kind.values)}
+
+        depth = len(prefix)
+        candidates = []
+        position = start
+        while position < end:
+            key = self._keys[position]
+            if len(key) == depth:
+                # Keys equal to the prefix sort first
+                stop = bisect_right(self._keys, prefix, position, end)
+                candidates.extend(self._entries[position:stop])
+            else:
+                child = prefix + key[depth]
+                stop = bisect_left(self._keys, child + _HIGH, position, end)
+                for best in self._collect(child, position, stop).values():
+                    candidates.extend(best)
+            position = stop
+
+        top = {kind: self._best(candidates, kind, MAX_RESULTS) for kind in (None, *Kind.values)}
+        for kind, best in top.items():
+            self._top[prefix, kind] = best
+        return top
+
+    def lookup(self, query: str, limit: int = 8, kind: Optional[str] = None) -> List[dict]:
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        limit = max(1, min(limit, MAX_RESULTS))
+        start = bisect_left(self._keys, prefix)
+        end = bisect_left(self._keys, prefix + _HIGH, start)
+        if end - start > SCAN_LIMIT:
+            candidates = self._top[prefix, kind][:limit]
+        else:
+            candidates = self._best(self._entries[start:end], kind, limit)
+        return [self._payloads[i] for i in candidates]
+
+
+_lock = threading.Lock()
+_index: Optional[SuggestIndex] = None
+_index_version = None
+_checked_at = 0.0
+_building = False
+
+
+def _check_interval() -> float:
+    return float(getattr(settings, "SUGGEST_INDEX_CHECK_INTERVAL", 2.0))
+
+
+def _max_age() -> float:
+    return float(getattr(settings, "SUGGEST_INDEX_MAX_AGE", 900))
+
+
+def build() -> SuggestIndex:
+    businesses = {
+        pk: (name, favorites + wallets)
+        for pk, name, favorites, wallets in Business.objects.annotate(
+            favorites_n=Count("favorites", distinct=True),
+            wallets_n=Count("wallets", distinct=True),
+        ).values_list("pk", "name", "favorites_n", "wallets_n").iterator(chunk_size=5000)
+    }
+    entries = [
+        ({"type": Kind.BUSINESS.value, "id": pk, "name": name, "business_id": pk, "business_name": name}, popularity)
+        for pk, (name, popularity) in businesses.items()
+    ]
+    Service = apps.get_model("reviews", "Service")
+    for model, kind, name_field, active in (
+        (Product, Kind.PRODUCT, "title", {"active": True}),
+        (Service, Kind.SERVICE, "name", {"is_active": True}),
+    ):
+        rows = model.objects.filter(**active).values_list("pk", name_field, "business_id").iterator(chunk_size=5000)
+        for pk, name, business_id in rows:
+            business_name, popularity = businesses.get(business_id, ("", 0))
+            payload = {"type": kind.value, "id": pk, "name": name, "business_id": business_id, "business_name": business_name}
+            entries.append((payload, popularity))
+    return SuggestIndex(entries)
+
+
+def _rebuild(version) -> None:
+    global _index, _index_version, _building
+    try:
+        index = build()
+        with _lock:
+            _index, _index_version = index, version
+    finally:
+        _building = False
+        # The thread's own database connection
+        connections.close_all()
+
+
+def get_suggest_index() -> SuggestIndex:
+    """This process's index; a stale one is replaced in the background."""
+    global _index, _index_version, _checked_at, _building
+    now = time.monotonic()
+    index = _index
+    if index is not None and now - _checked_at < _check_interval():
+        return index
+
+    version = cache_versions.get(VERSION_SCOPE)
+    with _lock:
+        _checked_at = now
+        if _index is None:
+            _index, _index_version = build(), version
+            return _index
+        stale = version != _index_version or now - _index.built_at > _max_age()
+        if stale and not _building:
+            _building = True
+            threading.Thread(target=_rebuild, args=(version,), name="suggest-index", daemon=True).start()
+        return _index
+
+
+def invalidate():
+    """Mark the index stale in every process once the current transaction commits."""
+    cache_versions.bump_on_commit(VERSION_SCOPE)
@@ -0,0 +1,32 @@
+"""Small model factories shared by the loyalty tests."""
+import itertools
+
+from django.contrib.auth.models import User
+
+from loyalty.models import Business, Customer, Product, Wallet
+
+_seq = itertools.count(1)
+
+
+def user(prefix="user", **fields):
+    return User.objects.create_user(f"{prefix}{next(_seq)}", **fields)
+
+
+def business(owner=None, **fields):
+    fields.setdefault("name", f"Business {next(_seq)}")
+    return Business.objects.create(owner=owner or user("owner"), **fields)
+
+
+def customer(**fields):
+    return Customer.objects.create(user=user("customer"), **fields)
+
+
+def wallet(customer_obj=None, business_obj=None, points=0, **fields):
+    return Wallet.objects.create(
+        customer=customer_obj or customer(), business=business_obj or business(), points_balance=points, **fields
+    )
+
+
+def product(business_obj=None, **fields):
+    fields.setdefault("title", f"Product {next(_seq)}")
+    return Product.objects.create(business=business_obj or business(), **fields)
@@ -0,0 +1,27 @@
+"""Statement capture for the query-budget tests."""
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# SQLite logs BEGIN/COMMIT (SAVEPOINT/RELEASE SAVEPOINT inside a TestCase) as
+# statements, PostgreSQL does not; budgets only count real work.
+TRANSACTION_CONTROL = ("BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE SAVEPOINT")
+WRITES = ("INSERT", "UPDATE", "DELETE")
+
+
+def _starts_with(sql, keywords):
+    return sql.lstrip().upper().startswith(keywords)
+
+
+class CaptureStatements(CaptureQueriesContext):
+    """``CaptureQueriesContext`` on the default connection, without transaction control."""
+
+    def __init__(self, conn=connection):
+        super().__init__(conn)
+
+    @property
+    def statements(self):
+        return [q["sql"] for q in self.captured_queries if not _starts_with(q["sql"], TRANSACTION_CONTROL)]
+
+    @property
+    def writes(self):
+        return [sql for sql in self.statements if _starts_with(sql, WRITES)]
@@ -0,0 +1,94 @@
+import itertools
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from config import batch
+from loyalty import views
+
+from . import factories
+
+URL = "/api/v1/batch/"
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = factories.customer()
+        self.business = factories.business()
+        factories.wallet(self.customer, self.business, points=7)
+        self.detail = f"/api/v1/businesses/{self.business.pk}/"
+        self.count = f"/api/v1/favorites/count/?business_id={self.business.pk}"
+
+    def batch(self, paths, **headers):
+        return self.client.post(URL, {"paths": paths}, format="json", headers=headers)
+
+    def login(self):
+        token = RefreshToken.for_user(self.customer.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_list_and_dict_forms(self):
+        response = self.batch([self.detail, self.count])
+        self.assertEqual(response.status_code, 200)
+        items = response.data["responses"]
+        self.assertEqual(list(items), [self.detail, self.count])
+        self.assertEqual(items[self.detail]["status"], 200)
+        self.assertIn("ETag", items[self.detail]["headers"])
+        self.assertEqual((items[self.count]["status"], items[self.count]["body"]["business_id"]), (200, self.business.pk))
+
+        response = self.batch({"detail": self.detail, "missing": "/api/v1/businesses/0/"})
+        items = response.data["responses"]
+        self.assertEqual((items["detail"]["status"], items["missing"]["status"]), (200, 404))
+
+    @override_settings(BATCH_MAX_ITEMS=2)
+    def test_item_limits(self):
+        # The list form is keyed by path, so a repeated path counts once
+        self.assertEqual(self.batch([self.detail, self.detail, self.count]).status_code, 200)
+        for paths in ([], {}, [self.detail, self.count, "/api/v1/wallet/"], "/api/v1/", [1]):
+            with self.subTest(paths=paths):
+                self.assertEqual(self.batch(paths).status_code, 400)
+
+    def test_rejected_paths(self):
+        paths = {
+            "outside": "/admin/",
+            "absolute": f"https://example.com{self.detail}",
+            "netloc": f"//example.com{self.detail}",
+            "nested": URL,
+            "legacy_nested": "/api/batch/",
+        }
+        items = self.batch(paths).data["responses"]
+        self.assertEqual({key: item["status"] for key, item in items.items()}, dict.fromkeys(paths, 400))
+        self.assertEqual(items["nested"]["body"]["error"], "A batch cannot contain a batch")
+
+    def test_time_limit(self):
+        fake_time = mock.Mock()
+        # Start and first item at 0, then past BATCH_MAX_SECONDS
+        fake_time.monotonic.side_effect = itertools.chain([0, 0], itertools.repeat(10))
+        with override_settings(BATCH_MAX_SECONDS=5), mock.patch.object(batch, "time", fake_time):
+            items = self.batch({"a": self.detail, "b": self.count, "c": self.detail}).data["responses"]
+        self.assertEqual([item["status"] for item in items.values()], [200, 504, 504])
+
+    def test_outer_user_reaches_authenticated_views(self):
+        items = self.batch(["/api/v1/wallet/"]).data["responses"]
+        self.assertIn(items["/api/v1/wallet/"]["status"], (401, 403))
+
+        self.login()
+        item = self.batch(["/api/v1/wallet/"]).data["responses"]["/api/v1/wallet/"]
+        self.assertEqual(item["status"], 200)
+        self.assertEqual([w["points_balance"] for w in item["body"]["wallets"]], [7])
+
+    def test_conditional_headers_are_not_forwarded(self):
+        etag = self.client.get(self.detail)["ETag"]
+        self.assertEqual(self.client.get(self.detail, headers={"if-none-match": etag}).status_code, 304)
+        item = self.batch([self.detail], if_none_match=etag).data["responses"][self.detail]
+        self.assertEqual((item["status"], item["headers"]["ETag"]), (200, etag))
+        self.assertEqual(item["body"]["id"], self.business.pk)
+
+    def test_errors_are_logged_not_returned(self):
+        with mock.patch.object(views.FavoriteCountView, "get", side_effect=RuntimeError("secret detail")):
+            with self.assertLogs("config.batch", "ERROR") as logs:
+                item = self.batch([self.count]).data["responses"][self.count]
+        self.assertEqual(item, {"status": 500, "body": {"error": "Internal server error"}})
+        self.assertIn("secret detail", "\n".join(logs.output))
@@ -0,0 +1,163 @@
+from unittest import mock
+
+from django.db import transaction
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from loyalty import wallet_service
+from loyalty.models import CustomerPointsSummary, Wallet
+from rewards import batch_scan
+from rewards.models import PointsTransaction, QRCodeScan
+from rewards.views import BatchScanView
+
+from . import factories
+
+
+class BatchScanTests(TestCase):
+    def setUp(self):
+        self.owner = factories.user("owner")
+        self.business = factories.business(owner=self.owner, reward_point_cost=10)
+        self.menu = factories.product(self.business, points_reward=5)
+        self.reward = factories.product(self.business, points_reward=8, is_reward=True)
+        self.other_business = factories.business()
+        self.other_menu = factories.product(self.other_business, points_reward=5)
+        self.regular = factories.customer()
+        self.wallet = factories.wallet(self.regular, self.business, points=2, reward_point_cost=10)
+        self.newcomer = factories.customer()
+
+    def scan(self, key, product, customer, business=None):
+        return {
+            "idempotency_key": key,
+            "business_id": (business or self.business).id,
+            "product_ids": [product.id],
+            "customer_id": customer.id,
+        }
+
+    def process(self, scans, user=None):
+        with transaction.atomic():
+            return batch_scan.process_scans(user or self.owner, scans)
+
+    def balance(self, customer, business=None):
+        return Wallet.objects.values_list("points_balance", flat=True).get(
+            customer=customer, business=business or self.business
+        )
+
+    def summary(self, customer):
+        row = CustomerPointsSummary.objects.get(customer=customer)
+        return row.total_balance, row.lifetime_earned, row.lifetime_redeemed, row.wallet_count
+
+    def test_results_in_input_order(self):
+        before = self.summary(self.regular)
+        scans = [
+            self.scan("k1", self.menu, self.regular),
+            self.scan("k2", self.reward, self.regular),
+            self.scan("k3", self.menu, self.regular),
+            self.scan("k1", self.reward, self.regular),
+            self.scan("k4", self.other_menu, self.regular, business=self.other_business),
+            self.scan("k5", self.menu, self.newcomer),
+            self.scan("k6", self.reward, self.newcomer),
+            {"business_id": self.business.id, "product_ids": [self.menu.id]},
+        ]
+        results = self.process(scans)
+        self.assertEqual([r["status"] for r in results], [
+            batch_scan.APPLIED,
+            batch_scan.INSUFFICIENT_POINTS,
+            batch_scan.APPLIED,
+            batch_scan.DUPLICATE_KEY,
+            batch_scan.FORBIDDEN,
+            batch_scan.APPLIED,
+            batch_scan.INSUFFICIENT_POINTS,
+            batch_scan.INVALID,
+        ])
+        # Items of one wallet run in order: 2 + 5 (k1), 8 not covered (k2), + 5 (k3)
+        self.assertEqual([results[i]["points_balance"] for i in (0, 2, 5)], [7, 12, 5])
+        self.assertEqual(results[1]["required"], 8)
+
+        self.assertEqual(self.balance(self.regular), 12)
+        self.assertEqual(self.balance(self.newcomer), 5)
+        self.assertFalse(Wallet.objects.filter(business=self.other_business).exists())
+        self.assertEqual(
+            sorted(PointsTransaction.objects.values_list("wallet__customer_id", "points")),
+            sorted([(self.regular.id, 5), (self.regular.id, 5), (self.newcomer.id, 5)]),
+        )
+        self.assertEqual(
+            sorted(PointsTransaction.objects.values_list("pk", flat=True)),
+            sorted(results[i]["transaction_id"] for i in (0, 2, 5)),
+        )
+        # Rejected scans leave no dedupe row behind
+        self.assertEqual(QRCodeScan.objects.count(), 3)
+
+        # record_activity_bulk for the existing wallet, a rebuild for the one created by the batch
+        total, earned, redeemed, wallets = before
+        self.assertEqual(self.summary(self.regular), (total + 10, earned + 10, redeemed, wallets))
+        self.assertEqual(self.summary(self.newcomer), (5, 5, 0, 1))
+
+    def test_replay_reports_already_scanned(self):
+        scans = [self.scan("k1", self.menu, self.regular), self.scan("k2", self.menu, self.newcomer)]
+        self.process(scans)
+        results = self.process(scans)
+        self.assertEqual([r["status"] for r in results], [batch_scan.ALREADY_SCANNED] * 2)
+        self.assertEqual((self.balance(self.regular), self.balance(self.newcomer)), (7, 5))
+        self.assertEqual(PointsTransaction.objects.count(), 2)
+
+    def test_redemption_spends_points_earned_earlier_in_the_batch(self):
+        results = self.process([
+            self.scan("k1", self.menu, self.regular),
+            self.scan("k2", self.menu, self.regular),
+            self.scan("k3", self.reward, self.regular),
+        ])
+        self.assertEqual([r["points_balance"] for r in results], [7, 12, 4])
+        self.assertEqual(self.balance(self.regular), 4)
+
+    def test_other_customers_need_the_business_owner(self):
+        results = self.process([self.scan("k1", self.menu, self.regular)], user=self.newcomer.user)
+        self.assertEqual(results[0]["status"], batch_scan.FORBIDDEN)
+        # Scans without customer_id credit the caller's own customer record
+        results = self.process(
+            [{"idempotency_key": "own", "business_id": self.business.id, "product_ids": [self.menu.id]}],
+            user=self.newcomer.user,
+        )
+        self.assertEqual((results[0]["status"], results[0]["customer_id"]), (batch_scan.APPLIED, self.newcomer.id))
+
+    def test_guard_miss_replans_with_the_fresh_balance(self):
+        Wallet.objects.filter(pk=self.wallet.pk).update(points_balance=10)
+        real_apply = wallet_service.apply_points_bulk
+        calls = []
+
+        def concurrent_debit_first(changes, costs=None):
+            if not calls:
+                # Another request spends 7 points between our read and our UPDATE
+                wallet_service.debit(self.wallet.pk, 7)
+            calls.append(dict(changes))
+            return real_apply(changes, costs)
+
+        with mock.patch.object(batch_scan.wallet_service, "apply_points_bulk", side_effect=concurrent_debit_first):
+            results = self.process([self.scan("k1", self.reward, self.regular), self.scan("k2", self.menu, self.regular)])
+        # Planned against 10: -8 then +5. The fresh 3 only covers the +5.
+        self.assertEqual(calls, [{self.wallet.pk: (-3, 8)}, {self.wallet.pk: (5, 0)}])
+        self.assertEqual([r["status"] for r in results], [batch_scan.INSUFFICIENT_POINTS, batch_scan.APPLIED])
+        self.assertEqual(self.balance(self.regular), 8)
+        self.assertEqual(list(PointsTransaction.objects.values_list("points", flat=True)), [5])
+
+    def test_conflict_after_guard_retries(self):
+        with mock.patch.object(batch_scan.wallet_service, "apply_points_bulk", return_value={}) as apply_bulk:
+            results = self.process([self.scan("k1", self.menu, self.regular)])
+        self.assertEqual(apply_bulk.call_count, batch_scan.GUARD_RETRIES)
+        self.assertEqual(results[0]["status"], batch_scan.CONFLICT)
+        self.assertEqual(self.balance(self.regular), 2)
+        self.assertFalse(PointsTransaction.objects.exists())
+        self.assertFalse(QRCodeScan.objects.exists())
+
+    def test_view(self):
+        request = APIRequestFactory().post(
+            "/api/v1/rewards/scan-products/batch/",
+            {"scans": [self.scan("k1", self.menu, self.regular), self.scan("k1", self.menu, self.regular)]},
+            format="json",
+        )
+        force_authenticate(request, user=self.owner)
+        response = BatchScanView.as_view()(request)
+        self.assertEqual((response.status_code, response.data["total"], response.data["applied"]), (200, 2, 1))
+
+        request = APIRequestFactory().post("/api/v1/rewards/scan-products/batch/", {"scans": []}, format="json")
+        force_authenticate(request, user=self.owner)
+        self.assertEqual(BatchScanView.as_view()(request).status_code, 400)
@@ -0,0 +1,121 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from loyalty import reward_index
+from loyalty.models import Business, Customer, Favorite, Wallet
+from loyalty.points_summary import get_points_summary
+from loyalty.serializers import BusinessSerializer
+from loyalty.views import BusinessListView, FavoriteListView, HomeView, MyWalletView
+
+from . import factories
+from .queries import CaptureStatements
+
+
+class BusinessListQueryTests(TestCase):
+    """
+    The listings that render ``is_favorite`` load the favorite set once per
+    request: the statement count does not depend on the number of businesses and
+    no GET writes.
+    """
+
+    # Statements per GET. Logged in, the customer lookup and the favorite IDs are one query each.
+    # The business list also reads its ETag versions (one query, see response_cache.versions).
+    BUDGETS = {
+        ("businesses", "anonymous"): 2,
+        ("businesses", "customer"): 4,
+        ("businesses", "no customer"): 3,
+        # ?fields=compact renders neither is_favorite nor favorites_count: no customer, no join
+        ("businesses compact", "customer"): 2,
+        ("favorites", "customer"): 3,  # customer, favorite IDs, businesses
+        ("favorites", "no customer"): 1,
+        ("wallet", "customer"): 4,  # customer, wallets, favorites counts, favorite IDs
+        ("wallet", "no customer"): 1,
+        # slider, businesses, reward products, orders; logged in also customer,
+        # favorite IDs, wallets, points summary (the reward index is built beforehand)
+        ("home", "anonymous"): 4,
+        ("home", "customer"): 8,
+        ("home", "no customer"): 5,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = factories.user("owner")
+        Business.objects.bulk_create(Business(owner=owner, name=f"Listed {i}", reward_point_cost=10) for i in range(60))
+        businesses = list(Business.objects.filter(owner=owner).order_by("pk"))
+        cls.business_ids = {b.id for b in businesses}
+        cls.customer = factories.customer()
+        cls.favorite_ids = {b.id for b in businesses[::6]}
+        Favorite.objects.bulk_create(Favorite(customer=cls.customer, business_id=pk) for pk in cls.favorite_ids)
+        Wallet.objects.bulk_create(Wallet(customer=cls.customer, business=b, reward_point_cost=10) for b in businesses[1::6])
+        cls.stranger = factories.user("stranger")
+
+    def setUp(self):
+        self.user = User.objects.get(pk=self.customer.user_id)
+        self.stranger = User.objects.get(pk=self.stranger.pk)
+        # Built once per process / customer, not per request
+        reward_index._index = None
+        reward_index.get_reward_index()
+        get_points_summary(self.customer)
+
+    def get(self, endpoint, label, view_class, path):
+        as_user = {"anonymous": None, "customer": self.user, "no customer": self.stranger}[label]
+        request = APIRequestFactory().get(path)
+        if as_user is not None:
+            force_authenticate(request, user=as_user)
+        with CaptureStatements() as ctx:
+            response = view_class.as_view()(request)
+            response.render()
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(ctx.statements), self.BUDGETS[endpoint, label], "\n".join(ctx.statements))
+        self.assertFalse(ctx.writes)
+        return response.data
+
+    def test_business_list(self):
+        for label in ("anonymous", "customer", "no customer"):
+            data = self.get("businesses", label, BusinessListView, "/api/v1/businesses/")
+            flagged = {item["id"] for item in data if item["is_favorite"]}
+            self.assertEqual(flagged, self.favorite_ids if label == "customer" else set())
+            self.assertTrue(self.business_ids <= {item["id"] for item in data})
+
+    def test_compact_business_list(self):
+        data = self.get("businesses compact", "customer", BusinessListView, "/api/v1/businesses/?fields=compact")
+        self.assertEqual(set(data[0]), set(BusinessSerializer.COMPACT_FIELDS))
+
+    def test_favorites(self):
+        data = self.get("favorites", "customer", FavoriteListView, "/api/v1/loyalty/favorites/")
+        self.assertEqual({item["id"] for item in data["favorites"]}, self.favorite_ids)
+        self.assertTrue(all(item["is_favorite"] for item in data["favorites"]))
+        self.get("favorites", "no customer", FavoriteListView, "/api/v1/loyalty/favorites/")
+
+    def test_wallet(self):
+        data = self.get("wallet", "customer", MyWalletView, "/api/v1/loyalty/wallet/")
+        self.assertEqual(len(data["wallets"]), 10)
+        for item in data["wallets"]:
+            self.assertEqual(item["business"]["is_favorite"], item["business"]["id"] in self.favorite_ids)
+        self.get("wallet", "no customer", MyWalletView, "/api/v1/loyalty/wallet/")
+
+    def test_home(self):
+        anonymous = self.get("home", "anonymous", HomeView, "/api/v1/home/")
+        self.assertEqual([anonymous[name] for name in ("favorites", "wallet", "dashboard")], [None, None, None])
+
+        home = self.get("home", "customer", HomeView, "/api/v1/home/")
+        self.assertEqual({item["id"] for item in home["favorites"]}, self.favorite_ids)
+        flagged = {item["id"] for item in home["businesses"] if item["is_favorite"]}
+        self.assertEqual(flagged & self.business_ids, flagged)
+        self.assertTrue(flagged <= self.favorite_ids)
+        self.assertEqual(len(home["wallet"]), 10)
+
+        self.get("home", "no customer", HomeView, "/api/v1/home/")
+
+    def test_get_creates_no_customer(self):
+        for view_class, path in (
+            (BusinessListView, "/api/v1/businesses/"),
+            (FavoriteListView, "/api/v1/loyalty/favorites/"),
+            (MyWalletView, "/api/v1/loyalty/wallet/"),
+            (HomeView, "/api/v1/home/"),
+        ):
+            endpoint = {BusinessListView: "businesses", FavoriteListView: "favorites",
+                        MyWalletView: "wallet", HomeView: "home"}[view_class]
+            self.get(endpoint, "no customer", view_class, path)
+        self.assertFalse(Customer.objects.filter(user=self.stranger).exists())
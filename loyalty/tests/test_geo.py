@@ -0,0 +1,89 @@
+import random
+
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+
+from loyalty import geo
+from loyalty.models import Business
+from loyalty.views import NearbyBusinessesView
+
+from . import factories
+
+
+class GeohashTests(TestCase):
+    def test_encode_known_value(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744), "u4pruydqq")
+        self.assertEqual(geo.encode(57.64911, 10.40744, 4), "u4pr")
+
+    def test_bounds_contain_the_point(self):
+        rng = random.Random(17)
+        for _ in range(200):
+            lat, lng = rng.uniform(-90, 90), rng.uniform(-180, 180)
+            min_lat, max_lat, min_lng, max_lng = geo.bounds(geo.encode(lat, lng))
+            self.assertTrue(min_lat <= lat <= max_lat and min_lng <= lng <= max_lng)
+
+    def test_covering_cells_contain_every_point_in_the_radius(self):
+        rng = random.Random(42)
+        for lat, lng, radius in ((35.6892, 51.3890, 5), (52.52, 13.405, 50), (-33.86, 151.21, 0.3),
+                                 (0.0, 179.99, 20), (78.22, 15.65, 30)):
+            cells = geo.covering_cells(lat, lng, radius)
+            self.assertLessEqual(len(cells), geo.MAX_CELLS)
+            for _ in range(300):
+                point = (lat + rng.uniform(-1, 1) * radius / 111, lng + rng.uniform(-1, 1) * radius / 30)
+                point = (max(-90.0, min(90.0, point[0])), (point[1] + 180) % 360 - 180)
+                if geo.distances_km(lat, lng, [point])[0] > radius:
+                    continue
+                with self.subTest(origin=(lat, lng), point=point):
+                    self.assertTrue(any(geo.encode(*point).startswith(cell) for cell in cells))
+
+    def test_distances(self):
+        # Tehran -> Isfahan, roughly 340 km
+        self.assertAlmostEqual(geo.distances_km(35.6892, 51.3890, [(32.6539, 51.6660)])[0], 338, delta=3)
+        self.assertEqual(geo.distances_km(10, 10, [(10, 10)]), [0.0])
+
+
+class NearbyTests(TestCase):
+    origin = (35.7000, 51.4000)
+
+    def setUp(self):
+        rng = random.Random(7)
+        for _ in range(60):
+            factories.business(
+                latitude=self.origin[0] + rng.uniform(-0.2, 0.2),
+                longitude=self.origin[1] + rng.uniform(-0.2, 0.2),
+            )
+        factories.business()  # no coordinates
+
+    def brute_force(self, radius):
+        rows = list(Business.objects.exclude(latitude=None).values_list("pk", "latitude", "longitude"))
+        distances = geo.distances_km(*self.origin, [(lat, lng) for _, lat, lng in rows])
+        return sorted(
+            ((pk, d) for (pk, _, _), d in zip(rows, distances) if d <= radius), key=lambda item: (item[1], item[0])
+        )
+
+    def test_matches_a_full_scan(self):
+        for radius in (1, 5, 12):
+            with self.subTest(radius=radius):
+                self.assertEqual(geo.nearby(Business.objects.all(), *self.origin, radius), self.brute_force(radius))
+
+    def test_geohash_follows_coordinate_updates(self):
+        business = Business.objects.exclude(latitude=None).first()
+        business.latitude, business.longitude = 48.8566, 2.3522
+        business.save(update_fields=["latitude", "longitude"])
+        business.refresh_from_db()
+        self.assertEqual(business.geohash, geo.encode(48.8566, 2.3522))
+
+    def test_view(self):
+        request = APIRequestFactory().get(
+            "/api/v1/businesses/nearby/", {"lat": self.origin[0], "lng": self.origin[1], "radius": 8, "limit": 5}
+        )
+        data = NearbyBusinessesView.as_view()(request).data
+        expected = self.brute_force(8)[:5]
+        self.assertEqual([row["id"] for row in data["results"]], [pk for pk, _ in expected])
+        self.assertEqual([row["distance_km"] for row in data["results"]], [round(d, 3) for _, d in expected])
+
+    def test_view_rejects_bad_input(self):
+        for params in ({}, {"lat": "x", "lng": 1}, {"lat": 91, "lng": 0}, {"lat": 0, "lng": 0, "radius": 500}):
+            with self.subTest(params=params):
+                request = APIRequestFactory().get("/api/v1/businesses/nearby/", params)
+                self.assertEqual(NearbyBusinessesView.as_view()(request).status_code, 400)
@@ -0,0 +1,90 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from loyalty import points_engine
+from rewards.models import PointsTransaction, QRCodeScan
+from rewards.views import QRProductScanView, RedeemPointsView
+from securityapp.models import IdempotencyKey
+
+from . import factories
+
+
+class IdempotentViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.customer = factories.customer()
+        self.business = factories.business(reward_point_cost=10)
+        self.menu_item = factories.product(self.business, points_reward=5)
+        self.reward = factories.product(self.business, points_reward=5, is_reward=True)
+
+    def post(self, view, path, data, key="key-1"):
+        request = self.factory.post(path, data, format="json", HTTP_IDEMPOTENCY_KEY=key)
+        force_authenticate(request, user=self.customer.user)
+        response = view(request)
+        response.render()
+        return response
+
+    def scan(self, product, key="key-1", qr_timestamp="1"):
+        return self.post(
+            QRProductScanView.as_view(), "/api/v1/rewards/scan-products/",
+            {"business_id": self.business.id, "product_ids": [product.id], "qr_timestamp": qr_timestamp}, key,
+        )
+
+    def redeem(self, amount, key="key-1"):
+        return self.post(
+            RedeemPointsView.as_view(), "/api/v1/rewards/redeem/", {"business_id": self.business.id, "amount": amount}, key
+        )
+
+    def test_success_is_replayed_without_running_again(self):
+        first = self.scan(self.menu_item)
+        self.assertEqual(first.status_code, 201)
+        replay = self.scan(self.menu_item)
+        self.assertEqual((replay.status_code, replay.data), (201, first.data))
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+        self.assertEqual(PointsTransaction.objects.count(), 1)
+
+    def test_rolled_back_client_error_is_stored_and_replayed(self):
+        # The view calls transaction.set_rollback(True) on insufficient points
+        first = self.scan(self.reward)
+        self.assertEqual(first.status_code, 400, first.data)
+        self.assertEqual(first.data["error"], "Insufficient points")
+        # The view's own writes were rolled back, the stored answer was not
+        self.assertFalse(QRCodeScan.objects.exists())
+        self.assertEqual(IdempotencyKey.objects.get().status_code, 400)
+
+        replay = self.scan(self.reward)
+        self.assertEqual((replay.status_code, replay.data), (400, first.data))
+        self.assertEqual(replay["Idempotent-Replayed"], "true")
+
+    def test_rolled_back_duplicate_scan_with_new_key(self):
+        self.assertEqual(self.scan(self.menu_item, key="a").status_code, 201)
+        duplicate = self.scan(self.menu_item, key="b")
+        self.assertEqual(duplicate.status_code, 400)
+        self.assertTrue(duplicate.data["already_scanned"])
+        self.assertEqual(IdempotencyKey.objects.get(status_code=400).response_body.count("already_scanned"), 1)
+
+    def test_server_error_is_rolled_back_and_not_stored(self):
+        factories.wallet(self.customer, self.business, points=10)
+        with mock.patch.object(points_engine, "redeem", side_effect=RuntimeError("boom")):
+            failed = self.redeem(3)
+        self.assertEqual(failed.status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        retried = self.redeem(3)
+        self.assertEqual((retried.status_code, retried.data["points_balance"]), (200, 7))
+        self.assertFalse(retried.has_header("Idempotent-Replayed"))
+
+    def test_same_key_with_other_body_is_rejected(self):
+        factories.wallet(self.customer, self.business, points=10)
+        self.assertEqual(self.redeem(3).status_code, 200)
+        self.assertEqual(self.redeem(4).status_code, 422)
+        self.assertEqual(PointsTransaction.objects.count(), 1)
+
+    def test_without_key_nothing_is_stored(self):
+        factories.wallet(self.customer, self.business, points=10)
+        self.assertEqual(self.redeem(3, key="").status_code, 200)
+        self.assertFalse(IdempotencyKey.objects.exists())
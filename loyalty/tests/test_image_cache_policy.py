@@ -0,0 +1,133 @@
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from loyalty import image_cache, image_cache_policy, image_store, media_cache
+from loyalty.models import BackgroundJob, ImageBlob, ImageCache
+
+from . import factories
+
+KB = 1024
+
+
+class ImageCachePolicyTestCase(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, IMAGE_ACCESS_FLUSH_INTERVAL=3600, IMAGE_CACHE_EVICT_MIN_IDLE_HOURS=24,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        image_cache_policy.flush()
+        media_cache._recache_queued.clear()
+
+    def cached_image(self, object_id, size, idle, stored=True):
+        """An ImageCache row with a blob of ``size`` bytes last read ``idle`` ago."""
+        path = f"products/{object_id}.jpg"
+        if stored:
+            path = default_storage.save(path, ContentFile(b"original"))
+        blob = image_store.put(b"\xff\xd8\xff" + os.urandom(size - 3))
+        row = ImageCache.objects.create(
+            content_type="loyalty.product", object_id=object_id, original_path=path, blob=blob, file_size=size,
+        )
+        ImageCache.objects.filter(pk=row.pk).update(last_accessed=timezone.now() - idle)
+        return row
+
+
+class AccessTrackingTests(ImageCachePolicyTestCase):
+    def test_reads_are_written_in_one_update(self):
+        rows = [self.cached_image(i, KB, timedelta(days=3)) for i in range(1, 4)]
+        with CaptureQueriesContext(connection) as ctx:
+            image_cache_policy.record(rows[0].pk)
+            image_cache_policy.record(rows[0].pk)
+            image_cache_policy.record(blob=rows[1].blob_id)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(image_cache_policy.pending(), 3)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(image_cache_policy.flush(), 2)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        recent = timezone.now() - timedelta(minutes=1)
+        self.assertEqual(
+            set(ImageCache.objects.filter(last_accessed__gt=recent).values_list("pk", flat=True)),
+            {rows[0].pk, rows[1].pk},
+        )
+        self.assertEqual(image_cache_policy.pending(), 0)
+
+
+class EvictionTests(ImageCachePolicyTestCase):
+    def setUp(self):
+        super().setUp()
+        # Scores (idle time x size): large B first, then A; C was read too recently
+        self.a = self.cached_image(1, 10 * KB, timedelta(days=10))
+        self.b = self.cached_image(2, 40 * KB, timedelta(days=5))
+        self.c = self.cached_image(3, 20 * KB, timedelta(hours=1))
+
+    def remaining(self):
+        return set(ImageCache.objects.values_list("object_id", flat=True))
+
+    def test_evicts_highest_score_until_within_budget(self):
+        result = image_cache_policy.evict(budget=45 * KB)
+        self.assertEqual((result["evicted_images"], result["after_bytes"], result["over_budget"]), (1, 30 * KB, False))
+        self.assertEqual(self.remaining(), {1, 3})
+        self.assertFalse(ImageBlob.objects.filter(pk=self.b.blob_id).exists())
+
+    def test_recently_read_images_are_kept_over_budget(self):
+        result = image_cache_policy.evict(budget=15 * KB)
+        self.assertEqual((result["evicted_images"], result["over_budget"]), (2, True))
+        self.assertEqual(self.remaining(), {3})
+
+    def test_dry_run_changes_nothing(self):
+        result = image_cache_policy.evict(budget=45 * KB, dry_run=True)
+        self.assertEqual((result["evicted_images"], result["after_bytes"]), (1, 30 * KB))
+        self.assertEqual(self.remaining(), {1, 2, 3})
+
+    def test_only_copies_are_kept(self):
+        default_storage.delete(self.b.original_path)
+        result = image_cache_policy.evict(budget=45 * KB)
+        self.assertEqual((result["evicted_images"], result["kept_without_original"]), (1, 1))
+        self.assertTrue(result["over_budget"])
+        self.assertEqual(self.remaining(), {2, 3})
+
+    def test_stats(self):
+        stats = image_cache_policy.stats()
+        self.assertEqual((stats["stored_bytes"], stats["blobs"], stats["rows_with_blob"]), (70 * KB, 3, 3))
+        self.assertNotIn("last_eviction", stats)
+
+
+class RecacheTests(ImageCachePolicyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = factories.product(image="products/evicted.jpg")
+        # The job queued on save ran long ago; the image has since been evicted
+        BackgroundJob.objects.all().delete()
+        self.url = f"/media-cache/loyalty.product/{self.product.pk}/?v={media_cache.path_version('products/evicted.jpg')}"
+
+    def test_uncached_image_is_queued_for_caching(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["Location"], default_storage.url("products/evicted.jpg"))
+        job = BackgroundJob.objects.get()
+        self.assertEqual((job.kind, job.key), (image_cache.CACHE_IMAGE_JOB, f"loyalty.product:{self.product.pk}"))
+        self.assertEqual(job.payload, {"content_type": "loyalty.product", "object_id": self.product.pk, "field": "image"})
+
+    def test_queued_at_most_once_per_interval(self):
+        self.client.get(self.url)
+        BackgroundJob.objects.all().delete()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(self.url).status_code, 302)
+        self.assertFalse(BackgroundJob.objects.exists())
+        self.assertFalse([q for q in ctx.captured_queries if "INSERT" in q["sql"]])
+
+        media_cache._recache_queued.clear()
+        self.client.get(self.url)
+        self.assertEqual(BackgroundJob.objects.count(), 1)
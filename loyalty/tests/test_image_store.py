@@ -0,0 +1,95 @@
+import io
+import os
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import ProtectedError
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from loyalty import image_store
+from loyalty.models import ImageBlob, ImageCache, ImageVariant
+
+JPEG = b"\xff\xd8\xff\xe0" + os.urandom(2000)
+PNG = b"\x89PNG\r\n\x1a\n" + os.urandom(2000)
+
+
+def cache_row(blob, object_id, **fields):
+    return ImageCache.objects.create(
+        content_type="loyalty.product", object_id=object_id, original_path=f"products/{object_id}.jpg",
+        blob=blob, file_size=blob.size, content_type_header=blob.content_type, **fields,
+    )
+
+
+class ImageStoreTests(TestCase):
+    def test_put_stores_each_content_once(self):
+        first = image_store.put(JPEG, "application/octet-stream")
+        again = image_store.put(bytearray(JPEG))
+        self.assertEqual(first.pk, again.pk)
+        self.assertEqual(first.pk, image_store.digest(JPEG))
+        self.assertEqual((first.size, first.content_type), (len(JPEG), "image/jpeg"))
+        self.assertEqual(ImageBlob.objects.count(), 1)
+        self.assertEqual(image_store.read(first.pk), JPEG)
+        self.assertIsNone(image_store.read("0" * 64))
+
+    def test_sniff(self):
+        self.assertEqual(image_store.sniff(JPEG), "image/jpeg")
+        self.assertEqual(image_store.sniff(PNG), "image/png")
+        self.assertEqual(image_store.sniff(b"GIF89a..."), "image/gif")
+        self.assertEqual(image_store.sniff(b"RIFF\0\0\0\0WEBPVP8 "), "image/webp")
+        self.assertEqual(image_store.sniff(b"%PDF-1.7"), "")
+        # An unknown format keeps the upload's content type
+        self.assertEqual(image_store.put(b"%PDF-1.7", "application/pdf").content_type, "application/pdf")
+
+    def test_listing_never_reads_bytes(self):
+        blob = image_store.put(JPEG)
+        cache_row(blob, 1)
+        with CaptureQueriesContext(connection) as ctx:
+            rows = list(ImageCache.objects.all())
+            # Following the foreign key goes through the base manager, which defers the bytes
+            self.assertEqual(rows[0].blob.size, len(JPEG))
+            list(ImageBlob.objects.all())
+        self.assertFalse([q["sql"] for q in ctx.captured_queries if '"loyalty_imageblob"."data"' in q["sql"]])
+
+    def test_admin_list_page_reads_no_bytes(self):
+        blobs = [image_store.put(os.urandom(5000)) for _ in range(3)]
+        for i in range(30):
+            cache_row(blobs[i % 3], i)
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", None))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/admin/loyalty/imagecache/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q["sql"] for q in ctx.captured_queries if '"loyalty_imageblob"."data"' in q["sql"]])
+
+    def test_read_range_and_blob_reader(self):
+        blob = image_store.put(JPEG)
+        self.assertEqual(image_store.read_range(blob.pk, 10, 100), JPEG[10:110])
+        self.assertEqual(image_store.read_range(blob.pk, len(JPEG) - 5, 100), JPEG[-5:])
+        self.assertIsNone(image_store.read_range("0" * 64, 0, 10))
+
+        reader = image_store.BlobReader(blob.pk, 100, 1100)
+        self.assertEqual(reader.read(300), JPEG[100:400])
+        self.assertEqual(reader.tell(), 300)
+        reader.seek(-50, io.SEEK_END)
+        self.assertEqual(reader.read(), JPEG[1050:1100])
+        self.assertEqual(reader.read(), b"")
+        reader.seek(0)
+        self.assertEqual(b"".join(iter(lambda: reader.read(256), b"")), JPEG[100:1100])
+
+    def test_blob_reader_ends_when_the_blob_is_deleted(self):
+        blob = image_store.put(JPEG)
+        reader = image_store.BlobReader(blob.pk, 0, len(JPEG))
+        ImageBlob.objects.filter(pk=blob.pk).delete()
+        self.assertEqual(reader.read(100), b"")
+
+    def test_collect_garbage_keeps_referenced_blobs_and_drops_orphan_renditions(self):
+        kept, orphan = image_store.put(JPEG), image_store.put(PNG)
+        cache_row(kept, 1)
+        rendition = image_store.put(b"RIFF\0\0\0\0WEBP" + os.urandom(100))
+        ImageVariant.objects.create(source=orphan, name="thumb", blob=rendition, width=10, height=10)
+
+        self.assertEqual(image_store.collect_garbage([kept.pk]), 0)
+        self.assertEqual(image_store.collect_garbage(), 2)
+        self.assertEqual(list(ImageBlob.objects.values_list("pk", flat=True)), [kept.pk])
+        with self.assertRaises(ProtectedError):
+            kept.delete()
@@ -0,0 +1,94 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from loyalty import jobs
+from loyalty.models import BackgroundJob
+
+Status = BackgroundJob.Status
+KIND = "tests.job"
+
+
+@override_settings(JOB_MAX_ATTEMPTS=3, JOB_RETRY_DELAY=30, JOB_LOCK_TIMEOUT=600)
+class JobTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        self.error = None
+
+        def handle(payload):
+            self.calls.append(payload)
+            if self.error:
+                raise self.error
+
+        jobs.HANDLERS[KIND] = handle
+        self.addCleanup(jobs.HANDLERS.pop, KIND, None)
+
+    def state(self, job):
+        job.refresh_from_db()
+        return job.status, job.locked_by
+
+    def test_one_pending_job_per_key(self):
+        self.assertTrue(jobs.enqueue(KIND, "a", {"n": 1}))
+        self.assertFalse(jobs.enqueue(KIND, "a", {"n": 2}))
+        job = jobs.claim("w1")
+        # A change made while the job runs queues the next run
+        self.assertTrue(jobs.enqueue(KIND, "a", {"n": 3}))
+        self.assertTrue(jobs.run(job, "w1"))
+        self.assertEqual(self.calls, [{"n": 1}])
+        self.assertEqual(self.state(job), (Status.DONE, "w1"))
+
+    def test_claim_is_exclusive(self):
+        jobs.enqueue(KIND, "a")
+        self.assertIsNotNone(jobs.claim("w1"))
+        self.assertIsNone(jobs.claim("w2"))
+
+    def test_failure_retries_with_backoff_then_fails(self):
+        self.error = ValueError("boom")
+        jobs.enqueue(KIND, "a")
+        for attempt in (1, 2):
+            job = jobs.claim("w1")
+            self.assertFalse(jobs.run(job, "w1"))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts, job.locked_by), (Status.PENDING, attempt, ""))
+            self.assertIn("boom", job.last_error)
+            self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=30 * 2 ** (attempt - 1) - 5))
+            BackgroundJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        job = jobs.claim("w1")
+        self.assertFalse(jobs.run(job, "w1"))
+        self.assertEqual(self.state(job), (Status.FAILED, "w1"))
+
+    def released_and_claimed_again(self):
+        """A job claimed by w1, released as stale and claimed again by w2."""
+        jobs.enqueue(KIND, "a")
+        first = jobs.claim("w1")
+        BackgroundJob.objects.filter(pk=first.pk).update(locked_at=timezone.now() - timedelta(seconds=601))
+        self.assertEqual(jobs.release_stale(), 1)
+        BackgroundJob.objects.filter(pk=first.pk).update(run_after=timezone.now())
+        second = jobs.claim("w2")
+        self.assertEqual(second.pk, first.pk)
+        return first, second
+
+    def test_late_success_does_not_overwrite_the_new_claim(self):
+        first, second = self.released_and_claimed_again()
+        self.assertTrue(jobs.run(first, "w1"))
+        self.assertEqual(self.state(second), (Status.RUNNING, "w2"))
+        self.assertTrue(jobs.run(second, "w2"))
+        self.assertEqual(self.state(second), (Status.DONE, "w2"))
+
+    def test_late_failure_does_not_overwrite_the_new_claim(self):
+        first, second = self.released_and_claimed_again()
+        self.error = ValueError("late")
+        self.assertFalse(jobs.run(first, "w1"))
+        second.refresh_from_db()
+        self.assertEqual((second.status, second.locked_by, second.attempts), (Status.RUNNING, "w2", 2))
+        self.assertNotIn("late", second.last_error)
+
+    def test_release_stale_skips_jobs_finished_meanwhile(self):
+        jobs.enqueue(KIND, "a")
+        job = jobs.claim("w1")
+        BackgroundJob.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(seconds=601))
+        job.refresh_from_db()
+        jobs.run(job, "w1")
+        jobs.fail(job, "stale", job.locked_by)
+        self.assertEqual(self.state(job), (Status.DONE, "w1"))
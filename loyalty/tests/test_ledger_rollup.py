@@ -0,0 +1,70 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from loyalty import ledger_rollup, points_engine
+from loyalty.models import LedgerMonth
+from loyalty.views import PointsHistoryView
+from rewards.models import PointsTransaction
+
+from . import factories
+
+LEDGER = points_engine.REWARDS_LEDGER
+
+
+def at(year, month, day=15):
+    return datetime(year, month, day, 12, tzinfo=dt_timezone.utc)
+
+
+class LedgerRollupTests(TestCase):
+    def setUp(self):
+        self.customer = factories.customer()
+        self.business, self.other_business = factories.business(), factories.business()
+        self.wallet = factories.wallet(self.customer, self.business, points=100)
+        other_wallet = factories.wallet(self.customer, self.other_business, points=100)
+        for wallet, points, when in (
+            (self.wallet, 10, at(2026, 1)),
+            (self.wallet, -4, at(2026, 1, 20)),
+            (self.wallet, 7, at(2026, 2)),
+            (self.wallet, 5, at(2026, 4)),
+            (other_wallet, 100, at(2026, 1)),
+        ):
+            entry = PointsTransaction.objects.create(wallet=wallet, points=points)
+            PointsTransaction.objects.filter(pk=entry.pk).update(created_at=when)
+
+    def wallet_totals(self):
+        return ledger_rollup.totals(LEDGER, wallet=self.wallet)[self.wallet.pk]
+
+    def history(self):
+        request = APIRequestFactory().get("/api/v1/loyalty/points/history/", {"business_id": self.business.id})
+        force_authenticate(request, user=self.customer.user)
+        response = PointsHistoryView.as_view()(request)
+        return response.data["total_points_earned"], response.data["total_points_redeemed"]
+
+    def test_totals_survive_roll_up_and_archive(self):
+        before = self.wallet_totals()
+        self.assertEqual((before.earned, before.redeemed, before.count), (22, 4, 4))
+        self.assertEqual(self.history(), (22, 4))
+
+        ledger_rollup.roll_up(LEDGER, now=at(2026, 4, 2))
+        self.assertEqual(
+            set(LedgerMonth.objects.filter(wallet=self.wallet).values_list("month", "earned", "redeemed", "count")),
+            {(at(2026, 1).date().replace(day=1), 10, 4, 2), (at(2026, 2).date().replace(day=1), 7, 0, 1)},
+        )
+        moved = ledger_rollup.archive(LEDGER, before=at(2026, 4, 2))
+        self.assertEqual(moved, 4)
+        self.assertEqual(PointsTransaction.objects.filter(wallet=self.wallet).count(), 1)
+
+        self.assertEqual(self.wallet_totals()[:3], before[:3])
+        self.assertEqual(self.history(), (22, 4))
+
+    def test_rows_after_the_checkpoint_are_counted_live(self):
+        ledger_rollup.roll_up(LEDGER, now=at(2026, 3, 1))
+        PointsTransaction.objects.create(wallet=self.wallet, points=-3)
+        totals = self.wallet_totals()
+        self.assertEqual((totals.earned, totals.redeemed, totals.count), (22, 7, 5))
+
+    def test_archive_needs_a_checkpoint(self):
+        self.assertEqual(ledger_rollup.archive(LEDGER, before=at(2027, 1)), 0)
+        self.assertEqual(PointsTransaction.objects.count(), 5)
@@ -0,0 +1,86 @@
+import os
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from loyalty import image_store, media_cache
+from loyalty.models import ImageCache
+
+# An object id no product has, so only the cached row can answer
+OBJECT_ID = 2 ** 31 - 1
+# More than one BlobReader slice
+SIZE = 600_000
+
+
+class MediaCacheTests(TestCase):
+    def setUp(self):
+        self.data = b"\x89PNG\r\n\x1a\n" + os.urandom(SIZE - 8)
+        self.blob = image_store.put(self.data)
+        self.cache = ImageCache.objects.create(
+            content_type="loyalty.product", object_id=OBJECT_ID, original_path="products/image.png", blob=self.blob,
+        )
+        self.blob_url = media_cache.blob_url(self.blob.pk)
+        self.etag = f'"{self.blob.pk}"'
+
+    def request(self, url, method="get", **headers):
+        """``(response, body, queries, queries reading image bytes)``"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, headers=headers)
+            body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, body, len(ctx.captured_queries), sum('"data"' in q["sql"] for q in ctx.captured_queries)
+
+    def test_get_blob(self):
+        response, body, _, _ = self.request(self.blob_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+        self.assertEqual(response["ETag"], self.etag)
+        self.assertEqual(response["Cache-Control"], media_cache.IMMUTABLE)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+
+    def test_get_object(self):
+        url = f"/media-cache/loyalty.product/{OBJECT_ID}/?v={media_cache.path_version(self.cache.original_path)}"
+        response, body, _, _ = self.request(url)
+        self.assertEqual((response.status_code, body), (200, self.data))
+        self.assertEqual(response["Cache-Control"], media_cache.IMMUTABLE)
+
+    def test_not_modified_and_head_read_no_bytes(self):
+        response, body, queries, reads = self.request(self.blob_url, if_none_match=self.etag)
+        self.assertEqual((response.status_code, body, queries, reads), (304, b"", 1, 0))
+        response, body, queries, reads = self.request(self.blob_url, method="head")
+        self.assertEqual((response.status_code, body, queries, reads), (200, b"", 1, 0))
+        self.assertEqual(response["Content-Length"], str(SIZE))
+
+    def test_ranges(self):
+        middle = SIZE // 2
+        for header, expected in (
+            (f"bytes={middle}-{middle + 999}", self.data[middle:middle + 1000]),
+            (f"bytes={SIZE - 10}-", self.data[-10:]),
+            ("bytes=-500", self.data[-500:]),
+        ):
+            with self.subTest(range=header):
+                response, body, queries, _ = self.request(self.blob_url, range=header)
+                self.assertEqual((response.status_code, body), (206, expected))
+                self.assertEqual(queries, 2)
+        response, _, _, _ = self.request(self.blob_url, range=f"bytes={middle}-{middle + 999}")
+        self.assertEqual(response["Content-Range"], f"bytes {middle}-{middle + 999}/{SIZE}")
+
+        response, _, _, reads = self.request(self.blob_url, range=f"bytes={SIZE}-")
+        self.assertEqual((response.status_code, reads), (416, 0))
+        self.assertEqual(response["Content-Range"], f"bytes */{SIZE}")
+
+        # Several ranges are answered with the whole image
+        response, body, _, _ = self.request(self.blob_url, range="bytes=0-9,20-29")
+        self.assertEqual((response.status_code, body), (200, self.data))
+
+    def test_if_range(self):
+        response, body, _, _ = self.request(self.blob_url, range="bytes=0-99", if_range=self.etag)
+        self.assertEqual((response.status_code, body), (206, self.data[:100]))
+        response, body, _, _ = self.request(self.blob_url, range="bytes=0-99", if_range='"outdated"')
+        self.assertEqual((response.status_code, body), (200, self.data))
+
+    def test_errors(self):
+        self.assertEqual(self.client.get(media_cache.blob_url("0" * 64)).status_code, 404)
+        self.assertEqual(self.client.get(f"/media-cache/auth.user/{OBJECT_ID}/").status_code, 404)
+        self.assertEqual(self.client.post(self.blob_url).status_code, 405)
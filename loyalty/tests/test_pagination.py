@@ -0,0 +1,103 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from loyalty.models import Transaction
+from loyalty.pagination import decode_cursor, encode_cursor
+from loyalty.views import PointsHistoryView
+from rewards.models import PointsTransaction
+from rewards.views import PointsHistoryView as RewardsHistoryView
+
+from . import factories
+
+
+class CursorTests(TestCase):
+    def test_round_trip(self):
+        created_at = datetime(2026, 3, 1, 8, 30, 15, 123456, tzinfo=dt_timezone.utc)
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 42)), (created_at, 42))
+
+    def test_rejects_garbage(self):
+        for cursor in ("", "not-a-cursor", "////", encode_cursor(datetime(2026, 1, 1), 1)[:-3]):
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+class HistoryKeysetTests(TestCase):
+    def setUp(self):
+        self.customer = factories.customer()
+        self.business, self.other_business = factories.business(), factories.business()
+        self.wallet = factories.wallet(self.customer, self.business, points=0)
+        other_wallet = factories.wallet(self.customer, self.other_business, points=0)
+        # Rows sharing a created_at must still be split between pages without gaps or repeats
+        same_time = datetime(2026, 2, 1, 12, tzinfo=dt_timezone.utc)
+        for i in range(7):
+            tx = Transaction.objects.create(wallet=self.wallet, amount=i + 1 if i % 3 else -(i + 1))
+            Transaction.objects.filter(pk=tx.pk).update(
+                created_at=same_time if i < 4 else datetime(2026, 2, 2 + i, tzinfo=dt_timezone.utc),
+            )
+        Transaction.objects.create(wallet=other_wallet, amount=50)
+        self.expected = list(
+            Transaction.objects.filter(wallet=self.wallet).order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+
+    def get(self, **params):
+        request = APIRequestFactory().get("/api/v1/loyalty/points/history/", params)
+        force_authenticate(request, user=self.customer.user)
+        return PointsHistoryView.as_view()(request)
+
+    def test_pages_cover_every_row_once_in_order(self):
+        seen, cursor = [], None
+        while True:
+            params = {"business_id": self.business.id, "limit": 3}
+            if cursor:
+                params["cursor"] = cursor
+            data = self.get(**params).data
+            seen += [t["id"] for t in data["transactions"]]
+            cursor = data["pagination"]["next_cursor"]
+            self.assertEqual(data["pagination"]["has_next"], cursor is not None)
+            if not cursor:
+                break
+        self.assertEqual(seen, self.expected)
+
+    def test_count_only_on_request(self):
+        self.assertIsNone(self.get(business_id=self.business.id).data["pagination"]["count"])
+        self.assertEqual(self.get(business_id=self.business.id, with_count=1).data["pagination"]["count"], 7)
+
+    def test_type_filter_and_cursor_compose(self):
+        data = self.get(business_id=self.business.id, type="earned", limit=2).data
+        rest = self.get(business_id=self.business.id, type="earned", cursor=data["pagination"]["next_cursor"]).data
+        ids = [t["id"] for t in data["transactions"] + rest["transactions"]]
+        earned = set(Transaction.objects.filter(wallet=self.wallet, amount__gt=0).values_list("id", flat=True))
+        self.assertEqual(ids, [pk for pk in self.expected if pk in earned])
+
+    def test_invalid_cursor_is_400(self):
+        response = self.get(cursor="garbage")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("cursor", response.data)
+
+    def test_legacy_offset(self):
+        data = self.get(business_id=self.business.id, offset=2, limit=3).data
+        self.assertEqual([t["id"] for t in data["transactions"]], self.expected[2:5])
+        self.assertEqual(data["pagination"]["offset"], 2)
+        self.assertTrue(data["pagination"]["has_next"])
+
+
+class RewardsHistoryKeysetTests(TestCase):
+    def test_pages_cover_every_row_once(self):
+        customer = factories.customer()
+        wallet = factories.wallet(customer, factories.business(), points=0)
+        for points in range(1, 6):
+            PointsTransaction.objects.create(wallet=wallet, points=points)
+        expected = list(PointsTransaction.objects.filter(wallet=wallet).order_by("-created_at", "-id").values_list("id", flat=True))
+
+        seen, params = [], {"limit": 2}
+        while True:
+            request = APIRequestFactory().get("/api/v1/rewards/history/", params)
+            force_authenticate(request, user=customer.user)
+            data = RewardsHistoryView.as_view()(request).data
+            seen += [row["id"] for row in data["results"]]
+            if not data["next_cursor"]:
+                break
+            params = {"limit": 2, "cursor": data["next_cursor"]}
+        self.assertEqual(seen, expected)
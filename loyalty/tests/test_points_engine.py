@@ -0,0 +1,229 @@
+import json
+import uuid
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import transaction
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from accounts.models import Profile
+from campaigns.models import Campaign
+from loyalty import points_engine
+from loyalty.models import CustomerPointsSummary, Customer, Product, Transaction, Wallet
+from loyalty.views import ScanStampView
+from partners.views import check_phone_for_qr, verify_code_and_generate_qr
+from qr.models import QRCode
+from qr.views import process_qr_payment
+from rewards.models import PointsTransaction
+from rewards.views import BatchScanView, QRProductScanView, QRScanAwardPointsView, RedeemPointsView
+
+from . import factories
+from .queries import CaptureStatements
+
+
+
+class PointsEngineTests(TestCase):
+    def setUp(self):
+        self.business = factories.business(reward_point_cost=10)
+        self.customer = factories.customer()
+
+    def summary(self):
+        return CustomerPointsSummary.objects.get(customer=self.customer)
+
+    def test_award_creates_wallet_and_writes_ledger(self):
+        with transaction.atomic():
+            result = points_engine.award(self.customer, self.business, 4, note="scan")
+        self.assertTrue(result.wallet_created)
+        self.assertEqual((result.points_balance, result.reward_point_cost), (4, 10))
+        self.assertFalse(result.achieved)
+        self.assertEqual(list(PointsTransaction.objects.values_list("points", "note")), [(4, "scan")])
+        summary = self.summary()
+        self.assertEqual((summary.total_balance, summary.lifetime_earned, summary.wallet_count), (4, 4, 1))
+
+    def test_award_existing_wallet_takes_three_statements(self):
+        factories.wallet(self.customer, self.business, points=1, reward_point_cost=10)
+        with transaction.atomic():
+            points_engine.award(self.customer, self.business, 1)
+        with CaptureStatements() as ctx:
+            result = points_engine.award(self.customer, self.business, 9, ledger=points_engine.LOYALTY_LEDGER)
+        self.assertEqual(len(ctx.statements), 3, ctx.statements)
+        self.assertFalse(result.wallet_created)
+        self.assertTrue(result.achieved)
+        self.assertEqual(Transaction.objects.get().amount, 9)
+
+    def test_redeem_insufficient_raises_without_writing(self):
+        factories.wallet(self.customer, self.business, points=3)
+        with self.assertRaises(points_engine.InsufficientPoints) as raised:
+            points_engine.redeem(self.customer, self.business, 5)
+        self.assertEqual((raised.exception.current_balance, raised.exception.required), (3, 5))
+        self.assertFalse(PointsTransaction.objects.exists())
+        self.assertEqual(points_engine.wallet_balance(self.customer, self.business), 3)
+
+    def test_redeem_without_wallet_creates_nothing(self):
+        with self.assertRaises(points_engine.InsufficientPoints):
+            points_engine.redeem(self.customer, self.business, 1)
+        self.assertFalse(Wallet.objects.exists())
+
+    def test_redeem_updates_summary(self):
+        with transaction.atomic():
+            points_engine.award(self.customer, self.business, 8)
+            points_engine.redeem(self.customer, self.business, 5)
+        summary = self.summary()
+        self.assertEqual((summary.total_balance, summary.lifetime_earned, summary.lifetime_redeemed), (3, 8, 5))
+        self.assertEqual(points_engine.total_points(self.customer), 3)
+
+
+    def test_signed_amounts_are_rejected(self):
+        for call in (points_engine.award, points_engine.redeem):
+            with self.subTest(call=call.__name__), self.assertRaises(ValueError):
+                call(self.customer, self.business, -5)
+        self.assertFalse(Wallet.objects.exists())
+
+
+class ScanStampAmountTests(TestCase):
+    def setUp(self):
+        self.business = factories.business(reward_point_cost=100)
+        self.customer = factories.customer()
+        self.wallet = factories.wallet(self.customer, self.business, points=5, reward_point_cost=100)
+
+    def scan(self, **data):
+        request = APIRequestFactory().post("/api/v1/scan/", {"business_id": self.business.id, **data}, format="json")
+        force_authenticate(request, user=self.customer.user)
+        return ScanStampView.as_view()(request)
+
+    def test_amount_is_added(self):
+        response = self.scan(amount=3)
+        self.assertEqual((response.status_code, response.data["points_balance"]), (200, 8))
+        self.assertEqual(list(Transaction.objects.values_list("amount", flat=True)), [3])
+
+    def test_invalid_amounts_are_rejected_without_writing(self):
+        for amount in (-50, 0, "abc", None):
+            with self.subTest(amount=amount):
+                response = self.scan(amount=amount)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.data["error"], "Invalid amount")
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.points_balance, 5)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_amount_is_ignored_with_a_product(self):
+        product = factories.product(self.business, points_reward=2)
+        response = self.scan(product_id=product.id, amount=-50)
+        self.assertEqual((response.status_code, response.data["points_balance"]), (200, 7))
+
+
+class PointsEndpointQueryBudgetTests(TestCase):
+    """SQL statements per call of the endpoints that go through the engine, with an existing wallet."""
+
+    # Raise only together with a reason
+    BUDGETS = {
+        "loyalty.ScanStampView (award)": 7,
+        "loyalty.ScanStampView (redeem)": 7,
+        "qr.process_qr_payment": 6,
+        "rewards.QRScanAwardPointsView": 7,
+        "rewards.RedeemPointsView": 6,
+        "rewards.QRProductScanView": 10,
+        "partners.verify_code_and_generate_qr": 5,
+        "partners.check_phone_for_qr": 5,
+        # 200 scans over 4 customers; must not grow with the batch size (SQLite splits the
+        # two 200-row inserts in two statements each, PostgreSQL needs 11)
+        "rewards.BatchScanView (200 scans)": 13,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.suffix = uuid.uuid4().hex[:8]
+        cls.phone = f"+49{cls.suffix}"
+        cls.owner = factories.user("owner")
+        cls.user = factories.user("customer")
+        Profile.objects.filter(user=cls.user).update(role=Profile.Role.CUSTOMER, phone=cls.phone)
+        cls.business = factories.business(owner=cls.owner, reward_point_cost=10)
+        customer = Customer.objects.create(user=cls.user, phone=cls.phone)
+        Wallet.objects.create(customer=customer, business=cls.business, reward_point_cost=10)
+        cls.batch_customers = [customer.id]
+        for _ in range(3):
+            other = factories.customer()
+            Wallet.objects.create(customer=other, business=cls.business, reward_point_cost=10)
+            cls.batch_customers.append(other.id)
+        cls.menu_item = Product.objects.create(business=cls.business, title="Menu", points_reward=5)
+        cls.reward = Product.objects.create(business=cls.business, title="Reward", points_reward=3, is_reward=True)
+        campaign = Campaign.objects.create(business=cls.business, name="Budget", points_per_scan=2)
+        cls.qr_award = QRCode.objects.create(business=cls.business, campaign=campaign, token=QRCode.generate_token())
+        cls.qr_payment = QRCode.objects.create(business=cls.business, token=QRCode.generate_token())
+
+    def setUp(self):
+        self.factory = APIRequestFactory()
+        # Fresh instances, as a request would see them
+        self.user = User.objects.get(pk=self.user.pk)
+        self.owner = User.objects.get(pk=self.owner.pk)
+
+    def api(self, view, path, data, as_user=None):
+        request = self.factory.post(path, data, format="json")
+        force_authenticate(request, user=as_user or self.user)
+        response = view(request)
+        response.render()
+        return response
+
+    def partner(self, view, path, data, session=None):
+        request = self.factory.post(path, json.dumps(data), content_type="application/json")
+        request.user = self.owner
+        request.session = SessionStore()
+        request.session.update(session or {})
+        return view(request)
+
+    def assertWithinBudget(self, name, call):
+        with CaptureStatements() as ctx:
+            response = call()
+        self.assertLess(response.status_code, 400, f"{name}: {getattr(response, 'content', b'')[:300]!r}")
+        self.assertLessEqual(len(ctx.statements), self.BUDGETS[name], "\n".join([name, *ctx.statements]))
+
+    def test_scan_stamp_award(self):
+        self.assertWithinBudget("loyalty.ScanStampView (award)", lambda: self.api(
+            ScanStampView.as_view(), "/api/v1/scan/", {"business_id": self.business.id, "product_id": self.menu_item.id}))
+
+    def test_scan_stamp_redeem(self):
+        Wallet.objects.filter(customer__user=self.user).update(points_balance=5)
+        self.assertWithinBudget("loyalty.ScanStampView (redeem)", lambda: self.api(
+            ScanStampView.as_view(), "/api/v1/scan/", {"business_id": self.business.id, "product_id": self.reward.id}))
+
+    def test_qr_payment(self):
+        self.assertWithinBudget("qr.process_qr_payment", lambda: self.api(
+            process_qr_payment, "/api/v1/qr/payment/", {"token": self.qr_payment.token, "amount": 4}))
+
+    def test_qr_scan_award(self):
+        self.assertWithinBudget("rewards.QRScanAwardPointsView", lambda: self.api(
+            QRScanAwardPointsView.as_view(), "/api/v1/rewards/scan/", {"token": self.qr_award.token}))
+
+    def test_redeem_points(self):
+        Wallet.objects.filter(customer__user=self.user).update(points_balance=5)
+        self.assertWithinBudget("rewards.RedeemPointsView", lambda: self.api(
+            RedeemPointsView.as_view(), "/api/v1/rewards/redeem/", {"business_id": self.business.id, "amount": 1}))
+
+    def test_qr_product_scan(self):
+        self.assertWithinBudget("rewards.QRProductScanView", lambda: self.api(
+            QRProductScanView.as_view(), "/api/v1/rewards/scan-products/",
+            {"business_id": self.business.id, "product_ids": [self.menu_item.id], "qr_timestamp": self.suffix}))
+
+    def test_partner_verify_code(self):
+        self.assertWithinBudget("partners.verify_code_and_generate_qr", lambda: self.partner(
+            verify_code_and_generate_qr, "/partners/qr/verify-code/",
+            {"phone": self.phone, "code": "1234", "business_id": self.business.id, "product_ids": [self.menu_item.id]},
+            session={f"verification_code_{self.phone}": "1234"}))
+
+    def test_partner_check_phone(self):
+        self.assertWithinBudget("partners.check_phone_for_qr", lambda: self.partner(
+            check_phone_for_qr, "/partners/qr/check-phone/", {"phone": self.phone, "business_id": self.business.id}))
+
+    def test_batch_scan(self):
+        batch = [
+            {
+                "idempotency_key": f"{self.suffix}-{i}",
+                "business_id": self.business.id,
+                "customer_id": self.batch_customers[i % len(self.batch_customers)],
+                "product_ids": [self.menu_item.id] if i % 3 else [self.menu_item.id, self.reward.id],
+            }
+            for i in range(200)
+        ]
+        self.assertWithinBudget("rewards.BatchScanView (200 scans)", lambda: self.api(
+            BatchScanView.as_view(), "/api/v1/rewards/scan-products/batch/", {"scans": batch}, as_user=self.owner))
@@ -0,0 +1,177 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone as dt_timezone
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from loyalty import ledger_rollup, points_engine, reconcile
+from loyalty.management.commands import reconcile_wallets
+from loyalty.models import CustomerPointsSummary, Transaction, Wallet
+from rewards.models import PointsTransaction
+
+from . import factories
+
+
+def at(year, month, day=15):
+    return datetime(year, month, day, 12, tzinfo=dt_timezone.utc)
+
+
+class ReconcileTestCase(TestCase):
+    def setUp(self):
+        self.business, self.other_business = factories.business(), factories.business()
+        self.customer = factories.customer()
+        self.matching = self.wallet(self.business, 10, points=[10])
+        # Both ledgers count: 12 - 2
+        self.drifted = self.wallet(self.business, 7, points=[12], amounts=[-2], customer=self.customer)
+        self.negative = self.wallet(self.business, 0, points=[-5])
+        self.other = self.wallet(self.other_business, 1, points=[4], customer=self.customer)
+
+    def wallet(self, business, balance, points=(), amounts=(), customer=None, when=None):
+        wallet = factories.wallet(customer or factories.customer(), business, points=balance)
+        for value in points:
+            self.entry(PointsTransaction, wallet, points=value, when=when)
+        for value in amounts:
+            self.entry(Transaction, wallet, amount=value, when=when)
+        return wallet
+
+    def entry(self, model, wallet, when=None, **fields):
+        row = model.objects.create(wallet=wallet, **fields)
+        if when is not None:
+            model.objects.filter(pk=row.pk).update(created_at=when)
+
+    def balance(self, wallet):
+        return Wallet.objects.values_list("points_balance", flat=True).get(pk=wallet.pk)
+
+    def drift(self, checkpoints=None):
+        found = reconcile.find_drift(
+            [self.business.pk, self.other_business.pk],
+            reconcile.current_checkpoints() if checkpoints is None else checkpoints,
+        )
+        return {(d.wallet_id, d.stored_balance, d.ledger_balance, d.action) for d in found}
+
+
+class FindDriftTests(ReconcileTestCase):
+    def expected(self, other_ledger=4):
+        return {
+            (self.drifted.pk, 7, 10, reconcile.WOULD_CORRECT),
+            (self.negative.pk, 0, -5, reconcile.NEGATIVE_LEDGER),
+            (self.other.pk, 1, other_ledger, reconcile.WOULD_CORRECT),
+        }
+
+    def test_live_rows(self):
+        self.assertEqual(self.drift(), self.expected())
+
+    def test_rolled_up_months(self):
+        # January is rolled up first, February and March by a later run
+        for month, value in ((1, 3), (2, 5), (3, -2)):
+            self.entry(PointsTransaction, self.other, points=value, when=at(2026, month))
+            self.entry(Transaction, self.other, amount=value, when=at(2026, month))
+        for ledger in ledger_rollup.LEDGERS:
+            ledger_rollup.roll_up(ledger, now=at(2026, 2, 2))
+        frozen = reconcile.current_checkpoints()
+        for ledger in ledger_rollup.LEDGERS:
+            ledger_rollup.roll_up(ledger, now=at(2026, 4, 2))
+
+        self.assertEqual(self.drift(), self.expected(other_ledger=16))
+        # Months rolled up after the checkpoints were read are not counted twice
+        self.assertEqual(self.drift(frozen), self.expected(other_ledger=16))
+
+        for ledger in ledger_rollup.LEDGERS:
+            ledger_rollup.archive(ledger, before=at(2026, 4, 2))
+        self.assertEqual(self.drift(), self.expected(other_ledger=16))
+
+
+class ApplyCorrectionsTests(ReconcileTestCase):
+    def test_corrects_and_refreshes_total_balance(self):
+        checkpoints = reconcile.current_checkpoints()
+        result = reconcile.apply_corrections(reconcile.find_drift([self.business.pk], checkpoints), checkpoints)
+        self.assertEqual(
+            {(d.wallet_id, d.action) for d in result},
+            {(self.drifted.pk, reconcile.CORRECTED), (self.negative.pk, reconcile.NEGATIVE_LEDGER)},
+        )
+        self.assertEqual((self.balance(self.drifted), self.balance(self.negative)), (10, 0))
+        self.assertEqual(CustomerPointsSummary.objects.get(customer=self.customer).total_balance, 10 + 1)
+        self.assertEqual(self.drift(), {
+            (self.negative.pk, 0, -5, reconcile.NEGATIVE_LEDGER),
+            (self.other.pk, 1, 4, reconcile.WOULD_CORRECT),
+        })
+
+    def test_drift_gone_at_lock_time(self):
+        checkpoints = reconcile.current_checkpoints()
+        drift = reconcile.find_drift([self.business.pk], checkpoints)
+        # A redeem finished between the scan and the lock
+        Wallet.objects.filter(pk=self.drifted.pk).update(points_balance=8)
+        self.entry(PointsTransaction, self.drifted, points=-2)
+        summary_before = CustomerPointsSummary.objects.get(customer=self.customer).total_balance
+
+        result = reconcile.apply_corrections(drift, checkpoints)
+        self.assertIn(
+            (self.drifted.pk, 8, 8, reconcile.RESOLVED),
+            {(d.wallet_id, d.stored_balance, d.ledger_balance, d.action) for d in result},
+        )
+        self.assertEqual(self.balance(self.drifted), 8)
+        self.assertEqual(CustomerPointsSummary.objects.get(customer=self.customer).total_balance, summary_before)
+
+
+class ReconcileCommandTests(ReconcileTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.report = os.path.join(directory, "report.csv")
+        self.state = os.path.join(directory, "state.json")
+        # Shards run in this process; closing the connection would end the test transaction
+        patcher = mock.patch.object(reconcile_wallets.connections, "close_all")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command(
+            "reconcile_wallets", *args, "--workers", "1", "--shard-size", "1",
+            "--report", self.report, "--state", self.state, stdout=out,
+        )
+        return out.getvalue()
+
+    def report_rows(self):
+        with open(self.report, newline="", encoding="utf-8") as fh:
+            return {(int(row["wallet_id"]), row["action"]) for row in csv.DictReader(fh)}
+
+    def write_state(self, checkpoints, done):
+        with open(self.state, "w", encoding="utf-8") as fh:
+            json.dump({
+                "apply": True,
+                "checkpoints": {ledger: until and until.isoformat() for ledger, until in checkpoints.items()},
+                "done": done,
+            }, fh)
+
+    def test_dry_run(self):
+        self.run_command()
+        self.assertEqual(self.report_rows(), {
+            (self.drifted.pk, reconcile.WOULD_CORRECT),
+            (self.negative.pk, reconcile.NEGATIVE_LEDGER),
+            (self.other.pk, reconcile.WOULD_CORRECT),
+        })
+        self.assertEqual(self.balance(self.drifted), 7)
+        self.assertFalse(os.path.exists(self.state))
+
+    def test_resume_skips_finished_shards(self):
+        self.write_state(reconcile.current_checkpoints(), [[self.business.pk, self.business.pk]])
+        out = self.run_command("--apply", "--resume")
+        self.assertIn("shard 1/1: 1 drifted wallets", out)
+        self.assertEqual(self.report_rows(), {(self.other.pk, reconcile.CORRECTED)})
+        self.assertEqual((self.balance(self.drifted), self.balance(self.other)), (7, 4))
+        self.assertFalse(os.path.exists(self.state))
+
+    def test_resume_refused_after_the_checkpoints_moved(self):
+        self.write_state(reconcile.current_checkpoints(), [[self.business.pk, self.business.pk]])
+        ledger_rollup.roll_up(points_engine.REWARDS_LEDGER, now=at(2026, 2, 2))
+        with self.assertRaisesMessage(CommandError, "start again without --resume"):
+            self.run_command("--apply", "--resume")
+        self.assertEqual(self.balance(self.other), 1)
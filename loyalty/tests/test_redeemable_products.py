@@ -0,0 +1,94 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from loyalty import reward_index
+from loyalty.models import Product, Wallet
+from rewards import eligibility
+from rewards.views import RedeemableProductsView
+
+from . import factories
+from .queries import CaptureStatements
+
+
+class EvaluateTests(TestCase):
+    def test_balances_are_checked_per_business(self):
+        first, second = factories.business(), factories.business()
+        cheap = Product(business=first, points_reward=10)
+        dear = Product(business=first, points_reward=30)
+        elsewhere = Product(business=second, points_reward=1)
+        balances = eligibility.Balances({first.id: 20}, 20)
+        result = eligibility.evaluate([cheap, dear, elsewhere], balances)
+        self.assertEqual([(e.user_points, e.can_redeem) for e in result], [(20, True), (20, False), (0, False)])
+
+    def test_anonymous_can_redeem_nothing(self):
+        product = Product(business=factories.business(), points_reward=0)
+        self.assertEqual(eligibility.evaluate([product], None), [eligibility.Eligibility(product, None, False)])
+
+
+class RedeemableProductsViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        owner = factories.user("owner")
+        cls.businesses = [factories.business(owner=owner, reward_point_cost=10) for _ in range(4)]
+        for i in range(60):
+            factories.product(cls.businesses[i % 4], points_reward=(i % 50) + 1, is_reward=True)
+        factories.product(cls.businesses[0], points_reward=1, is_reward=True, active=False)
+        factories.product(cls.businesses[0], points_reward=1)
+        cls.customer = factories.customer()
+        # Wallets at every other business only: the rest show 0 points without being created
+        for business in cls.businesses[::2]:
+            factories.wallet(cls.customer, business, points=25, reward_point_cost=10)
+
+    def setUp(self):
+        # Products come from setUpTestData; the test transaction never commits an invalidation
+        reward_index._index = None
+        self.user = User.objects.get(pk=self.customer.user_id)
+
+    def get(self, as_user=None, **params):
+        request = APIRequestFactory().get("/api/v1/rewards/redeemable-products/", params)
+        if as_user is not None:
+            force_authenticate(request, user=as_user)
+        with CaptureStatements() as ctx:
+            response = RedeemableProductsView.as_view()(request)
+            response.render()
+        return response, ctx
+
+    def test_lists_active_rewards_cheapest_first(self):
+        response, _ = self.get(limit=200)
+        points = [item["points_required"] for item in response.data["products"]]
+        self.assertEqual(len(points), 60)
+        self.assertEqual(points, sorted(points))
+        self.assertEqual(response.data["pagination"]["count"], 60)
+        self.assertNotIn("total_points", response.data)
+
+    def test_eligibility_follows_wallets(self):
+        response, _ = self.get(self.user, limit=200)
+        self.assertEqual(response.data["total_points"], 50)
+        with_wallet = {b.id for b in self.businesses[::2]}
+        for item in response.data["products"]:
+            points = 25 if item["business_id"] in with_wallet else 0
+            self.assertEqual(item["user_points"], points)
+            self.assertEqual(item["can_redeem"], points >= item["points_required"])
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        reward_index.get_reward_index()
+        for as_user in (None, self.user):
+            counts = set()
+            for size in (10, 30, 60):
+                response, ctx = self.get(as_user, limit=size)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data["products"]), size)
+                self.assertFalse(ctx.writes)
+                counts.add(len(ctx.statements))
+            self.assertEqual(len(counts), 1, counts)
+
+    def test_get_creates_no_wallet(self):
+        self.get(self.user)
+        self.assertEqual(Wallet.objects.filter(customer=self.customer).count(), 2)
+
+    def test_business_filter_and_pagination(self):
+        business = self.businesses[1]
+        response, _ = self.get(business_id=business.id, limit=10, offset=10)
+        self.assertEqual({item["business_id"] for item in response.data["products"]}, {business.id})
+        self.assertEqual(response.data["pagination"], {"count": 15, "limit": 10, "offset": 10, "has_next": False})
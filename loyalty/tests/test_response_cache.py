@@ -0,0 +1,76 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from loyalty import cache_versions, response_cache
+
+from . import factories
+
+
+class MenuResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.business = factories.business()
+        self.product = factories.product(self.business, title="Espresso", points_reward=2)
+        self.url = f"/api/v1/menu/{self.business.id}/"
+
+    def get(self, **headers):
+        return self.client.get(self.url, headers=headers)
+
+    def titles(self, response):
+        return [item["title"] for item in response.json()["menu_items"]]
+
+    def test_hit_after_miss(self):
+        first = self.get()
+        self.assertEqual((first.status_code, first["X-Cache"]), (200, "MISS"))
+        second = self.get()
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(second.content, first.content)
+
+    def test_product_change_invalidates_on_commit(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.title = "Ristretto"
+            self.product.save()
+        response = self.get()
+        self.assertEqual((response["X-Cache"], self.titles(response)), ("MISS", ["Ristretto"]))
+
+    def test_change_in_another_process_is_seen(self):
+        self.get()
+        # Another process commits a change and bumps the version row; the
+        # rendered JSON held by this process's cache is not touched
+        type(self.product).objects.filter(pk=self.product.pk).update(title="Lungo")
+        cache_versions.bump(f"response:{self.business.id}")
+        response = self.get()
+        self.assertEqual((response["X-Cache"], self.titles(response)), ("MISS", ["Lungo"]))
+
+    def test_etag_is_the_same_in_every_process(self):
+        etag = self.get()["ETag"]
+        # An empty cache, as in a fresh process, gives the same validator
+        cache.clear()
+        self.assertEqual(self.get()["ETag"], etag)
+        self.assertEqual(self.get(if_none_match=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response_cache.invalidate(self.business.id)
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_version_is_read_once_per_request(self):
+        self.get()
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.get()["X-Cache"], "HIT")
+        reads = [q["sql"] for q in ctx.captured_queries if "loyalty_cacheversion" in q["sql"]]
+        self.assertEqual(len(reads), 1, reads)
+
+    def test_other_business_is_not_invalidated(self):
+        other = factories.business()
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            response_cache.invalidate(other.id)
+        self.assertEqual(self.get()["X-Cache"], "HIT")
+        self.assertEqual(
+            response_cache.versions(self.business.id, other.id, response_cache.ALL), (0, 1, 1)
+        )
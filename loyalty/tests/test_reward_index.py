@@ -0,0 +1,74 @@
+import random
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from loyalty import cache_versions, reward_index
+from loyalty.models import Product
+
+from . import factories
+
+
+class RewardIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        owner = factories.user("owner")
+        cls.businesses = [factories.business(owner=owner) for _ in range(5)]
+        Product.objects.bulk_create(
+            Product(business=cls.businesses[i % 5], title=f"Reward {i}", points_reward=rng.randint(1, 100), is_reward=True)
+            for i in range(300)
+        )
+        Product.objects.bulk_create([
+            Product(business=cls.businesses[0], title="Inactive", points_reward=1, is_reward=True, active=False),
+            Product(business=cls.businesses[0], title="Menu", points_reward=1),
+        ])
+
+    def setUp(self):
+        reward_index._index = None
+
+    def test_lookups_match_the_database(self):
+        index = reward_index.build()
+        rng = random.Random(7)
+        for i in range(100):
+            max_points = rng.randint(0, 110)
+            business_id = rng.choice(self.businesses).id if i % 2 else None
+            qs = Product.objects.filter(active=True, is_reward=True, points_reward__lte=max_points)
+            if business_id is not None:
+                qs = qs.filter(business_id=business_id)
+            qs = qs.order_by("points_reward", "id")
+            expected = list(qs.values_list("id", flat=True))
+            self.assertEqual(index.count(max_points=max_points, business_id=business_id), len(expected))
+            self.assertEqual(index.page(5, 20, max_points=max_points, business_id=business_id), expected[5:25])
+        self.assertEqual(index.count(business_id=0), 0)
+        self.assertEqual(index.page(400, 10), [])
+
+    def test_product_change_bumps_the_shared_version_on_commit(self):
+        before = cache_versions.get(reward_index.VERSION_SCOPE)
+        product = Product.objects.filter(is_reward=True).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.active = False
+            product.save()
+            self.assertEqual(cache_versions.get(reward_index.VERSION_SCOPE), before)
+        self.assertEqual(cache_versions.get(reward_index.VERSION_SCOPE), before + 1)
+        self.assertEqual(len(reward_index.get_reward_index()), 299)
+
+    @override_settings(REWARD_INDEX_CHECK_INTERVAL=0)
+    def test_change_made_by_another_process_is_seen(self):
+        self.assertEqual(len(reward_index.get_reward_index()), 300)
+        # Another process: deactivates a reward and bumps the version row; no
+        # Django cache is shared with it
+        Product.objects.filter(pk=Product.objects.filter(is_reward=True).first().pk).update(active=False)
+        cache_versions.bump(reward_index.VERSION_SCOPE)
+        cache.clear()
+        self.assertEqual(len(reward_index.get_reward_index()), 299)
+
+    @override_settings(REWARD_INDEX_CHECK_INTERVAL=0, REWARD_INDEX_MAX_AGE=0)
+    def test_change_without_signal_is_seen_after_max_age(self):
+        self.assertEqual(len(reward_index.get_reward_index()), 300)
+        Product.objects.filter(title="Inactive").update(active=True)
+        self.assertEqual(len(reward_index.get_reward_index()), 301)
+
+    def test_unchanged_index_is_reused(self):
+        index = reward_index.get_reward_index()
+        self.assertIs(reward_index.get_reward_index(), index)
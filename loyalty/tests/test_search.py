@@ -0,0 +1,103 @@
+from django.test import TestCase
+
+from loyalty import search
+from loyalty.models import Product, SearchDocument
+from reviews.models import Service
+
+from . import factories
+from .queries import CaptureStatements
+
+Kind = search.Kind
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        self.cafe = factories.business(name="Cafe Central", description="Kuchen und Torte", address="Hauptstrasse 1")
+        self.pizzeria = factories.business(name="Pizzeria Roma", description="Pizza, pasta and a cafe corner")
+        self.latte = factories.product(self.cafe, title="Latte Macchiato")
+        self.espresso = factories.product(self.cafe, title="Espresso")
+
+    def ids(self, query, kind, limit=50):
+        return [hit.object_id for hit in search.search(query, kind, limit)]
+
+    def test_signals_keep_documents_in_sync(self):
+        self.assertEqual(self.ids("espresso", Kind.PRODUCT), [self.espresso.id])
+        self.espresso.title = "Ristretto"
+        self.espresso.save()
+        self.assertEqual(self.ids("espresso", Kind.PRODUCT), [])
+        self.assertEqual(self.ids("ristretto", Kind.PRODUCT), [self.espresso.id])
+
+        self.espresso.active = False
+        self.espresso.save()
+        self.assertFalse(SearchDocument.objects.filter(kind=Kind.PRODUCT, object_id=self.espresso.id).exists())
+        self.latte.delete()
+        self.assertEqual(self.ids("latte", Kind.PRODUCT), [])
+
+    def test_prefix_terms_must_all_match(self):
+        self.assertEqual(self.ids("lat mac", Kind.PRODUCT), [self.latte.id])
+        self.assertEqual(self.ids("latte pizza", Kind.PRODUCT), [])
+        self.assertEqual(self.ids("haupt", Kind.BUSINESS), [self.cafe.id])
+        self.assertEqual(search.search("!!! ???", Kind.BUSINESS, 10), [])
+
+    def test_title_match_ranks_first(self):
+        self.assertEqual(self.ids("cafe", Kind.BUSINESS), [self.cafe.id, self.pizzeria.id])
+
+    def test_services(self):
+        service = Service.objects.create(business=self.cafe, name="Latte art class", description="Learn it")
+        self.assertEqual(self.ids("latte", Kind.SERVICE), [service.id])
+        self.assertEqual(search.counts("latte"), {Kind.BUSINESS: 0, Kind.PRODUCT: 1, Kind.SERVICE: 1})
+
+    def test_keyset_pages_cover_every_match_once(self):
+        Product.objects.bulk_create(Product(business=self.pizzeria, title=f"Pizza {i}") for i in range(23))
+        self.assertEqual(search.rebuild(), 2 + 25)
+        seen, after = [], None
+        while True:
+            page = search.search("pizza", Kind.PRODUCT, 5, after=after)
+            if not page:
+                break
+            seen += [hit.object_id for hit in page]
+            after = search.decode_cursor(search.encode_cursor(page[-1]))
+        self.assertEqual(len(seen), 23)
+        self.assertEqual(set(seen), set(Product.objects.filter(title__startswith="Pizza").values_list("id", flat=True)))
+
+    def test_invalid_cursor(self):
+        for cursor in ("", "not-base64!", search.encode_cursor(search.Hit("nope", 1, 0.0, 1))):
+            with self.assertRaises(ValueError):
+                search.decode_cursor(cursor)
+
+
+class SearchViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        business = factories.business(name="Cafe Latte")
+        Product.objects.bulk_create(Product(business=business, title=f"Latte {i}") for i in range(30))
+        search.rebuild()
+
+    def get(self, **params):
+        with CaptureStatements() as ctx:
+            response = self.client.get("/api/v1/search/", params)
+        return response, ctx.statements
+
+    def test_counts_and_pages(self):
+        response, _ = self.get(q="latte", limit=10)
+        data = response.json()
+        self.assertEqual(data["counts"], {"businesses": 1, "products": 30, "services": 0})
+        self.assertEqual(len(data["results"]["products"]), 10)
+        self.assertIsNone(data["next"]["services"])
+
+        seen = {item["id"] for item in data["results"]["products"]}
+        cursor = data["next"]["products"]
+        while cursor:
+            page = self.get(q="latte", limit=10, cursor=cursor)[0].json()
+            self.assertEqual(set(page["results"]), {"products"})
+            seen |= {item["id"] for item in page["results"]["products"]}
+            cursor = page["next"]["products"]
+        self.assertEqual(len(seen), 30)
+
+    def test_query_count_does_not_grow_with_limit(self):
+        counts = {len(self.get(q="latte", limit=limit)[1]) for limit in (5, 20, 50)}
+        self.assertEqual(len(counts), 1, counts)
+
+    def test_errors(self):
+        self.assertEqual(self.get()[0].status_code, 400)
+        self.assertEqual(self.get(q="latte", cursor="garbage")[0].status_code, 400)
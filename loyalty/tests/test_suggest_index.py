@@ -0,0 +1,84 @@
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from loyalty import cache_versions, suggest_index
+from loyalty.models import Favorite, Product
+
+from . import factories
+
+
+class SuggestIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mueller = factories.business(name="Café Müller")
+        cls.muesli = factories.business(name="Müsli Bar")
+        cls.bakery = factories.business(name="Bäckerei Schmidt")
+        cls.latte = factories.product(cls.mueller, title="Latte Macchiato")
+        factories.product(cls.mueller, title="Hidden Latte", active=False)
+        # Popularity: favorites + wallets of the business
+        for _ in range(3):
+            Favorite.objects.create(customer=factories.customer(), business=cls.muesli)
+        Product.objects.bulk_create(Product(business=cls.bakery, title=f"Brötchen {i}") for i in range(200))
+
+    def setUp(self):
+        self.index = suggest_index.build()
+
+    def names(self, query, **kwargs):
+        return [entry["name"] for entry in self.index.lookup(query, **kwargs)]
+
+    def test_umlauts_and_accents_fold(self):
+        for query in ("müs", "mues", "mus", "MÜS"):
+            self.assertEqual(self.names(query), ["Müsli Bar"], query)
+        self.assertEqual(self.names("caf"), ["Café Müller"])
+        self.assertEqual(self.names("back"), ["Bäckerei Schmidt"])
+
+    def test_word_starts_and_phrases(self):
+        self.assertEqual(self.names("mac"), ["Latte Macchiato"])
+        self.assertEqual(self.names("latte mac"), ["Latte Macchiato"])
+        self.assertEqual(self.names("hidden"), [])
+        self.assertEqual(self.names(""), [])
+
+    def test_popular_businesses_first(self):
+        self.assertEqual(self.names("mu")[:2], ["Müsli Bar", "Café Müller"])
+
+    def test_kind_and_limit(self):
+        self.assertEqual(self.names("caf", kind="product"), [])
+        found = self.index.lookup("bro", limit=5, kind="product")
+        self.assertEqual(len(found), 5)
+        self.assertTrue(all(entry["business_id"] == self.bakery.id for entry in found))
+        self.assertEqual(len(self.index.lookup("b", limit=100)), suggest_index.MAX_RESULTS)
+
+
+class SuggestFreshnessTests(TestCase):
+    def setUp(self):
+        suggest_index._index = None
+        suggest_index._building = False
+        self.business = factories.business(name="Kiosk am Eck")
+
+    def test_endpoint_runs_no_query_with_a_fresh_index(self):
+        suggest_index.get_suggest_index()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/v1/search/suggest/", {"q": "kio"})
+        self.assertEqual([s["name"] for s in response.json()["suggestions"]], ["Kiosk am Eck"])
+        self.assertEqual(ctx.captured_queries, [])
+
+    def test_name_change_bumps_the_shared_version_on_commit(self):
+        before = cache_versions.get(suggest_index.VERSION_SCOPE)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.business.name = "Kiosk am Markt"
+            self.business.save()
+        self.assertEqual(cache_versions.get(suggest_index.VERSION_SCOPE), before + 1)
+
+    @override_settings(SUGGEST_INDEX_CHECK_INTERVAL=0)
+    def test_change_in_another_process_starts_a_rebuild(self):
+        index = suggest_index.get_suggest_index()
+        cache_versions.bump(suggest_index.VERSION_SCOPE)
+        version = cache_versions.get(suggest_index.VERSION_SCOPE)
+        with mock.patch.object(suggest_index.threading, "Thread") as thread:
+            # The previous snapshot keeps answering while the new one is built
+            self.assertIs(suggest_index.get_suggest_index(), index)
+        thread.assert_called_once()
+        self.assertEqual(thread.call_args.kwargs["args"], (version,))
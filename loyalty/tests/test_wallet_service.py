@@ -0,0 +1,119 @@
+import random
+import threading
+
+from django.db import connection, connections
+from django.test import TestCase, TransactionTestCase
+
+from loyalty import wallet_service
+from loyalty.models import Wallet
+
+from . import factories
+
+
+class ApplyPointsTests(TestCase):
+    def setUp(self):
+        self.wallet = factories.wallet(points=10)
+
+    def balance(self):
+        return Wallet.objects.values_list("points_balance", flat=True).get(pk=self.wallet.pk)
+
+    def test_credit_and_debit_return_new_balance(self):
+        self.assertEqual(wallet_service.credit(self.wallet.pk, 5).points_balance, 15)
+        self.assertEqual(wallet_service.debit(self.wallet.pk, 15).points_balance, 0)
+        self.assertEqual(self.balance(), 0)
+
+    def test_overdraft_is_rejected_without_change(self):
+        self.assertIsNone(wallet_service.debit(self.wallet.pk, 11))
+        self.assertEqual(self.balance(), 10)
+
+    def test_signed_amounts_are_rejected(self):
+        with self.assertRaises(ValueError):
+            wallet_service.credit(self.wallet.pk, -5)
+        with self.assertRaises(ValueError):
+            wallet_service.debit(self.wallet.pk, -5)
+        self.assertEqual(self.balance(), 10)
+
+    def test_unknown_wallet(self):
+        self.assertIsNone(wallet_service.credit(self.wallet.pk + 1000, 5))
+
+    def test_sequence_never_goes_negative(self):
+        expected = 10
+        for delta in (5, 3, -7, -11, 2, -4, -30, 8, -9):
+            result = wallet_service.apply_points(self.wallet.pk, delta)
+            if expected + delta < 0:
+                self.assertIsNone(result)
+            else:
+                expected += delta
+                self.assertEqual(result.points_balance, expected)
+        self.assertEqual(self.balance(), expected)
+
+    def test_reward_point_cost_only_fills_unset_cost(self):
+        Wallet.objects.filter(pk=self.wallet.pk).update(reward_point_cost=0)
+        self.assertEqual(wallet_service.credit(self.wallet.pk, 1, reward_point_cost=50).reward_point_cost, 50)
+        self.assertEqual(wallet_service.credit(self.wallet.pk, 1, reward_point_cost=80).reward_point_cost, 50)
+        balance = wallet_service.apply_points(self.wallet.pk, 1, reward_point_cost=80, overwrite_reward_cost=True)
+        self.assertEqual(balance.reward_point_cost, 80)
+
+    def test_apply_points_for_addresses_customer_and_business(self):
+        balance = wallet_service.apply_points_for(self.wallet.customer_id, self.wallet.business_id, 7)
+        self.assertEqual((balance.wallet_id, balance.points_balance), (self.wallet.pk, 17))
+
+    def test_bulk_applies_only_wallets_meeting_their_floor(self):
+        other = factories.wallet(points=3)
+        result = wallet_service.apply_points_bulk({self.wallet.pk: (-4, 6), other.pk: (-1, 5)})
+        self.assertEqual(set(result), {self.wallet.pk})
+        self.assertEqual(result[self.wallet.pk].points_balance, 6)
+        other.refresh_from_db()
+        self.assertEqual(other.points_balance, 3)
+
+
+class ConcurrentUpdateTests(TransactionTestCase):
+    """Many threads on one wallet: no lost update, never below zero."""
+    THREADS = 8
+    OPERATIONS = 50
+
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            # Shared-cache in-memory SQLite raises "table is locked" instead of waiting
+            self.skipTest("needs a database that lets threads wait for each other")
+
+    def test_concurrent_credits_and_debits(self):
+        wallet = factories.wallet(points=20)
+        barrier = threading.Barrier(self.THREADS)
+        applied = [[] for _ in range(self.THREADS)]
+        observed = [[] for _ in range(self.THREADS)]
+        errors = []
+
+        def hammer(index):
+            rng = random.Random(index)
+            try:
+                barrier.wait()
+                for _ in range(self.OPERATIONS):
+                    points = rng.randint(1, 10)
+                    if rng.random() < 0.5:
+                        balance = wallet_service.credit(wallet.pk, points)
+                        delta = points
+                    else:
+                        balance = wallet_service.debit(wallet.pk, points)
+                        delta = -points
+                    if balance is not None:
+                        applied[index].append(delta)
+                        observed[index].append(balance.points_balance)
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=hammer, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        final = Wallet.objects.values_list("points_balance", flat=True).get(pk=wallet.pk)
+        self.assertEqual(final, 20 + sum(sum(deltas) for deltas in applied))
+        self.assertGreaterEqual(min(b for balances in observed for b in balances), 0)
+        self.assertGreaterEqual(final, 0)
+        # Some debits must have been refused for the guard to be exercised at all
+        self.assertLess(sum(len(deltas) for deltas in applied), self.THREADS * self.OPERATIONS)
@@ -9,9 +9,11 @@ urlpatterns = [
     path("auth/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("auth/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path("businesses/", views.BusinessListView.as_view(), name="business_list"),
+    path("businesses/nearby/", views.NearbyBusinessesView.as_view(), name="business_nearby"),
     path("products/", views.ProductListView.as_view(), name="product_list"),
     path("wallet/", views.MyWalletView.as_view(), name="wallet"),
     path("dashboard/", views.UserDashboardView.as_view(), name="user_dashboard"),
+    path("home/", views.HomeView.as_view(), name="home"),
     path("scan/", views.ScanStampView.as_view(), name="scan"),
     path("redeem/", views.RedeemView.as_view(), name="redeem"),
     path("points/history/", views.PointsHistoryView.as_view(), name="points_history"),
@@ -22,6 +24,7 @@ urlpatterns = [
     path("menu/", views.MenuListView.as_view(), name="menu_list"),
     path("unsplash/search/", views.UnsplashSearchView.as_view(), name="unsplash_search"),
     path("businesses/<int:business_id>/", views.BusinessDetailView.as_view(), name="business_detail"),
+    path("search/suggest/", views.SuggestView.as_view(), name="search_suggest"),
     path("search/", views.SearchView.as_view(), name="search"),
     path("favorites/toggle/", views.FavoriteToggleView.as_view(), name="favorite_toggle"),
     path("favorites/count/<int:business_id>/", views.FavoriteCountView.as_view(), name="favorite_count"),
@@ -6,15 +6,20 @@ from django.contrib.auth.models import User
 from django.conf import settings
 from django.core.cache import cache
 from django.db import transaction
-from django.db.models import Avg, Count, Q, Sum
+from django.db.models import Count
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from .models import Business, Product, Customer, Wallet, Transaction, Slider, Favorite
-from payments.models import Order
-from reviews.models import Review, Service
+from .pagination import KeysetPagination
+from .conditional import ConditionalGetMixin
+from .points_summary import get_points_summary
+from .request_context import FAVORITES_CONTEXT_KEY, request_customer
+from . import geo, home, ledger_rollup, points_engine, response_cache, reward_index, search, suggest_index, wallet_service
+from securityapp.idempotency import idempotent
+from reviews.models import Service
 from .serializers import (
     BusinessSerializer,
     ProductSerializer,
@@ -25,23 +30,26 @@ from .serializers import (
 )
 
 
-class BusinessListView(generics.ListAPIView):
+def _business_list_queryset(request):
+    """Businesses for BusinessSerializer lists; favorites are only counted when rendered (?fields= / ?omit=)."""
+    # Ratings come from the Business rating columns; only favorites need a join
+    queryset = Business.objects.all()
+    if BusinessSerializer.renders(request, "favorites_count"):
+        queryset = queryset.annotate(favorites_count_value=Count("favorites"))
+    return queryset
+
+
+class BusinessListView(ConditionalGetMixin, generics.ListAPIView):
     serializer_class = BusinessSerializer
     permission_classes = [permissions.AllowAny]
 
     def get_queryset(self):
-        queryset = Business.objects.annotate(
-            average_rating_value=Avg(
-                "reviews__rating",
-                filter=Q(reviews__status=Review.Status.APPROVED),
-            ),
-            review_count_value=Count(
-                "reviews",
-                filter=Q(reviews__status=Review.Status.APPROVED),
-            ),
-            favorites_count_value=Count("favorites"),
-        )
-        return queryset
+        return _business_list_queryset(self.request)
+
+    def get_validator(self, request):
+        # Any business change bumps the "all" version; is_favorite depends on the user
+        user_id = request.user.pk if request.user.is_authenticated else None
+        return (*response_cache.versions(response_cache.ALL, response_cache.FAVORITES, request=request), user_id)
     
     def get_serializer_context(self):
         """Pass request context to serializer for is_favorite check"""
@@ -50,6 +58,60 @@ class BusinessListView(generics.ListAPIView):
         return context
 
 
+class NearbyBusinessesView(APIView):
+    """
+    GET /api/v1/businesses/nearby/?lat=52.52&lng=13.405&radius=5&limit=50
+    Businesses within ``radius`` km (default 5, max 50), nearest first.
+    Candidates come from the geohash cells around the point (loyalty.geo);
+    businesses without coordinates are never returned.
+
+    Response format:
+    {
+        "count": 2,
+        "radius_km": 5.0,
+        "results": [{...business fields..., "distance_km": 0.42}]
+    }
+    """
+    permission_classes = [permissions.AllowAny]
+    default_radius_km = 5.0
+    max_radius_km = 50.0
+    default_limit = 50
+    max_limit = 200
+
+    def get(self, request):
+        try:
+            latitude = float(request.query_params["lat"])
+            longitude = float(request.query_params["lng"])
+            radius = float(request.query_params.get("radius", self.default_radius_km))
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {"error": "Invalid location", "detail": "lat and lng are required numbers; radius is in km"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180) or not 0 < radius <= self.max_radius_km:
+            return Response(
+                {"error": "Invalid location", "detail": f"lat/lng out of range or radius not in (0, {self.max_radius_km:g}]"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = min(max(int(request.query_params.get("limit", self.default_limit)), 1), self.max_limit)
+        except (TypeError, ValueError):
+            limit = self.default_limit
+
+        found = geo.nearby(Business.objects.all(), latitude, longitude, radius, limit=limit)
+        businesses = _business_list_queryset(request).in_bulk(
+            [pk for pk, _ in found]
+        )
+        # A business deleted in between is skipped
+        found = [(pk, distance) for pk, distance in found if pk in businesses]
+        results = BusinessSerializer(
+            [businesses[pk] for pk, _ in found], many=True, context={"request": request}
+        ).data
+        for data, (_, distance) in zip(results, found):
+            data["distance_km"] = round(distance, 3)
+        return Response({"count": len(results), "radius_km": radius, "results": results}, status=status.HTTP_200_OK)
+
+
 class ProductListView(generics.ListAPIView):
     queryset = Product.objects.filter(active=True)
     serializer_class = ProductSerializer
@@ -67,55 +129,7 @@ class UserDashboardView(APIView):
     def get(self, request):
         try:
             customer, _ = Customer.objects.get_or_create(user=request.user)
-            
-            # محاسبه تعداد سفارش‌ها
-            total_orders = Order.objects.filter(user=request.user, status=Order.Status.PAID).count()
-            
-            # محاسبه مجموع امتیازهای کسب شده
-            from rewards.models import PointsTransaction
-            total_points_earned = PointsTransaction.objects.filter(
-                wallet__customer=customer,
-                points__gt=0
-            ).aggregate(total=Sum("points")).get("total") or 0
-            
-            # محاسبه مجموع امتیازهای خرج شده
-            total_points_redeemed = abs(PointsTransaction.objects.filter(
-                wallet__customer=customer,
-                points__lt=0
-            ).aggregate(total=Sum("points")).get("total") or 0)
-            
-            # موجودی فعلی امتیازها - محاسبه از تاریخچه تراکنش‌ها (واقعی)
-            from rewards.models import PointsTransaction
-            
-            # محاسبه total_points_balance از مجموع همه PointsTransaction
-            all_points_transactions = PointsTransaction.objects.filter(wallet__customer=customer)
-            total_points_balance = all_points_transactions.aggregate(
-                total=Sum("points")
-            ).get("total") or 0
-            
-            # اگر total_points_balance 0 است و هیچ تراکنشی وجود ندارد، از Wallet.points_balance استفاده کن
-            if total_points_balance == 0 and not all_points_transactions.exists():
-                wallets = Wallet.objects.filter(customer=customer)
-                total_points_balance = sum(w.points_balance for w in wallets) or 0
-            
-            # تعداد business هایی که کاربر در آن‌ها فعال است
-            active_businesses_count = Wallet.objects.filter(customer=customer).count()
-            
-            # مجموع مبلغ خریدها (به یورو)
-            total_spent_cents = Order.objects.filter(
-                user=request.user,
-                status=Order.Status.PAID
-            ).aggregate(total=Sum("amount_cents")).get("total") or 0
-            total_spent_eur = round(total_spent_cents / 100.0, 2)
-            
-            return Response({
-                "total_orders": total_orders,
-                "total_points_earned": total_points_earned,
-                "total_points_redeemed": total_points_redeemed,
-                "total_points_balance": total_points_balance,
-                "active_businesses_count": active_businesses_count,
-                "total_spent_eur": total_spent_eur,
-            }, status=status.HTTP_200_OK)
+            return Response(home.dashboard(request.user, customer), status=status.HTTP_200_OK)
         except Exception as e:
             return Response(
                 {"error": str(e), "detail": "An error occurred while fetching dashboard data."},
@@ -123,13 +137,40 @@ class UserDashboardView(APIView):
             )
 
 
+class HomeView(APIView):
+    """
+    GET /api/v1/home/?include=slider,businesses,favorites,wallet,dashboard,redeemable_products
+    Everything the app home screen needs in one request (loyalty.home). Without
+    ?include= every section is returned; each has the payload of its own endpoint
+    (slider/, businesses/, favorites/, wallet/, dashboard/, rewards/redeemable-products/).
+    favorites, wallet and dashboard are null for anonymous requests.
+    """
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            include = home.parse_include(request.query_params.get("include"))
+        except ValueError as exc:
+            return Response({"error": "Invalid include", "detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(home.Home(request, include).build(), status=status.HTTP_200_OK)
+
+
 class MyWalletView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        customer, _ = Customer.objects.get_or_create(user=request.user)
-        wallets = Wallet.objects.filter(customer=customer).select_related("business")
-        data = WalletSerializer(wallets, many=True).data
+        # Read-only: a user without a customer simply has no wallets yet
+        customer = request_customer(request)
+        wallets = list(Wallet.objects.filter(customer=customer).select_related("business")) if customer else []
+        counts = dict(
+            Favorite.objects.filter(business_id__in=[w.business_id for w in wallets])
+            .values_list("business_id")
+            .annotate(n=Count("id"))
+            .order_by()
+        ) if wallets else {}
+        for wallet in wallets:
+            wallet.business.favorites_count_value = counts.get(wallet.business_id, 0)
+        data = WalletSerializer(wallets, many=True, context={"request": request}).data
         return Response({"wallets": data})
 
 
@@ -152,21 +193,18 @@ class ScanStampView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     @transaction.atomic
+    @idempotent
     def post(self, request):
         business_id = request.data.get("business_id")
         product_id = request.data.get("product_id")
-        amount = int(request.data.get("amount", 1))
         
         business = get_object_or_404(Business, id=business_id)
-        customer, _ = Customer.objects.get_or_create(user=request.user)
-        wallet, _ = Wallet.objects.select_for_update().get_or_create(
-            customer=customer,
-            business=business,
-            defaults={"reward_point_cost": business.reward_point_cost},
-        )
-        if wallet.reward_point_cost != business.reward_point_cost:
-            wallet.reward_point_cost = business.reward_point_cost
-            wallet.save(update_fields=["reward_point_cost"])
+        customer = points_engine.resolve_customer(request.user)
+        # The wallet always follows the business's current reward cost on this endpoint
+        engine_options = {
+            "ledger": points_engine.LOYALTY_LEDGER,
+            "overwrite_reward_cost": True,
+        }
         
         # If product_id is provided, check if it's a reward or menu item
         if product_id:
@@ -176,48 +214,39 @@ class ScanStampView(APIView):
                 if product.is_reward:
                     # Reward item: User wants to redeem, so deduct points
                     required_points = product.points_reward
-                    if wallet.points_balance < required_points:
+                    try:
+                        result = points_engine.redeem(
+                            customer, business, required_points,
+                            note=f"Redeemed: {product.title}", **engine_options
+                        )
+                    except points_engine.InsufficientPoints as exc:
                         return Response(
                             {
                                 "error": "Insufficient points",
-                                "detail": f"User points ({wallet.points_balance}) are less than required ({required_points})",
-                                "user_points": wallet.points_balance,
+                                "detail": str(exc),
+                                "user_points": exc.current_balance,
                                 "required_points": required_points
                             },
                             status=status.HTTP_400_BAD_REQUEST
                         )
                     
-                    # Deduct points
-                    wallet.points_balance -= required_points
-                    wallet.save(update_fields=["points_balance", "updated_at"])
-                    Transaction.objects.create(
-                        wallet=wallet, 
-                        amount=-required_points, 
-                        note=f"Redeemed: {product.title}"
-                    )
-                    total_points = Wallet.objects.filter(customer=customer).aggregate(total=Sum("points_balance")).get("total") or 0
                     return Response({
-                        "points_balance": wallet.points_balance,
-                        "total_points": total_points,
+                        "points_balance": result.points_balance,
+                        "total_points": points_engine.total_points(customer),
                         "message": f"Successfully redeemed {product.title}",
                         "points_deducted": required_points
                     })
                 else:
                     # Menu item: User purchased, so add points
                     points_to_add = product.points_reward
-                    wallet.points_balance += points_to_add
-                    wallet.save(update_fields=["points_balance", "updated_at"])
-                    Transaction.objects.create(
-                        wallet=wallet, 
-                        amount=points_to_add, 
-                        note=f"Purchased: {product.title}"
+                    result = points_engine.award(
+                        customer, business, points_to_add,
+                        note=f"Purchased: {product.title}", **engine_options
                     )
-                    achieved = wallet.points_balance >= wallet.reward_point_cost
-                    total_points = Wallet.objects.filter(customer=customer).aggregate(total=Sum("points_balance")).get("total") or 0
                     return Response({
-                        "points_balance": wallet.points_balance,
-                        "total_points": total_points,
-                        "achieved": achieved,
+                        "points_balance": result.points_balance,
+                        "total_points": points_engine.total_points(customer),
+                        "achieved": result.achieved,
                         "points_added": points_to_add,
                         "message": f"Points added for {product.title}"
                     })
@@ -228,19 +257,39 @@ class ScanStampView(APIView):
                 )
         
         # Legacy behavior: just add points
-        wallet.points_balance += amount
-        wallet.save(update_fields=["points_balance", "updated_at"])
-        Transaction.objects.create(wallet=wallet, amount=amount, note="scan")
-        achieved = wallet.points_balance >= wallet.reward_point_cost
-        total_points = Wallet.objects.filter(customer=customer).aggregate(total=Sum("points_balance")).get("total") or 0
-        return Response({"points_balance": wallet.points_balance, "total_points": total_points, "achieved": achieved})
+        try:
+            amount = int(request.data.get("amount", 1))
+        except (TypeError, ValueError):
+            return Response(
+                {"error": "Invalid amount", "detail": "amount must be an integer"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if amount <= 0:
+            return Response(
+                {"error": "Invalid amount", "detail": "amount must be greater than 0"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        result = points_engine.award(customer, business, amount, note="scan", **engine_options)
+        return Response({
+            "points_balance": result.points_balance,
+            "total_points": points_engine.total_points(customer),
+            "achieved": result.achieved,
+        })
+
+
+class HistoryPagination(KeysetPagination):
+    default_limit = 100
 
 
 class PointsHistoryView(APIView):
     """
     Returns user's total points and transaction history across businesses.
-    GET /api/v1/loyalty/points/history/?business_id=&limit=&offset=&type=
+    GET /api/v1/loyalty/points/history/?business_id=&limit=&cursor=&with_count=&type=
     type: 'earned' | 'redeemed' | 'all' (default: all)
+    
+    Pages are keyset-paginated: pass pagination.next_cursor as ?cursor= for the
+    next page. pagination.count is only computed with ?with_count=1.
+    ?offset= is still accepted for older app versions.
     """
     permission_classes = [permissions.IsAuthenticated]
 
@@ -248,40 +297,60 @@ class PointsHistoryView(APIView):
         customer, _ = Customer.objects.get_or_create(user=request.user)
 
         # Summary: total points across all wallets
-        total_points = Wallet.objects.filter(customer=customer).aggregate(total=Sum("points_balance")).get("total") or 0
+        summary = get_points_summary(customer)
+        total_points = summary.total_balance
 
         # Filters
         business_id = request.query_params.get("business_id")
         tx_type = (request.query_params.get("type") or "all").lower()
-        try:
-            limit = max(1, min(int(request.query_params.get("limit", 100)), 200))
-        except ValueError:
-            limit = 100
-        try:
-            offset = max(0, int(request.query_params.get("offset", 0)))
-        except ValueError:
-            offset = 0
-
-        tx_qs = Transaction.objects.filter(wallet__customer=customer).select_related("wallet", "wallet__business").order_by("-created_at")
 
+        # Filter on the customer's wallet ids so the (wallet, created_at, id) index drives the scan
+        wallet_ids = Wallet.objects.filter(customer=customer)
         if business_id:
-            tx_qs = tx_qs.filter(wallet__business_id=business_id)
+            wallet_ids = wallet_ids.filter(business_id=business_id)
+        tx_qs = Transaction.objects.filter(wallet_id__in=wallet_ids.values("id")).select_related("wallet__business")
         if tx_type == "earned":
             tx_qs = tx_qs.filter(amount__gt=0)
         elif tx_type == "redeemed":
             tx_qs = tx_qs.filter(amount__lt=0)
 
         # محاسبه total_points_earned و total_points_redeemed
-        from rewards.models import PointsTransaction
-        points_tx_qs = PointsTransaction.objects.filter(wallet__customer=customer)
         if business_id:
-            points_tx_qs = points_tx_qs.filter(wallet__business_id=business_id)
-        
-        total_points_earned = points_tx_qs.filter(points__gt=0).aggregate(total=Sum("points")).get("total") or 0
-        total_points_redeemed = abs(points_tx_qs.filter(points__lt=0).aggregate(total=Sum("points")).get("total") or 0)
+            # Live, rolled-up and archived rewards ledger rows (see ledger_rollup.totals)
+            totals = sum(
+                ledger_rollup.totals(
+                    points_engine.REWARDS_LEDGER, "wallet__business_id",
+                    wallet__customer=customer, wallet__business_id=business_id,
+                ).values(),
+                ledger_rollup.LedgerTotals(),
+            )
+            total_points_earned = totals.earned
+            total_points_redeemed = totals.redeemed
+        else:
+            total_points_earned = summary.lifetime_earned
+            total_points_redeemed = summary.lifetime_redeemed
 
-        count = tx_qs.count()
-        items = tx_qs[offset:offset+limit]
+        paginator = HistoryPagination()
+        offset = request.query_params.get("offset")
+        if offset and not request.query_params.get(paginator.cursor_query_param):
+            # Legacy offset paging (older app versions)
+            try:
+                offset = max(0, int(offset))
+            except ValueError:
+                offset = 0
+            limit = paginator.get_limit(request)
+            items = list(tx_qs.order_by("-created_at", "-id")[offset:offset + limit + 1])
+            pagination = {
+                "limit": limit,
+                "offset": offset,
+                "has_next": len(items) > limit,
+                "next_cursor": None,
+                "count": tx_qs.count() if paginator.wants_count(request) else None,
+            }
+            items = items[:limit]
+        else:
+            items = paginator.paginate_queryset(tx_qs, request, view=self)
+            pagination = paginator.get_pagination_data()
 
         transactions = []
         for t in items:
@@ -302,12 +371,7 @@ class PointsHistoryView(APIView):
             "total_points_earned": total_points_earned,
             "total_points_redeemed": total_points_redeemed,
             "transactions": transactions,
-            "pagination": {
-                "count": count,
-                "limit": limit,
-                "offset": offset,
-                "has_next": (offset + limit) < count
-            }
+            "pagination": pagination,
         }, status=status.HTTP_200_OK)
 
 
@@ -322,7 +386,7 @@ class EligibleRewardsView(APIView):
 
     def get(self, request):
         customer, _ = Customer.objects.get_or_create(user=request.user)
-        total_points = Wallet.objects.filter(customer=customer).aggregate(total=Sum("points_balance")).get("total") or 0
+        total_points = get_points_summary(customer).total_balance
 
         business_id = request.query_params.get("business_id")
         try:
@@ -338,13 +402,20 @@ class EligibleRewardsView(APIView):
         wallets = Wallet.objects.filter(customer=customer).select_related("business")
         wallet_points_by_business = {w.business_id: w.points_balance for w in wallets}
 
-        # Find reward products with cost <= total_points
-        products_qs = Product.objects.filter(active=True, is_reward=True, points_reward__lte=total_points).select_related("business").order_by("points_reward")
         if business_id:
-            products_qs = products_qs.filter(business_id=business_id)
+            try:
+                business_id = int(business_id)
+            except (TypeError, ValueError):
+                return Response({"detail": "business_id must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            business_id = None
 
-        count = products_qs.count()
-        products = products_qs[offset:offset+limit]
+        # Reward products with cost <= total_points: a bisect over the in-process catalog index
+        index = reward_index.get_reward_index()
+        count = index.count(max_points=total_points, business_id=business_id)
+        products = reward_index.load_products(
+            index.page(offset, limit, max_points=total_points, business_id=business_id)
+        )
 
         items = []
         for p in products:
@@ -378,21 +449,32 @@ class RedeemView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     @transaction.atomic
+    @idempotent
     def post(self, request):
         business_id = request.data.get("business_id")
         business = get_object_or_404(Business, id=business_id)
         customer, _ = Customer.objects.get_or_create(user=request.user)
-        wallet = get_object_or_404(Wallet.objects.select_for_update(), customer=customer, business=business)
+        wallet = get_object_or_404(Wallet, customer=customer, business=business)
         cost = wallet.reward_point_cost or business.reward_point_cost
-        if wallet.points_balance < cost:
+        balance = wallet_service.debit(wallet.id, cost)
+        if balance is None:
             return Response({"detail": "not enough points"}, status=status.HTTP_400_BAD_REQUEST)
-        wallet.points_balance -= cost
-        wallet.save(update_fields=["points_balance", "updated_at"])
         Transaction.objects.create(wallet=wallet, amount=-cost, note="redeem")
-        return Response({"points_balance": wallet.points_balance})
+        return Response({"points_balance": balance.points_balance})
+
+
+def _query_business_id(request):
+    """``?business_id=`` as int, None when absent, False when invalid."""
+    business_id = request.query_params.get('business_id')
+    if not business_id:
+        return None
+    try:
+        return int(business_id)
+    except ValueError:
+        return False
 
 
-class SliderListView(APIView):
+class SliderListView(ConditionalGetMixin, APIView):
     """
     GET endpoint for slider - returns list of all active sliders from all businesses
     
@@ -412,23 +494,31 @@ class SliderListView(APIView):
     """
     permission_classes = [permissions.AllowAny]
 
+    def get_validator(self, request):
+        business_id = _query_business_id(request)
+        if business_id is False:
+            return None
+        return (response_cache.version(response_cache.ALL if business_id is None else business_id, request),)
+
     def get(self, request):
+        # Get business_id from query params if provided
+        business_id = _query_business_id(request)
+        if business_id is False:
+            return Response(
+                {"error": "Invalid business_id. Must be a number."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return response_cache.cached_json(
+            request, "slider", business_id, lambda: self._build(request, business_id), absolute_uri=True,
+            fields=SliderSerializer.selection_key(request),
+        )
+
+    def _build(self, request, business_id):
         try:
-            # Get business_id from query params if provided
-            business_id = request.query_params.get('business_id')
-            
             # Filter by business_id if provided, otherwise get all active sliders
-            if business_id:
-                try:
-                    business_id = int(business_id)
-                    sliders = Slider.objects.filter(is_active=True, business_id=business_id).select_related('business').order_by('order', '-created_at')
-                except ValueError:
-                    return Response(
-                        {"error": "Invalid business_id. Must be a number."},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                sliders = Slider.objects.filter(is_active=True).select_related('business').order_by('order', '-created_at')
+            sliders = Slider.objects.filter(is_active=True).select_related('business').order_by('order', '-created_at')
+            if business_id is not None:
+                sliders = sliders.filter(business_id=business_id)
             
             # Serialize with proper error handling
             try:
@@ -451,11 +541,20 @@ class SliderListView(APIView):
             )
 
 
-class SliderByBusinessView(APIView):
+class SliderByBusinessView(ConditionalGetMixin, APIView):
     """GET endpoint for slider by business_id - returns list of sliders for a specific business"""
     permission_classes = [permissions.AllowAny]
 
+    def get_validator(self, request, business_id):
+        return (response_cache.version(business_id, request),)
+
     def get(self, request, business_id):
+        return response_cache.cached_json(
+            request, "slider", business_id, lambda: self._build(request, business_id), absolute_uri=True,
+            fields=SliderSerializer.selection_key(request),
+        )
+
+    def _build(self, request, business_id):
         try:
             sliders = Slider.objects.filter(is_active=True, business_id=business_id).select_related('business').order_by('order', '-created_at')
             serializer = SliderSerializer(sliders, many=True, context={'request': request})
@@ -471,26 +570,34 @@ class SliderByBusinessView(APIView):
             )
 
 
-class MenuListView(APIView):
+class MenuListView(ConditionalGetMixin, APIView):
     """GET endpoint for menu - returns list of products separated into menu_items and reward_items"""
     permission_classes = [permissions.AllowAny]
 
+    def get_validator(self, request):
+        business_id = _query_business_id(request)
+        if business_id is False:
+            return None
+        return (response_cache.version(response_cache.ALL if business_id is None else business_id, request),)
+
     def get(self, request):
+        # Get business_id from query params if provided
+        business_id = _query_business_id(request)
+        if business_id is False:
+            return Response(
+                {"error": "Invalid business_id. Must be a number."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return response_cache.cached_json(
+            request, "menu", business_id, lambda: self._build(request, business_id), absolute_uri=True,
+            fields=MenuProductSerializer.selection_key(request),
+        )
+
+    def _build(self, request, business_id):
         try:
-            # Get business_id from query params if provided
-            business_id = request.query_params.get('business_id')
-            
-            if business_id:
-                try:
-                    business_id = int(business_id)
-                    products = Product.objects.filter(active=True, business_id=business_id)
-                except ValueError:
-                    return Response(
-                        {"error": "Invalid business_id. Must be a number."},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            else:
-                products = Product.objects.filter(active=True)
+            products = Product.objects.filter(active=True).select_related("business")
+            if business_id is not None:
+                products = products.filter(business_id=business_id)
             
             # جدا کردن منو و ریوارد
             menu_items = products.filter(is_reward=False)
@@ -510,13 +617,22 @@ class MenuListView(APIView):
             )
 
 
-class MenuByBusinessView(APIView):
+class MenuByBusinessView(ConditionalGetMixin, APIView):
     """GET endpoint for menu by business_id - returns list of products separated into menu_items and reward_items"""
     permission_classes = [permissions.AllowAny]
 
+    def get_validator(self, request, business_id):
+        return (response_cache.version(business_id, request),)
+
     def get(self, request, business_id):
+        return response_cache.cached_json(
+            request, "menu", business_id, lambda: self._build(request, business_id), absolute_uri=True,
+            fields=MenuProductSerializer.selection_key(request),
+        )
+
+    def _build(self, request, business_id):
         try:
-            products = Product.objects.filter(active=True, business_id=business_id)
+            products = Product.objects.filter(active=True, business_id=business_id).select_related("business")
             
             # جدا کردن منو و ریوارد
             menu_items = products.filter(is_reward=False)
@@ -691,7 +807,7 @@ class UnsplashSearchView(APIView):
             )
 
 
-class BusinessDetailView(APIView):
+class BusinessDetailView(ConditionalGetMixin, APIView):
     """
     GET endpoint for business details by business_id
     Returns business information for mobile app
@@ -707,8 +823,16 @@ class BusinessDetailView(APIView):
     }
     """
     permission_classes = [permissions.AllowAny]
+
+    def get_validator(self, request, business_id):
+        return (response_cache.version(business_id, request),)
     
     def get(self, request, business_id):
+        return response_cache.cached_json(
+            request, "business_detail", business_id, lambda: self._build(business_id)
+        )
+
+    def _build(self, business_id):
         try:
             business = Business.objects.get(id=business_id)
             data = {
@@ -718,6 +842,8 @@ class BusinessDetailView(APIView):
                 "address": business.address or "",
                 "phone": business.phone or "",
                 "website": business.website or "",
+                "latitude": business.latitude,
+                "longitude": business.longitude,
             }
             return Response(data, status=status.HTTP_200_OK)
         except Business.DoesNotExist:
@@ -731,9 +857,13 @@ class SearchView(APIView):
     """
     GET endpoint for searching businesses, products, and services
     Searches across business names, descriptions, addresses, product titles, and service names/descriptions
+    (full-text, ranked; see loyalty.search)
     
     Query Parameters:
     - query or q: Search query string (required) - supports both 'query' and 'q' for backward compatibility
+    - limit: Results per type (default 10, max 50)
+    - type: Only one type: businesses, products or services (optional)
+    - cursor: "next" cursor of a previous response; continues that type only
     
     Response format:
     {
@@ -748,10 +878,33 @@ class SearchView(APIView):
             "businesses": 0,
             "products": 0,
             "services": 0
+        },
+        "next": {
+            "businesses": "cursor or null",
+            "products": null,
+            "services": null
         }
     }
     """
     permission_classes = [permissions.AllowAny]
+    default_limit = 10
+    max_limit = 50
+
+    # Response key of each document kind
+    RESULT_KEYS = {
+        search.Kind.BUSINESS: "businesses",
+        search.Kind.PRODUCT: "products",
+        search.Kind.SERVICE: "services",
+    }
+
+    # Map category values to English display names
+    CATEGORY_NAMES = {
+        "food": "Food",
+        "cafe": "Cafe",
+        "beauty": "Beauty",
+        "fitness": "Fitness",
+        "other": "Other"
+    }
     
     def get(self, request):
         # Get search query from query parameters (support both 'q' and 'query' for backward compatibility)
@@ -762,56 +915,67 @@ class SearchView(APIView):
                 {"error": "Query parameter required", "detail": "Please provide 'query' or 'q' parameter"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        # Build search filter using Q objects for case-insensitive search
-        search_filter = Q(name__icontains=query) | Q(description__icontains=query) | Q(address__icontains=query)
-        
-        # Search businesses
-        businesses = Business.objects.filter(search_filter).annotate(
-            average_rating_value=Avg(
-                "reviews__rating",
-                filter=Q(reviews__status=Review.Status.APPROVED),
-            ),
-            review_count_value=Count(
-                "reviews",
-                filter=Q(reviews__status=Review.Status.APPROVED),
-            ),
-        ).distinct()
-        
-        # Search products (active only)
-        products = Product.objects.filter(
-            active=True,
-            title__icontains=query
-        ).select_related('business').distinct()
-        
-        # Search services (active only)
-        services = Service.objects.filter(
-            is_active=True
-        ).filter(
-            Q(name__icontains=query) | Q(description__icontains=query)
-        ).select_related('business').distinct()
-        
-        # Serialize results
-        business_serializer = BusinessSerializer(businesses, many=True, context={'request': request})
-        product_serializer = ProductSerializer(products, many=True)
-        
-        # Create service serializer data manually
-        # Map category values to English display names
-        category_map = {
-            "food": "Food",
-            "cafe": "Cafe",
-            "beauty": "Beauty",
-            "fitness": "Fitness",
-            "other": "Other"
-        }
-        
+
+        try:
+            limit = int(request.query_params.get("limit", self.default_limit))
+        except (TypeError, ValueError):
+            limit = self.default_limit
+        limit = max(1, min(limit, self.max_limit))
+
+        kinds = list(search.KINDS)
+        after = None
+        cursor = request.query_params.get("cursor")
+        result_type = request.query_params.get("type")
+        if cursor:
+            try:
+                after = search.decode_cursor(cursor)
+            except ValueError:
+                return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+            kinds = [after.kind]
+        elif result_type:
+            kinds = [kind for kind, key in self.RESULT_KEYS.items() if key == result_type]
+            if not kinds:
+                return Response(
+                    {"error": "Invalid type", "detail": "type must be businesses, products or services"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        # One query for all counts, one per listed type, one per type to load the rows
+        counts = search.counts(query)
+        results = {}
+        next_cursors = {}
+        for kind in kinds:
+            hits = search.search(query, kind, limit + 1, after=after)
+            page = hits[:limit]
+            key = self.RESULT_KEYS[kind]
+            results[key] = self._serialize(kind, [hit.object_id for hit in page], request)
+            next_cursors[key] = search.encode_cursor(page[-1]) if len(hits) > limit else None
+
+        return Response({
+            "query": query,
+            "results": results,
+            "total": sum(counts.values()),
+            "counts": {self.RESULT_KEYS[kind]: n for kind, n in counts.items()},
+            "next": next_cursors,
+        }, status=status.HTTP_200_OK)
+
+    def _serialize(self, kind, ids, request):
+        """The rows of ``ids`` in rank order (a document may briefly outlive its row)"""
+        if kind == search.Kind.BUSINESS:
+            rows = _business_list_queryset(request).in_bulk(ids)
+            return BusinessSerializer([rows[pk] for pk in ids if pk in rows], many=True, context={'request': request}).data
+        if kind == search.Kind.PRODUCT:
+            rows = Product.objects.filter(active=True).in_bulk(ids)
+            return ProductSerializer([rows[pk] for pk in ids if pk in rows], many=True).data
+
+        rows = Service.objects.filter(is_active=True).select_related('business').in_bulk(ids)
         service_data = []
-        for service in services:
+        for service in (rows[pk] for pk in ids if pk in rows):
             service_data.append({
                 "id": service.id,
                 "name": service.name,
                 "category": service.category,
-                "category_display": category_map.get(service.category, "Other"),
+                "category_display": self.CATEGORY_NAMES.get(service.category, "Other"),
                 "description": service.description,
                 "business": {
                     "id": service.business.id,
@@ -821,24 +985,46 @@ class SearchView(APIView):
                 },
                 "is_active": service.is_active,
             })
-        
-        # Calculate total results
-        total = businesses.count() + products.count() + services.count()
-        
-        return Response({
-            "query": query,
-            "results": {
-                "businesses": business_serializer.data,
-                "products": product_serializer.data,
-                "services": service_data,
-            },
-            "total": total,
-            "counts": {
-                "businesses": businesses.count(),
-                "products": products.count(),
-                "services": services.count(),
-            }
-        }, status=status.HTTP_200_OK)
+        return service_data
+
+
+class SuggestView(APIView):
+    """
+    GET /api/v1/search/suggest/?q=caf&limit=8&type=products
+    Search-as-you-type suggestions from the in-process prefix index (loyalty.suggest_index);
+    no database query per keystroke.
+
+    Response format:
+    {
+        "query": "caf",
+        "suggestions": [
+            {"type": "business", "id": 1, "name": "Café Müller", "business_id": 1, "business_name": "Café Müller"}
+        ]
+    }
+    """
+    permission_classes = [permissions.AllowAny]
+    default_limit = 8
+
+    def get(self, request):
+        query = (request.query_params.get('q') or request.query_params.get('query') or '').strip()
+        try:
+            limit = int(request.query_params.get("limit", self.default_limit))
+        except (TypeError, ValueError):
+            limit = self.default_limit
+
+        kind = None
+        result_type = request.query_params.get("type")
+        if result_type:
+            kinds = [k for k, key in SearchView.RESULT_KEYS.items() if key == result_type]
+            if not kinds:
+                return Response(
+                    {"error": "Invalid type", "detail": "type must be businesses, products or services"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            kind = kinds[0]
+
+        suggestions = suggest_index.get_suggest_index().lookup(query, limit=limit, kind=kind) if query else []
+        return Response({"query": query, "suggestions": suggestions}, status=status.HTTP_200_OK)
 
 
 class FavoriteToggleView(APIView):
@@ -874,13 +1060,15 @@ class FavoriteListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        customer, _ = Customer.objects.get_or_create(user=request.user)
-        favorites = Favorite.objects.filter(customer=customer).select_related("business")
-        businesses = [f.business for f in favorites]
-        data = BusinessSerializer(businesses, many=True, context={"request": request}).data
-        # Enrich with favorites_count (serializer provides) and is_favorite=True
-        for item in data:
-            item["is_favorite"] = True
+        customer = request_customer(request)
+        if customer is None:
+            return Response({"favorites": []}, status=status.HTTP_200_OK)
+        ids = list(Favorite.objects.filter(customer=customer).values_list("business_id", flat=True))
+        by_id = _business_list_queryset(request).in_bulk(ids)
+        businesses = [by_id[pk] for pk in ids if pk in by_id]
+        # Every listed business is a favorite; pass the set so the serializer needs no query for it
+        context = {"request": request, FAVORITES_CONTEXT_KEY: frozenset(b.id for b in businesses)}
+        data = BusinessSerializer(businesses, many=True, context=context).data
         return Response({"favorites": data}, status=status.HTTP_200_OK)
 
 
@@ -915,13 +1103,8 @@ class FavoriteCountView(APIView):
         favorites_count = Favorite.objects.filter(business=business).count()
         
         # Check if current user has favorited (if authenticated)
-        is_favorite = False
-        if request.user.is_authenticated:
-            try:
-                customer, _ = Customer.objects.get_or_create(user=request.user)
-                is_favorite = Favorite.objects.filter(customer=customer, business=business).exists()
-            except Exception:
-                pass
+        customer = request_customer(request)
+        is_favorite = customer is not None and Favorite.objects.filter(customer=customer, business=business).exists()
         
         return Response({
             "business_id": business_id,
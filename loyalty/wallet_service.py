@@ -0,0 +1,215 @@
+"""
+Lock-free wallet balance mutations.
+
+Instead of ``select_for_update()`` + read + ``save()``, every balance change is a
+single conditional statement::
+
+    UPDATE loyalty_wallet
+       SET points_balance = points_balance + %s, updated_at = %s
+     WHERE id = %s AND points_balance >= %s
+ RETURNING id, points_balance, reward_point_cost
+
+The database applies concurrent increments atomically, and the ``WHERE`` guard
+makes a debit that would overdraw the wallet match zero rows instead of going
+negative. Backends without ``RETURNING`` fall back to an ``F()`` update plus a read.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Wallet
+
+
+class WalletBalance(NamedTuple):
+    wallet_id: int
+    points_balance: int
+    reward_point_cost: int
+
+
+def _supports_returning() -> bool:
+    return connection.features.can_return_columns_from_insert
+
+
+def _apply(
+    filters: dict,
+    delta: int,
+    reward_point_cost: Optional[int],
+    overwrite_reward_cost: bool,
+    floor: Optional[int] = None,
+) -> Optional[WalletBalance]:
+    if floor is None:
+        floor = max(-delta, 0)
+    now = timezone.now()
+
+    if not _supports_returning():
+        changes = {"points_balance": F("points_balance") + delta, "updated_at": now}
+        if reward_point_cost and overwrite_reward_cost:
+            changes["reward_point_cost"] = reward_point_cost
+        with transaction.atomic():
+            updated = Wallet.objects.filter(points_balance__gte=floor, **filters).update(**changes)
+            if not updated:
+                return None
+            if reward_point_cost and not overwrite_reward_cost:
+                Wallet.objects.filter(reward_point_cost=0, **filters).update(reward_point_cost=reward_point_cost)
+            row = Wallet.objects.filter(**filters).values_list("id", "points_balance", "reward_point_cost").get()
+        return WalletBalance(*row)
+
+    qn = connection.ops.quote_name
+    opts = Wallet._meta
+    table = qn(opts.db_table)
+    id_col = qn(opts.pk.column)
+    balance_col = qn(opts.get_field("points_balance").column)
+    cost_col = qn(opts.get_field("reward_point_cost").column)
+    updated_col = qn(opts.get_field("updated_at").column)
+
+    assignments = [f"{balance_col} = {balance_col} + %s", f"{updated_col} = %s"]
+    params = [delta, now]
+    if reward_point_cost and overwrite_reward_cost:
+        assignments.append(f"{cost_col} = %s")
+        params.append(reward_point_cost)
+    elif reward_point_cost:
+        assignments.append(f"{cost_col} = CASE WHEN {cost_col} > 0 THEN {cost_col} ELSE %s END")
+        params.append(reward_point_cost)
+
+    conditions = []
+    for name, value in filters.items():
+        field = opts.pk if name == "pk" else opts.get_field(name)
+        conditions.append(f"{qn(field.column)} = %s")
+        params.append(value)
+    conditions.append(f"{balance_col} >= %s")
+    params.append(floor)
+
+    sql = (
+        f"UPDATE {table} SET {', '.join(assignments)} "
+        f"WHERE {' AND '.join(conditions)} "
+        f"RETURNING {id_col}, {balance_col}, {cost_col}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    return WalletBalance(*row)
+
+
+def apply_points(
+    wallet_id: int,
+    delta: int,
+    reward_point_cost: Optional[int] = None,
+    overwrite_reward_cost: bool = False,
+) -> Optional[WalletBalance]:
+    """
+    Add ``delta`` points to a wallet (negative to spend) in one statement.
+
+    ``reward_point_cost`` fills the wallet's cost when it is still unset (0), or
+    replaces it when ``overwrite_reward_cost`` is set. Returns the new balance,
+    or None if the wallet does not exist or the balance is lower than the amount
+    being spent.
+    """
+    return _apply({"pk": wallet_id}, delta, reward_point_cost, overwrite_reward_cost)
+
+
+def apply_points_for(
+    customer_id: int,
+    business_id: int,
+    delta: int,
+    reward_point_cost: Optional[int] = None,
+    overwrite_reward_cost: bool = False,
+) -> Optional[WalletBalance]:
+    """Same as ``apply_points`` but addresses the wallet by its (customer, business) unique key."""
+    return _apply(
+        {"customer_id": customer_id, "business_id": business_id},
+        delta,
+        reward_point_cost,
+        overwrite_reward_cost,
+    )
+
+
+# Wallets per bulk statement; keeps the parameter count well below SQLite's limit
+BULK_CHUNK_SIZE = 100
+
+
+def apply_points_bulk(
+    changes: Dict[int, Tuple[int, int]],
+    reward_point_costs: Optional[Dict[int, int]] = None,
+) -> Dict[int, WalletBalance]:
+    """
+    Apply ``{wallet_id: (delta, floor)}`` with one ``UPDATE ... CASE`` per chunk.
+
+    A wallet only changes if its balance is at least ``floor`` (the lowest
+    starting balance that keeps every step of the caller's sequence >= 0).
+    ``reward_point_costs`` fills unset wallet costs. Returns the new balances of
+    the wallets that were updated; the others failed their guard.
+    """
+    reward_point_costs = reward_point_costs or {}
+    if not _supports_returning():
+        result = {}
+        for wallet_id, (delta, floor) in changes.items():
+            balance = _apply({"pk": wallet_id}, delta, reward_point_costs.get(wallet_id), False, floor=floor)
+            if balance is not None:
+                result[wallet_id] = balance
+        return result
+
+    qn = connection.ops.quote_name
+    opts = Wallet._meta
+    table = qn(opts.db_table)
+    id_col = qn(opts.pk.column)
+    balance_col = qn(opts.get_field("points_balance").column)
+    cost_col = qn(opts.get_field("reward_point_cost").column)
+    updated_col = qn(opts.get_field("updated_at").column)
+
+    def case(values):
+        sql = f"CASE {id_col} " + " ".join("WHEN %s THEN %s" for _ in values) + " ELSE 0 END"
+        return sql, [p for pair in values for p in pair]
+
+    result = {}
+    wallet_ids = list(changes)
+    for start in range(0, len(wallet_ids), BULK_CHUNK_SIZE):
+        chunk = wallet_ids[start:start + BULK_CHUNK_SIZE]
+        delta_sql, delta_params = case([(wid, changes[wid][0]) for wid in chunk])
+        floor_sql, floor_params = case([(wid, changes[wid][1]) for wid in chunk])
+        assignments = [f"{balance_col} = {balance_col} + {delta_sql}", f"{updated_col} = %s"]
+        params = delta_params + [timezone.now()]
+        costs = [(wid, reward_point_costs[wid]) for wid in chunk if reward_point_costs.get(wid)]
+        if costs:
+            cost_sql, cost_params = case(costs)
+            assignments.append(f"{cost_col} = CASE WHEN {cost_col} > 0 THEN {cost_col} ELSE {cost_sql} END")
+            params += cost_params
+        params += chunk + floor_params
+        sql = (
+            f"UPDATE {table} SET {', '.join(assignments)} "
+            f"WHERE {id_col} IN ({', '.join(['%s'] * len(chunk))}) AND {balance_col} >= {floor_sql} "
+            f"RETURNING {id_col}, {balance_col}, {cost_col}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for row in cursor.fetchall():
+                result[row[0]] = WalletBalance(*row)
+    return result
+
+
+def _unsigned(points: int) -> int:
+    # A signed amount here is a caller bug: flipping it would credit a debit (or the reverse)
+    if points < 0:
+        raise ValueError(f"points must not be negative, got {points}")
+    return points
+
+
+def credit(wallet_id: int, points: int, reward_point_cost: Optional[int] = None) -> Optional[WalletBalance]:
+    """Add ``points`` (>= 0) to a wallet; raises ValueError for a negative amount."""
+    return apply_points(wallet_id, _unsigned(points), reward_point_cost)
+
+
+def debit(wallet_id: int, points: int) -> Optional[WalletBalance]:
+    """Spend ``points`` (>= 0); returns None when the balance is insufficient, raises ValueError if negative."""
+    return apply_points(wallet_id, -_unsigned(points))
+
+
+def current_balance(wallet_id: int) -> int:
+    """Read the committed balance (used for error responses after a failed debit)."""
+    return Wallet.objects.filter(pk=wallet_id).values_list("points_balance", flat=True).first() or 0
@@ -1,8 +1,8 @@
-from django.db.models import Avg, Count, Q
 from django.shortcuts import get_object_or_404, render
 
 from loyalty.models import Business
 from reviews.models import Review
+from reviews.rating_stats import with_rating_values
 
 
 def home(request):
@@ -39,16 +39,7 @@ def blog(request):
 
 def business_directory(request):
     businesses = list(
-        Business.objects.annotate(
-            average_rating_value=Avg(
-                "reviews__rating",
-                filter=Q(reviews__status=Review.Status.APPROVED),
-            ),
-            review_count_value=Count(
-                "reviews",
-                filter=Q(reviews__status=Review.Status.APPROVED),
-            ),
-        )
+        with_rating_values(Business.objects.all())
         .prefetch_related("services", "sliders")
         .order_by("-average_rating_value", "-review_count_value", "name")
     )
@@ -80,7 +71,7 @@ def business_detail(request, slug):
     )
     services = business.services.filter(is_active=True).order_by("name")
     average_rating = business.average_rating or 0
-    review_count = approved_reviews.count()
+    review_count = business.rating_count
 
     return render(
         request,
@@ -10,6 +10,7 @@ from django.http import JsonResponse
 from django.contrib import messages
 from django.db import transaction
 from loyalty.models import Business, Product, Customer, Wallet, Slider
+from loyalty import ledger_rollup, points_engine
 from payments.models import Order
 from campaigns.models import Campaign
 from reviews.models import Review, ReviewResponse
@@ -411,10 +412,11 @@ def users_list(request):
     # دریافت تمام Customer هایی که Wallet برای Business این پارتنر دارند
     wallets = Wallet.objects.filter(business=business).select_related(
         'customer', 'customer__user', 'business'
-    ).prefetch_related(
-        'points_transactions'
     )
     
+    # مجموع امتیازها برای همه‌ی wallet ها: rollup ماه‌های بسته + ردیف‌های ماه جاری
+    ledger_totals = ledger_rollup.totals(points_engine.REWARDS_LEDGER, wallet__business=business)
+    
     # دریافت اطلاعات کامل هر Customer
     customers_data = []
     for wallet in wallets:
@@ -445,14 +447,9 @@ def users_list(request):
             wallet=wallet
         ).order_by('-created_at')
         
-        # محاسبه مجموع امتیازها
-        total_points_earned = points_transactions.filter(points__gt=0).aggregate(
-            total=Sum('points')
-        )['total'] or 0
-        
-        total_points_redeemed = abs(points_transactions.filter(points__lt=0).aggregate(
-            total=Sum('points')
-        )['total'] or 0)
+        points_totals = ledger_totals.get(wallet.id, ledger_rollup.LedgerTotals())
+        total_points_earned = points_totals.earned
+        total_points_redeemed = points_totals.redeemed
         
         # مجموع مبلغ خریدها (تبدیل از cents به یورو)
         total_spent_cents = orders_queryset.filter(status=Order.Status.PAID).aggregate(
@@ -473,7 +470,7 @@ def users_list(request):
             'current_balance': wallet.points_balance,
             'total_spent': total_spent,
             'last_order_date': orders_queryset.first().created_at if orders_queryset.exists() else None,
-            'last_transaction_date': points_transactions.first().created_at if points_transactions.exists() else None,
+            'last_transaction_date': points_totals.last_at,
         })
     
     # مرتب‌سازی بر اساس آخرین فعالیت
@@ -772,7 +769,7 @@ def verify_code_and_generate_qr(request):
         
         # Also check if phone belongs to business owner profile
         try:
-            owner_profile = Profile.objects.get(user=business.owner)
+            owner_profile = Profile.objects.get(user_id=business.owner_id)
             if owner_profile.phone and phone == owner_profile.phone:
                 return JsonResponse({
                     "error": "Admin phone number cannot be used in QR code. Please enter customer phone number."
@@ -782,7 +779,7 @@ def verify_code_and_generate_qr(request):
         
         # Check if customer exists
         try:
-            profile = Profile.objects.get(phone=phone)
+            profile = Profile.objects.select_related("user").get(phone=phone)
             user = profile.user
             is_new_user = False
         except Profile.DoesNotExist:
@@ -806,10 +803,7 @@ def verify_code_and_generate_qr(request):
             is_new_user = True
         
         # Get or create customer
-        customer, _ = Customer.objects.get_or_create(user=user)
-        if not customer.phone:
-            customer.phone = phone
-            customer.save(update_fields=["phone"])
+        customer = points_engine.resolve_customer(user, phone)
         
         # Get products and calculate total points (only if products are provided)
         total_points = 0
@@ -871,7 +865,7 @@ def check_phone_for_qr(request):
                 "error": "Admin phone number cannot be used. Please enter customer phone number."
             }, status=400)
         try:
-            owner_profile = Profile.objects.get(user=business.owner)
+            owner_profile = Profile.objects.get(user_id=business.owner_id)
             if owner_profile.phone and phone == owner_profile.phone:
                 return JsonResponse({
                     "error": "Admin phone number cannot be used. Please enter customer phone number."
@@ -880,18 +874,14 @@ def check_phone_for_qr(request):
             pass
         # Check if phone exists
         try:
-            profile = Profile.objects.get(phone=phone)
+            profile = Profile.objects.select_related("user").get(phone=phone)
             user = profile.user
         except Profile.DoesNotExist:
             return JsonResponse({"error": "Phone number not found in the system"}, status=404)
         # Get/create customer record for existing user (safe)
-        customer, _ = Customer.objects.get_or_create(user=user)
-        if not customer.phone:
-            customer.phone = phone
-            customer.save(update_fields=["phone"])
+        customer = points_engine.resolve_customer(user, phone)
         # Read current wallet balance for this business (do not create if missing)
-        wallet = Wallet.objects.filter(customer=customer, business=business).first()
-        user_total_points = wallet.points_balance if wallet else 0
+        user_total_points = points_engine.wallet_balance(customer, business)
         return JsonResponse({
             "success": True,
             "customer_id": customer.id,
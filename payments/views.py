@@ -8,6 +8,7 @@ from django.http import HttpRequest, HttpResponse
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from securityapp.idempotency import idempotent
 
 from .models import Order
 from .serializers import OrderSerializer
@@ -24,6 +25,7 @@ class OrdersListView(generics.ListAPIView):
 class InitiatePaymentView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         business_id = request.data.get("business_id")
         amount_cents = int(request.data.get("amount_cents", 0))
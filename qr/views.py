@@ -16,7 +16,10 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 
 from accounts.permissions import IsBusinessOwnerRole
+from django.db import transaction as db_transaction
 from loyalty.models import Business, Customer, Wallet, Transaction
+from loyalty import points_engine, wallet_service
+from securityapp.idempotency import idempotent
 from .models import QRCode
 from .serializers import QRCodeSerializer
 
@@ -171,10 +174,14 @@ def customer_dashboard_view(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent
 def process_qr_payment(request):
     """Process QR code payment - add loyalty points"""
     token = request.data.get('token')
-    amount = int(request.data.get('amount', 1))  # Number of points to add
+    try:
+        amount = int(request.data.get('amount', 1))  # Number of points to add
+    except (TypeError, ValueError):
+        return Response({'error': 'amount must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
     note = request.data.get('note', '')
     business_password = request.data.get('business_password', '')  # Password from business owner
     
@@ -183,7 +190,7 @@ def process_qr_payment(request):
     
     # Find QR code
     try:
-        qr_code = QRCode.objects.get(token=token, active=True)
+        qr_code = QRCode.objects.select_related('business').get(token=token, active=True)
     except QRCode.DoesNotExist:
         return Response({'error': 'Invalid QR code'}, status=status.HTTP_404_NOT_FOUND)
     
@@ -195,46 +202,44 @@ def process_qr_payment(request):
             'scanned_at': qr_code.scanned_at
         }, status=status.HTTP_400_BAD_REQUEST)
     
+    if amount < 0:
+        return Response({'error': 'amount must not be negative'}, status=status.HTTP_400_BAD_REQUEST)
+    
     # Verify business password if provided
     if business_password and qr_code.business.has_password():
         if not qr_code.business.check_password(business_password):
             return Response({'error': 'Invalid business password'}, status=status.HTTP_401_UNAUTHORIZED)
     
-    # Find or create customer
-    customer, created = Customer.objects.get_or_create(user=request.user)
-    
-    # Find or create wallet
-    wallet, created = Wallet.objects.get_or_create(
-        customer=customer,
-        business=qr_code.business,
-        defaults={'reward_point_cost': qr_code.business.reward_point_cost}
-    )
-    
-    # Create transaction
-    transaction = Transaction.objects.create(
-        wallet=wallet,
-        amount=amount,
-        note=f"QR Payment - {note}" if note else "QR Payment"
-    )
-    
-    # Update points balance
-    wallet.points_balance += max(amount, 0)
-    wallet.reward_point_cost = wallet.reward_point_cost or qr_code.business.reward_point_cost
-    wallet.save(update_fields=["points_balance", "reward_point_cost", "updated_at"])
-    
-    # Mark QR code as scanned
-    qr_code.scanned_at = timezone.now()
-    qr_code.save(update_fields=["scanned_at"])
+    with db_transaction.atomic():
+        # Mark QR code as scanned; the conditional update lets only one concurrent request through
+        claimed = QRCode.objects.filter(pk=qr_code.pk, scanned_at__isnull=True).update(scanned_at=timezone.now())
+        if not claimed:
+            qr_code.refresh_from_db(fields=["scanned_at"])
+            return Response({
+                'error': 'این QR کد قبلاً اسکن شده است',
+                'scanned': True,
+                'scanned_at': qr_code.scanned_at
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Credit the wallet (created on first payment) and write the ledger row
+        customer = points_engine.resolve_customer(request.user)
+        result = points_engine.award(
+            customer,
+            qr_code.business,
+            amount,
+            note=f"QR Payment - {note}" if note else "QR Payment",
+            ledger=points_engine.LOYALTY_LEDGER,
+        )
     
     # Check if customer reached reward threshold
-    reward_cost = wallet.reward_point_cost or qr_code.business.reward_point_cost
-    reward_earned = wallet.points_balance >= reward_cost
+    reward_cost = result.reward_point_cost or qr_code.business.reward_point_cost
+    reward_earned = result.points_balance >= reward_cost
     
     return Response({
         'success': True,
-        'transaction_id': transaction.id,
+        'transaction_id': result.entry.id,
         'points_awarded': amount,
-        'points_balance': wallet.points_balance,
+        'points_balance': result.points_balance,
         'reward_point_cost': reward_cost,
         'reward_earned': reward_earned,
         'business_name': qr_code.business.name
@@ -243,6 +248,7 @@ def process_qr_payment(request):
 
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
+@idempotent
 def redeem_reward(request):
     """Redeem reward - deduct points"""
     business_id = request.data.get('business_id')
@@ -257,28 +263,27 @@ def redeem_reward(request):
     except (Business.DoesNotExist, Customer.DoesNotExist, Wallet.DoesNotExist):
         return Response({'error': 'Wallet not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    reward_cost = wallet.reward_point_cost or wallet.business.reward_point_cost
-    
-    if wallet.points_balance < reward_cost:
-        return Response({'error': 'Not enough points'}, status=status.HTTP_400_BAD_REQUEST)
+    reward_cost = wallet.reward_point_cost or business.reward_point_cost
     
-    # Create negative transaction for reward redemption
-    Transaction.objects.create(
-        wallet=wallet,
-        amount=-reward_cost,
-        note="Reward redeemed"
-    )
-    
-    # Deduct points
-    wallet.points_balance -= reward_cost
-    wallet.save(update_fields=["points_balance", "updated_at"])
+    with db_transaction.atomic():
+        # Deduct points only if the balance still covers the reward
+        balance = wallet_service.debit(wallet.id, reward_cost)
+        if balance is None:
+            return Response({'error': 'Not enough points'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Create negative transaction for reward redemption
+        Transaction.objects.create(
+            wallet=wallet,
+            amount=-reward_cost,
+            note="Reward redeemed"
+        )
     
     return Response({
         'success': True,
         'message': 'Reward redeemed successfully!',
-        'points_balance': wallet.points_balance,
+        'points_balance': balance.points_balance,
         'reward_point_cost': reward_cost,
-        'reward_earned': wallet.points_balance >= reward_cost,
+        'reward_earned': balance.points_balance >= reward_cost,
     })
 
 
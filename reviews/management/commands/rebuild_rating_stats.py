@@ -0,0 +1,51 @@
+"""
+Recompute the rating columns of Business, Product and Service from Review and
+QuestionRating (normally they are maintained incrementally by signals).
+
+Usage:
+    python manage.py rebuild_rating_stats
+    python manage.py rebuild_rating_stats --check   # only report rows that drifted
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from loyalty.models import Business, Product
+from reviews import rating_stats
+from reviews.models import Service
+
+COLUMNS = {
+    Business: ("rating_sum", "rating_count", "question_rating_sum", "question_rating_count"),
+    Product: ("rating_sum", "rating_count"),
+    Service: ("rating_sum", "rating_count"),
+}
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized rating sums/counts of businesses, products and services"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--check", action="store_true", help="Report drift without keeping the rebuild")
+
+    def handle(self, *args, **options):
+        before = self._snapshot()
+        with transaction.atomic():
+            rating_stats.rebuild()
+            after = self._snapshot()
+            if options["check"]:
+                transaction.set_rollback(True)
+
+        drifted = 0
+        for model, rows in after.items():
+            for pk, values in rows.items():
+                if before[model].get(pk) != values:
+                    drifted += 1
+                    if options["check"]:
+                        self.stdout.write(f"{model.__name__} {pk}: {before[model].get(pk)} -> {values}")
+        verb = "would be" if options["check"] else "were"
+        self.stdout.write(self.style.SUCCESS(f"{drifted} rows {verb} corrected"))
+
+    def _snapshot(self):
+        return {
+            model: {row[0]: row[1:] for row in model.objects.values_list("pk", *columns)}
+            for model, columns in COLUMNS.items()
+        }
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.2 on 2026-10-17 10:35
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_rating_stats(apps, schema_editor):
+    Business = apps.get_model('loyalty', 'Business')
+    Product = apps.get_model('loyalty', 'Product')
+    Service = apps.get_model('reviews', 'Service')
+    Review = apps.get_model('reviews', 'Review')
+    QuestionRating = apps.get_model('reviews', 'QuestionRating')
+
+    def aggregate(rows, fk, value):
+        rows = rows.filter(**{fk: OuterRef('pk')}).order_by().values(fk)
+        return Coalesce(Subquery(rows.annotate(v=value).values('v')), Value(0))
+
+    approved = Review.objects.filter(status='approved')
+    for model, fk in ((Business, 'business'), (Product, 'product'), (Service, 'service')):
+        model.objects.update(
+            rating_sum=aggregate(approved, fk, Sum('rating')),
+            rating_count=aggregate(approved, fk, Count('id')),
+        )
+    Business.objects.update(
+        question_rating_sum=aggregate(QuestionRating.objects.all(), 'business', Sum('rating')),
+        question_rating_count=aggregate(QuestionRating.objects.all(), 'business', Count('id')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loyalty', '0015_rating_stats'),
+        ('reviews', '0004_reviewquestion_questionrating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='service',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='service',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_rating_stats, migrations.RunPython.noop),
+    ]
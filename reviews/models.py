@@ -4,10 +4,10 @@ from django.conf import settings
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 
-from loyalty.models import Business, Customer, Product
+from loyalty.models import Business, Customer, Product, RatingStats
 
 
-class Service(models.Model):
+class Service(RatingStats):
     class Category(models.TextChoices):
         FOOD = "food", "غذا"
         CAFE = "cafe", "کافه"
@@ -0,0 +1,121 @@
+"""
+Incremental maintenance of the rating columns (``loyalty.models.RatingStats``).
+
+An approved ``Review`` counts towards its business and, when set, its product
+and service; every ``QuestionRating`` counts towards its business. The signal
+handlers in ``reviews.signals`` pass the state of a row before and after a
+save / delete, and only the difference is applied with ``UPDATE ... SET x = x + n``,
+so moderation (pending -> approved -> rejected), rating edits and deletes all
+keep the columns exact without re-aggregating. ``rebuild()`` recomputes them
+from scratch.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from typing import NamedTuple, Optional
+
+from django.db.models import Case, Count, F, FloatField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+from loyalty.models import Business, Product
+
+from .models import QuestionRating, Review, Service
+
+# Fields whose change can move a review's contribution
+REVIEW_FIELDS = ("business_id", "product_id", "service_id", "status", "rating")
+
+
+class ReviewState(NamedTuple):
+    business_id: int
+    product_id: Optional[int]
+    service_id: Optional[int]
+    status: str
+    rating: int
+
+    @classmethod
+    def of(cls, review: Review) -> "ReviewState":
+        return cls(*(getattr(review, field) for field in REVIEW_FIELDS))
+
+    @classmethod
+    def stored(cls, pk) -> Optional["ReviewState"]:
+        row = Review.objects.filter(pk=pk).values_list(*REVIEW_FIELDS).first()
+        return cls(*row) if row else None
+
+    def targets(self):
+        if self.status != Review.Status.APPROVED:
+            return []
+        targets = [(Business, self.business_id)]
+        if self.product_id:
+            targets.append((Product, self.product_id))
+        if self.service_id:
+            targets.append((Service, self.service_id))
+        return targets
+
+
+def _shift(model, pk, prefix: str, sum_delta: int, count_delta: int) -> None:
+    model.objects.filter(pk=pk).update(**{
+        f"{prefix}_sum": F(f"{prefix}_sum") + sum_delta,
+        f"{prefix}_count": F(f"{prefix}_count") + count_delta,
+    })
+
+
+def review_changed(before: Optional[ReviewState], after: Optional[ReviewState]) -> None:
+    """Apply the difference between two states of one review (None = not there)."""
+    deltas = defaultdict(lambda: [0, 0])
+    for state, sign in ((before, -1), (after, 1)):
+        if state is None:
+            continue
+        for target in state.targets():
+            deltas[target][0] += sign * state.rating
+            deltas[target][1] += sign
+    for (model, pk), (sum_delta, count_delta) in deltas.items():
+        if sum_delta or count_delta:
+            _shift(model, pk, "rating", sum_delta, count_delta)
+
+
+def question_rating_changed(before: Optional[tuple], after: Optional[tuple]) -> None:
+    """``before`` / ``after``: ``(business_id, rating)`` or None."""
+    deltas = defaultdict(lambda: [0, 0])
+    for state, sign in ((before, -1), (after, 1)):
+        if state is not None:
+            business_id, rating = state
+            deltas[business_id][0] += sign * rating
+            deltas[business_id][1] += sign
+    for business_id, (sum_delta, count_delta) in deltas.items():
+        if sum_delta or count_delta:
+            _shift(Business, business_id, "question_rating", sum_delta, count_delta)
+
+
+def _aggregate(rows, fk: str, value: str):
+    rows = rows.filter(**{fk: OuterRef("pk")}).order_by().values(fk)
+    return Coalesce(Subquery(rows.annotate(v=value).values("v")), Value(0))
+
+
+def rebuild() -> None:
+    """Recompute every rating column with one UPDATE per model."""
+    approved = Review.objects.filter(status=Review.Status.APPROVED)
+    for model, fk in ((Business, "business"), (Product, "product"), (Service, "service")):
+        model.objects.update(
+            rating_sum=_aggregate(approved, fk, Sum("rating")),
+            rating_count=_aggregate(approved, fk, Count("id")),
+        )
+    Business.objects.update(
+        question_rating_sum=_aggregate(QuestionRating.objects.all(), "business", Sum("rating")),
+        question_rating_count=_aggregate(QuestionRating.objects.all(), "business", Count("id")),
+    )
+
+
+def with_rating_values(businesses):
+    """
+    Annotate ``average_rating_value`` / ``review_count_value`` (the names the
+    business views and templates use) from the rating columns, without a join.
+    """
+    return businesses.annotate(
+        average_rating_value=Case(
+            When(rating_count__gt=0, then=Cast("rating_sum", FloatField()) / Cast("rating_count", FloatField())),
+            default=None,
+            output_field=FloatField(),
+        ),
+        review_count_value=F("rating_count"),
+    )
@@ -0,0 +1,84 @@
+"""
+Keep the rating columns of Business / Product / Service in step with Review and
+QuestionRating (see reviews.rating_stats), and drop the cached responses that
+show them (loyalty.response_cache). Services are indexed for loyalty.search.
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from loyalty import response_cache, search, suggest_index
+
+from . import rating_stats
+from .models import QuestionRating, Review, Service
+
+
+def _touches(update_fields, fields) -> bool:
+    return update_fields is None or any(f.removesuffix("_id") in update_fields or f in update_fields for f in fields)
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_state(sender, instance, update_fields=None, **kwargs):
+    instance._rating_state = None
+    if instance.pk and _touches(update_fields, rating_stats.REVIEW_FIELDS):
+        instance._rating_state = rating_stats.ReviewState.stored(instance.pk)
+
+
+@receiver(post_save, sender=Review)
+def update_review_rating_stats(sender, instance, created, update_fields=None, **kwargs):
+    if created or _touches(update_fields, rating_stats.REVIEW_FIELDS):
+        rating_stats.review_changed(getattr(instance, "_rating_state", None), rating_stats.ReviewState.of(instance))
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_rating_stats(sender, instance, **kwargs):
+    rating_stats.review_changed(rating_stats.ReviewState.of(instance), None)
+
+
+@receiver(pre_save, sender=QuestionRating)
+def remember_question_rating(sender, instance, update_fields=None, **kwargs):
+    instance._rating_state = None
+    if instance.pk and _touches(update_fields, ("business_id", "rating")):
+        instance._rating_state = (
+            QuestionRating.objects.filter(pk=instance.pk).values_list("business_id", "rating").first()
+        )
+
+
+@receiver(post_save, sender=QuestionRating)
+def update_question_rating_stats(sender, instance, created, update_fields=None, **kwargs):
+    if created or _touches(update_fields, ("business_id", "rating")):
+        rating_stats.question_rating_changed(
+            getattr(instance, "_rating_state", None), (instance.business_id, instance.rating)
+        )
+
+
+@receiver(post_delete, sender=QuestionRating)
+def remove_question_rating_stats(sender, instance, **kwargs):
+    rating_stats.question_rating_changed((instance.business_id, instance.rating), None)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=QuestionRating)
+@receiver(post_delete, sender=QuestionRating)
+def invalidate_business_responses(sender, instance, **kwargs):
+    business_ids = {instance.business_id}
+    before = getattr(instance, "_rating_state", None)
+    if before:
+        business_ids.add(before[0])  # moved to another business
+    for business_id in business_ids:
+        response_cache.invalidate(business_id)
+
+
+@receiver(post_save, sender=Service)
+def index_service_search_document(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or search.INDEXED_FIELDS.intersection(update_fields):
+        search.index(instance)
+    if update_fields is None or suggest_index.NAME_FIELDS.intersection(update_fields):
+        suggest_index.invalidate()
+
+
+@receiver(post_delete, sender=Service)
+def remove_service_search_document(sender, instance, **kwargs):
+    search.remove(search.document_kind(sender), instance.pk)
+    suggest_index.invalidate()
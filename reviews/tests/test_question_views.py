@@ -0,0 +1,44 @@
+from django.test import TestCase
+
+from loyalty.tests import factories
+from reviews.models import QuestionRating, ReviewQuestion
+from reviews.views import GetReviewQuestionsView
+
+
+class GetReviewQuestionsViewTests(TestCase):
+    def setUp(self):
+        self.business = factories.business()
+        ReviewQuestion.objects.create(business=self.business)
+        for customer in (factories.customer(), factories.customer()):
+            for number in (1, 2):
+                QuestionRating.objects.create(
+                    business=self.business, customer=customer, question_number=number, rating=4
+                )
+        self.url = f"/api/v1/reviews/questions/{self.business.pk}/"
+
+    def test_question_state(self):
+        questions_at, ratings_at, ratings = GetReviewQuestionsView()._question_state(self.business.pk)
+        self.assertEqual(questions_at, ReviewQuestion.objects.get().updated_at)
+        self.assertEqual(ratings_at, QuestionRating.objects.latest("updated_at").updated_at)
+        self.assertEqual(ratings, 4)
+        self.assertEqual(GetReviewQuestionsView()._question_state(factories.business().pk)[1:], (None, 0))
+        self.assertIsNone(GetReviewQuestionsView()._question_state(0))
+
+    def test_etag_and_vary(self):
+        response = self.client.get(self.url, headers={"accept-language": "de"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Accept-Language", response["Vary"])
+        etag = response["ETag"]
+
+        response = self.client.get(self.url, headers={"accept-language": "de", "if-none-match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertIn("Accept-Language", response["Vary"])
+        response = self.client.get(self.url, headers={"accept-language": "en", "if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+
+        QuestionRating.objects.create(
+            business=self.business, customer=factories.customer(), question_number=3, rating=5
+        )
+        response = self.client.get(self.url, headers={"accept-language": "de", "if-none-match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
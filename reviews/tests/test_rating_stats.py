@@ -0,0 +1,119 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from loyalty.models import Business, Product
+from loyalty.tests import factories
+from reviews.models import QuestionRating, Review, Service
+
+Status = Review.Status
+
+
+class RatingStatsTests(TestCase):
+    def setUp(self):
+        self.business = factories.business()
+        self.product = factories.product(self.business)
+        self.service = Service.objects.create(business=self.business, name="Haircut")
+
+    def stats(self, obj, prefix="rating"):
+        row = type(obj).objects.values_list(f"{prefix}_sum", f"{prefix}_count").get(pk=obj.pk)
+        return tuple(row)
+
+    def all_stats(self):
+        return self.stats(self.business), self.stats(self.product), self.stats(self.service)
+
+    def review(self, rating, status=Status.PENDING, **fields):
+        fields.setdefault("business", self.business)
+        return Review.objects.create(customer=factories.customer(), rating=rating, status=status, **fields)
+
+    def test_moderation_and_edits(self):
+        review = self.review(4, product=self.product, service=self.service)
+        self.assertEqual(self.all_stats(), ((0, 0),) * 3)
+
+        review.status = Status.APPROVED
+        review.save()
+        self.assertEqual(self.all_stats(), ((4, 1),) * 3)
+
+        review.rating = 2
+        review.save(update_fields=["rating"])
+        self.assertEqual(self.all_stats(), ((2, 1),) * 3)
+
+        review.status = Status.REJECTED
+        review.save(update_fields=["status"])
+        self.assertEqual(self.all_stats(), ((0, 0),) * 3)
+
+        review.status = Status.APPROVED
+        review.save()
+        self.assertEqual(self.all_stats(), ((2, 1),) * 3)
+
+        # Saves that cannot move the rating leave the columns alone
+        review.comment = "Still good"
+        review.save(update_fields=["comment"])
+        self.assertEqual(self.all_stats(), ((2, 1),) * 3)
+
+    def test_review_moved_off_a_product(self):
+        review = self.review(5, status=Status.APPROVED, product=self.product)
+        review.product = None
+        review.save()
+        self.assertEqual(self.all_stats(), ((5, 1), (0, 0), (0, 0)))
+
+    def test_stale_business_save_keeps_the_counts(self):
+        stale = Business.objects.get(pk=self.business.pk)
+        self.review(5, status=Status.APPROVED)
+        self.review(3, status=Status.APPROVED)
+        stale.name = "Renamed"
+        stale.save()
+        self.business.refresh_from_db()
+        self.assertEqual((self.business.name, self.business.rating_sum, self.business.rating_count), ("Renamed", 8, 2))
+        self.assertEqual(self.business.average_rating, 4)
+
+    def test_delete(self):
+        review = self.review(4, status=Status.APPROVED, service=self.service)
+        self.review(2, status=Status.APPROVED)
+        review.delete()
+        self.assertEqual(self.all_stats(), ((2, 1), (0, 0), (0, 0)))
+
+    def test_question_ratings(self):
+        customer = factories.customer()
+        first = QuestionRating.objects.create(business=self.business, customer=customer, question_number=1, rating=5)
+        QuestionRating.objects.create(business=self.business, customer=customer, question_number=2, rating=3)
+        self.assertEqual(self.stats(self.business, "question_rating"), (8, 2))
+        first.rating = 1
+        first.save()
+        self.assertEqual(self.stats(self.business, "question_rating"), (4, 2))
+        first.delete()
+        self.assertEqual(self.stats(self.business, "question_rating"), (3, 1))
+
+    def test_rebuild_matches_the_incremental_columns(self):
+        other_business = factories.business()
+        other_product = factories.product(other_business)
+        moved = self.review(3, status=Status.APPROVED, product=self.product)
+        self.review(5, status=Status.APPROVED, service=self.service)
+        self.review(1, status=Status.REJECTED, product=self.product)
+        self.review(2)
+        edited = self.review(4, business=other_business, product=other_product)
+        edited.status = Status.APPROVED
+        edited.rating = 5
+        edited.save()
+        moved.product = None
+        moved.save()
+        QuestionRating.objects.create(business=other_business, customer=factories.customer(), question_number=1, rating=4)
+
+        def snapshot():
+            return (
+                list(Business.objects.order_by("pk").values_list(
+                    "rating_sum", "rating_count", "question_rating_sum", "question_rating_count"
+                )),
+                list(Product.objects.order_by("pk").values_list("rating_sum", "rating_count")),
+                list(Service.objects.order_by("pk").values_list("rating_sum", "rating_count")),
+            )
+
+        incremental = snapshot()
+        out = StringIO()
+        call_command("rebuild_rating_stats", "--check", stdout=out)
+        self.assertIn("0 rows would be corrected", out.getvalue())
+
+        Business.objects.update(rating_sum=0, rating_count=0, question_rating_sum=0, question_rating_count=0)
+        call_command("rebuild_rating_stats", stdout=StringIO())
+        self.assertEqual(snapshot(), incremental)
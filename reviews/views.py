@@ -5,14 +5,18 @@ from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied, NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.db.models import Count, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
 from datetime import timedelta
 
 from accounts.models import Profile
 from accounts.permissions import IsAdminRole, IsBusinessOwnerRole, IsCustomerRole
+from loyalty.conditional import ConditionalGetMixin
 from loyalty.models import Business, Customer, Product
-from .models import Review, ReviewResponse, Service
+from .models import QuestionRating, Review, ReviewQuestion, ReviewResponse, Service
 from .serializers import ReviewResponseSerializer, ReviewSerializer, ServiceSerializer
 
 
@@ -730,7 +734,26 @@ class CreateServiceReviewView(APIView):
 
 
 # New Question-Based Review System APIs
-class GetReviewQuestionsView(APIView):
+def _question_language(request):
+    """Language from ?lang=, else the Accept-Language header ('en' or 'de')"""
+    language = request.query_params.get('lang')
+    if language not in ['en', 'de']:
+        # Try to get from Accept-Language header
+        accept_language = request.META.get('HTTP_ACCEPT_LANGUAGE', '')
+        if 'de' in accept_language.lower():
+            language = 'de'
+        else:
+            language = 'en'
+    return language
+
+
+def _per_business(model, aggregate):
+    """``aggregate`` over the business's rows of ``model``, as a subquery of a Business queryset."""
+    rows = model.objects.filter(business=OuterRef("pk")).order_by().values("business")
+    return Subquery(rows.annotate(value=aggregate).values("value"))
+
+
+class GetReviewQuestionsView(ConditionalGetMixin, APIView):
     """
     GET /api/v1/reviews/questions/{business_id}/
     Returns the 5 review questions configured by admin for a business
@@ -738,6 +761,37 @@ class GetReviewQuestionsView(APIView):
     """
     permission_classes = [permissions.AllowAny]
 
+    def _question_state(self, business_id):
+        # (questions updated_at, last rating updated_at, rating count) in one query; None if no business.
+        # Each value is its own subquery: aggregates over joins of both relations would multiply the rows.
+        if not hasattr(self, "_state"):
+            self._state = (
+                Business.objects.filter(pk=business_id)
+                .annotate(
+                    questions_at=_per_business(ReviewQuestion, Max("updated_at")),
+                    ratings_at=_per_business(QuestionRating, Max("updated_at")),
+                    ratings=Coalesce(_per_business(QuestionRating, Count("id")), Value(0)),
+                )
+                .values_list("questions_at", "ratings_at", "ratings")
+                .first()
+            )
+        return self._state
+
+    def get_validator(self, request, business_id):
+        state = self._question_state(business_id)
+        return None if state is None else (_question_language(request), *state)
+
+    def get_last_modified(self, request, business_id):
+        state = self._question_state(business_id)
+        stamps = [at for at in (state or ())[:2] if at is not None]
+        return max(stamps) if stamps else None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # Without ?lang= the question texts follow Accept-Language
+        patch_vary_headers(response, ("Accept-Language",))
+        return response
+
     def get(self, request, business_id):
         try:
             business = Business.objects.get(id=business_id)
@@ -753,14 +807,7 @@ class GetReviewQuestionsView(APIView):
         from django.utils import translation
         
         # Get language from query parameter, Accept-Language header, or default to 'en'
-        language = request.query_params.get('lang', 'en')
-        if language not in ['en', 'de']:
-            # Try to get from Accept-Language header
-            accept_language = request.META.get('HTTP_ACCEPT_LANGUAGE', '')
-            if 'de' in accept_language.lower():
-                language = 'de'
-            else:
-                language = 'en'
+        language = _question_language(request)
         
         # Activate language for translation
         translation.activate(language)
@@ -0,0 +1,357 @@
+"""
+Batch processing of queued product scans (POS tablets replaying after being offline).
+
+A batch costs a fixed number of statements whatever its size: existing
+QRCodeScan hashes, products, businesses, customers and wallets are each loaded
+with one query, dedupe and ledger rows are written with ``bulk_create``, and
+wallet balances / points summaries change with one ``UPDATE ... CASE`` per chunk
+(``wallet_service.apply_points_bulk`` / ``points_summary.record_activity_bulk``).
+
+Items are applied in input order per wallet, so a reward redemption queued after
+a purchase can spend the points that purchase earned.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+
+from loyalty import wallet_service
+from loyalty.models import Business, Customer, Product, Wallet
+from loyalty.points_summary import rebuild_summary, record_activity_bulk
+from .models import PointsTransaction, QRCodeScan
+
+MAX_BATCH_SCANS = 500
+GUARD_RETRIES = 3
+
+APPLIED = "applied"
+ALREADY_SCANNED = "already_scanned"
+DUPLICATE_KEY = "duplicate_key"
+INVALID = "invalid"
+FORBIDDEN = "forbidden"
+INSUFFICIENT_POINTS = "insufficient_points"
+CONFLICT = "conflict"
+
+
+class BatchScanError(ValueError):
+    """The batch as a whole is malformed (nothing was processed)."""
+
+
+def _as_int(value):
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse(raw):
+    """Validate one scan; returns ``(item, error)``."""
+    if not isinstance(raw, dict):
+        return None, "each scan must be an object"
+    key = raw.get("idempotency_key")
+    if not isinstance(key, str) or not key.strip() or len(key) > 128:
+        return None, "idempotency_key is required (string, max 128 chars)"
+    business_id = _as_int(raw.get("business_id"))
+    if business_id is None:
+        return None, "business_id is required"
+    product_ids = raw.get("product_ids")
+    if product_ids is None and raw.get("product_id") is not None:
+        product_ids = [raw.get("product_id")]
+    if not isinstance(product_ids, list) or not product_ids:
+        return None, "product_ids must be a non-empty array"
+    product_ids = [_as_int(pid) for pid in product_ids]
+    if None in product_ids:
+        return None, "product_ids must be integers"
+    customer_id = raw.get("customer_id")
+    if customer_id is not None:
+        customer_id = _as_int(customer_id)
+        if customer_id is None:
+            return None, "customer_id must be an integer"
+
+    # Same payload fields as QRProductScanView so a QR code cannot be redeemed through both endpoints.
+    # Without qr_timestamp the client key makes the scan unique, so replays of it are ignored.
+    payload = {"business_id": business_id, "customer_id": customer_id, "product_ids": sorted(product_ids)}
+    qr_timestamp = raw.get("qr_timestamp")
+    if qr_timestamp is not None:
+        payload["qr_timestamp"] = qr_timestamp
+    else:
+        payload["idempotency_key"] = key
+
+    return {
+        "key": key,
+        "business_id": business_id,
+        "product_ids": product_ids,
+        "customer_id": customer_id,
+        "payload_hash": QRCodeScan.generate_hash(payload),
+    }, None
+
+
+def _plan(balance, items):
+    """
+    Accept items in order while the running balance stays >= 0.
+
+    Returns ``(accepted, rejected, net_delta, floor)`` where ``floor`` is the
+    lowest starting balance for which every accepted step stays non-negative.
+    """
+    accepted, rejected = [], []
+    running = balance
+    net = floor = 0
+    for item in items:
+        if running + item["points"] >= 0:
+            running += item["points"]
+            net += item["points"]
+            floor = max(floor, -net)
+            accepted.append(item)
+        else:
+            rejected.append(item)
+    return accepted, rejected, net, floor
+
+
+def _claim(items, results):
+    """Insert the QRCodeScan dedupe rows; items whose hash is already taken are reported and dropped."""
+    while items:
+        try:
+            with transaction.atomic():
+                QRCodeScan.objects.bulk_create([
+                    QRCodeScan(
+                        payload_hash=item["payload_hash"],
+                        business_id=item["business_id"],
+                        customer_id=item["customer_id"],
+                        product_ids=item["product_ids"],
+                    )
+                    for item in items
+                ])
+            return items
+        except IntegrityError:
+            # A concurrent request claimed some of the hashes since we checked
+            taken = dict(
+                QRCodeScan.objects.filter(payload_hash__in=[item["payload_hash"] for item in items])
+                .values_list("payload_hash", "scanned_at")
+            )
+            for item in items:
+                if item["payload_hash"] in taken:
+                    results[item["index"]] = {
+                        "idempotency_key": item["key"],
+                        "status": ALREADY_SCANNED,
+                        "scanned_at": taken[item["payload_hash"]],
+                    }
+            items = [item for item in items if item["payload_hash"] not in taken]
+    return items
+
+
+def process_scans(user, scans):
+    """
+    Apply a list of scans for ``user`` and return one result dict per scan, in input order.
+
+    Items with ``customer_id`` credit that customer and require the user to own the
+    business (or be staff); items without it credit the user's own customer record.
+    Call inside ``transaction.atomic``.
+    """
+    if not isinstance(scans, list) or not scans:
+        raise BatchScanError("scans must be a non-empty array")
+    if len(scans) > MAX_BATCH_SCANS:
+        raise BatchScanError(f"at most {MAX_BATCH_SCANS} scans per request")
+
+    results = [None] * len(scans)
+    items = []
+    seen_keys = set()
+    seen_hashes = set()
+    for index, raw in enumerate(scans):
+        item, error = _parse(raw)
+        key = raw.get("idempotency_key") if isinstance(raw, dict) else None
+        if error:
+            results[index] = {"idempotency_key": key, "status": INVALID, "error": error}
+        elif item["key"] in seen_keys or item["payload_hash"] in seen_hashes:
+            results[index] = {"idempotency_key": key, "status": DUPLICATE_KEY}
+        else:
+            seen_keys.add(item["key"])
+            seen_hashes.add(item["payload_hash"])
+            item["index"] = index
+            items.append(item)
+
+    def finish(item, status_, **extra):
+        results[item["index"]] = {"idempotency_key": item["key"], "status": status_, **extra}
+
+    # Already scanned earlier (one query)
+    scanned = dict(
+        QRCodeScan.objects.filter(payload_hash__in=[item["payload_hash"] for item in items])
+        .values_list("payload_hash", "scanned_at")
+    )
+    pending = []
+    for item in items:
+        if item["payload_hash"] in scanned:
+            finish(item, ALREADY_SCANNED, scanned_at=scanned[item["payload_hash"]])
+        else:
+            pending.append(item)
+
+    # Products, businesses and customers (one query each)
+    product_ids = {pid for item in pending for pid in item["product_ids"]}
+    products = {
+        p.id: p
+        for p in Product.objects.filter(id__in=product_ids, active=True).only(
+            "id", "business_id", "points_reward", "is_reward"
+        )
+    }
+    businesses = {
+        b.id: b
+        for b in Business.objects.filter(id__in={item["business_id"] for item in pending}).only(
+            "id", "owner_id", "reward_point_cost"
+        )
+    }
+    customer_owners = dict(
+        Customer.objects.filter(id__in={item["customer_id"] for item in pending if item["customer_id"]})
+        .values_list("id", "user_id")
+    )
+    own_customer = None
+    if any(item["customer_id"] is None for item in pending):
+        own_customer, _ = Customer.objects.get_or_create(user=user)
+
+    valid = []
+    for item in pending:
+        business = businesses.get(item["business_id"])
+        if business is None:
+            finish(item, INVALID, error="Business not found")
+            continue
+        found = [products[pid] for pid in item["product_ids"] if pid in products and products[pid].business_id == business.id]
+        if len(found) != len(item["product_ids"]):
+            finish(item, INVALID, error="Some products not found or not active", found_products=[p.id for p in found])
+            continue
+        if item["customer_id"] is None:
+            item["wallet_customer_id"] = own_customer.id
+        elif item["customer_id"] not in customer_owners:
+            finish(item, INVALID, error="Customer not found")
+            continue
+        elif not (user.is_staff or business.owner_id == user.id or customer_owners[item["customer_id"]] == user.id):
+            finish(item, FORBIDDEN, error="Only the business owner can credit other customers")
+            continue
+        else:
+            item["wallet_customer_id"] = item["customer_id"]
+        # Negative for rewards (is_reward=True), positive for menu items
+        item["points"] = sum(-p.points_reward if p.is_reward else p.points_reward for p in found)
+        item["business"] = business
+        valid.append(item)
+
+    valid = _claim(valid, results)
+    if not valid:
+        return results
+
+    # Current wallets (one query); group items per wallet in input order
+    by_wallet = defaultdict(list)
+    for item in valid:
+        by_wallet[(item["wallet_customer_id"], item["business_id"])].append(item)
+    wallets = {}
+    for wallet_id, customer_id, business_id, balance in Wallet.objects.filter(
+        customer_id__in={k[0] for k in by_wallet}, business_id__in={k[1] for k in by_wallet}
+    ).values_list("id", "customer_id", "business_id", "points_balance"):
+        if (customer_id, business_id) in by_wallet:
+            wallets[(customer_id, business_id)] = (wallet_id, balance)
+
+    # Create the missing wallets that will receive points (bulk_create skips signals,
+    # so those customers' summaries are rebuilt at the end)
+    missing = [
+        key for key, group in by_wallet.items()
+        if key not in wallets and _plan(0, group)[0]
+    ]
+    rebuild_customers = set()
+    if missing:
+        Wallet.objects.bulk_create(
+            [
+                Wallet(customer_id=cid, business_id=bid, reward_point_cost=by_wallet[(cid, bid)][0]["business"].reward_point_cost)
+                for cid, bid in missing
+            ],
+            ignore_conflicts=True,
+        )
+        rebuild_customers = {cid for cid, _ in missing}
+        for wallet_id, customer_id, business_id, balance in Wallet.objects.filter(
+            customer_id__in=rebuild_customers, business_id__in={bid for _, bid in missing}
+        ).values_list("id", "customer_id", "business_id", "points_balance"):
+            if (customer_id, business_id) in by_wallet:
+                wallets[(customer_id, business_id)] = (wallet_id, balance)
+
+    applied = []
+    rejected = []
+    to_apply = dict(by_wallet)
+    for attempt in range(GUARD_RETRIES):
+        plans = {}
+        changes = {}
+        costs = {}
+        for key, group in to_apply.items():
+            if key not in wallets:
+                # Only debits for a customer without a wallet here: nothing to spend
+                plans[key] = (None, [], group, 0)
+                continue
+            wallet_id, balance = wallets[key]
+            accepted, group_rejected, net, floor = _plan(balance, group)
+            plans[key] = (wallet_id, accepted, group_rejected, net)
+            if accepted:
+                changes[wallet_id] = (net, floor)
+                costs[wallet_id] = group[0]["business"].reward_point_cost
+        balances = wallet_service.apply_points_bulk(changes, costs)
+
+        retry = []
+        for key, (wallet_id, accepted, group_rejected, net) in plans.items():
+            if accepted and wallet_id not in balances:
+                retry.append(key)
+                continue
+            rejected.extend((item, wallets.get(key, (None, 0))[1]) for item in group_rejected)
+            if accepted:
+                running = balances[wallet_id].points_balance - net
+                for item in accepted:
+                    running += item["points"]
+                    item["wallet_id"] = wallet_id
+                    item["points_balance"] = running
+                    applied.append(item)
+        if not retry:
+            break
+        # Balances moved under us; re-read them and plan again
+        wallet_ids = [wallets[key][0] for key in retry]
+        fresh = dict(Wallet.objects.filter(id__in=wallet_ids).values_list("id", "points_balance"))
+        for key in retry:
+            wallets[key] = (wallets[key][0], fresh.get(wallets[key][0], 0))
+        to_apply = {key: to_apply[key] for key in retry}
+    else:
+        for key in retry:
+            for item in to_apply[key]:
+                finish(item, CONFLICT, error="Wallet changed concurrently, retry this scan")
+                rejected.append((item, None))
+
+    for item, balance in rejected:
+        if results[item["index"]] is None:
+            finish(item, INSUFFICIENT_POINTS, current_balance=balance, required=abs(item["points"]))
+    if rejected:
+        # Rejected scans stay unused, like a rolled back single scan
+        QRCodeScan.objects.filter(payload_hash__in=[item["payload_hash"] for item, _ in rejected]).delete()
+
+    # Ledger rows (bulk_create skips PointsTransaction.save(), so the summaries are updated below)
+    entries = PointsTransaction.objects.bulk_create([
+        PointsTransaction(
+            wallet_id=item["wallet_id"],
+            points=item["points"],
+            note=f"QR scan - Products: {', '.join(str(pid) for pid in item['product_ids'])}",
+        )
+        for item in applied
+    ])
+    summary_changes = defaultdict(lambda: [0, 0])
+    for item, entry in zip(applied, entries):
+        finish(
+            item,
+            APPLIED,
+            business_id=item["business_id"],
+            customer_id=item["wallet_customer_id"],
+            wallet_id=item["wallet_id"],
+            points=item["points"],
+            points_balance=item["points_balance"],
+            transaction_id=entry.pk,
+        )
+        if item["wallet_customer_id"] not in rebuild_customers:
+            changes = summary_changes[item["wallet_customer_id"]]
+            changes[0] += max(item["points"], 0)
+            changes[1] += max(-item["points"], 0)
+
+    record_activity_bulk({cid: tuple(values) for cid, values in summary_changes.items()})
+    for customer_id in rebuild_customers:
+        rebuild_summary(customer_id)
+    return results
@@ -0,0 +1,71 @@
+"""
+Reward eligibility for a page of reward products.
+
+The customer's balances are read once, one row per business, from their wallets
+(the wallet balance is what every award / redeem path updates, see
+``loyalty.points_engine``), and every product on the page is checked against
+them in memory. The query count does not depend on the page size, and nothing is
+written: a customer without a wallet at a business simply has 0 points there.
+"""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from loyalty import media_cache
+from loyalty.models import Wallet
+
+
+class Balances(NamedTuple):
+    by_business: Dict[int, int]
+    total: int
+
+
+class Eligibility(NamedTuple):
+    product: object
+    user_points: Optional[int]  # None for anonymous requests
+    can_redeem: bool
+
+
+NO_BALANCES = Balances({}, 0)
+
+
+def customer_balances(user) -> Balances:
+    """Per-business balances of ``user``'s customer in one query (empty for anonymous users)."""
+    if not user.is_authenticated:
+        return NO_BALANCES
+    by_business = dict(
+        Wallet.objects.filter(customer__user=user).values_list("business_id", "points_balance")
+    )
+    return Balances(by_business, sum(by_business.values()))
+
+
+def evaluate(products: Iterable, balances: Optional[Balances]) -> List[Eligibility]:
+    """
+    ``Eligibility`` for each product, in order. ``balances=None`` means an
+    anonymous request: no points and nothing redeemable.
+    """
+    if balances is None:
+        return [Eligibility(p, None, False) for p in products]
+    result = []
+    for p in products:
+        points = balances.by_business.get(p.business_id, 0)
+        result.append(Eligibility(p, points, points >= p.points_reward))
+    return result
+
+
+def redeemable_item(request, entry: Eligibility) -> dict:
+    """One product of GET /api/v1/rewards/redeemable-products/ (also used by /api/v1/home/)."""
+    p = entry.product
+    business = p.business
+    return {
+        "id": p.id,
+        "title": p.title,
+        "image": media_cache.image_url(request, p),
+        "business_id": business.id,
+        "business_name": business.name,
+        "points_required": p.points_reward,
+        "price_cents": p.price_cents,
+        "can_redeem": entry.can_redeem,
+        "user_points": entry.user_points,
+    }
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.2 on 2026-10-17 10:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0001_initial'),
+        ('loyalty', '0013_transaction_loyalty_tx_wallet_created_idx'),
+        ('rewards', '0002_qrcodescan'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pointstransaction',
+            index=models.Index(fields=['wallet', 'created_at', 'id'], name='rewards_ptx_wallet_created_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.2 on 2026-10-17 10:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('campaigns', '0001_initial'),
+        ('loyalty', '0014_ledger_rollups'),
+        ('rewards', '0003_pointstransaction_rewards_ptx_wallet_created_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsTransactionArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('points', models.IntegerField()),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('campaign', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='campaigns.campaign')),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='loyalty.wallet')),
+            ],
+        ),
+    ]
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import hashlib
 import json
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 from loyalty.models import Wallet
@@ -18,10 +18,23 @@ class PointsTransaction(models.Model):
 
     class Meta:
         ordering = ("-created_at",)
+        indexes = [
+            models.Index(fields=["wallet", "created_at", "id"], name="rewards_ptx_wallet_created_idx"),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover
         return f"{self.points} @ {self.wallet_id}"
 
+    def save(self, *args, **kwargs):
+        creating = self._state.adding
+        # Same as loyalty.Transaction.save(): no savepoint round trips per insert
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if creating:
+                from loyalty.points_summary import record_ledger_entry
+
+                record_ledger_entry(self.wallet.customer_id, self.points, self.created_at)
+
 
 class QRCodeScan(models.Model):
     """
@@ -50,3 +63,13 @@ class QRCodeScan(models.Model):
     
     def __str__(self) -> str:
         return f"QR Scan {self.payload_hash[:8]}... @ {self.scanned_at}"
+
+
+class PointsTransactionArchive(models.Model):
+    """PointsTransaction rows moved out of the live table by ``rollup_ledgers --archive``."""
+    id = models.BigIntegerField(primary_key=True)
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="+")
+    campaign = models.ForeignKey(Campaign, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    points = models.IntegerField()
+    created_at = models.DateTimeField(db_index=True)
+    note = models.CharField(max_length=200, blank=True)
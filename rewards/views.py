@@ -1,30 +1,44 @@
 from __future__ import annotations
 
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
 from rest_framework import permissions, status, generics
+from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from django.contrib.auth.models import User
-from django.db.models import Sum
 from accounts.permissions import IsCustomerRole, IsBusinessOwnerRole
 from accounts.models import Profile
 from loyalty.models import Business, Customer, Wallet, Product
+from loyalty.pagination import KeysetPagination
+from loyalty.points_summary import get_points_summary
+from loyalty import points_engine, reward_index
 from qr.models import QRCode
 from campaigns.models import Campaign
+from securityapp.idempotency import idempotent
+from . import batch_scan, eligibility
 from .models import PointsTransaction, QRCodeScan
 from .serializers import PointsTransactionSerializer
 
 
 class PointsHistoryView(generics.ListAPIView):
+    """
+    GET /api/v1/rewards/history/?business_id=&cursor=&limit=&with_count=1
+    Newest first, keyset-paginated: pass next_cursor as ?cursor= for the next page.
+    """
     serializer_class = PointsTransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         try:
             customer, _ = Customer.objects.get_or_create(user=self.request.user)
-            return PointsTransaction.objects.filter(wallet__customer=customer).select_related("wallet", "campaign").order_by("-created_at")
+            wallet_ids = Wallet.objects.filter(customer=customer)
+            business_id = self.request.query_params.get("business_id")
+            if business_id:
+                wallet_ids = wallet_ids.filter(business_id=business_id)
+            return PointsTransaction.objects.filter(wallet_id__in=wallet_ids.values("id")).select_related("wallet__business", "campaign")
         except Exception:
             return PointsTransaction.objects.none()
 
@@ -32,8 +46,10 @@ class PointsHistoryView(generics.ListAPIView):
         # Ensure endpoint never fails; return empty list on any error
         try:
             return super().list(request, *args, **kwargs)
+        except APIException:
+            raise
         except Exception:
-            return Response({"results": []})
+            return Response({"results": [], "has_next": False, "next_cursor": None})
 
 
 class PointsBalanceView(APIView):
@@ -51,7 +67,7 @@ class PointsBalanceView(APIView):
                     "balance": w.points_balance,
                     "reward_point_cost": w.reward_point_cost or w.business.reward_point_cost,
                 })
-            return Response({"wallets": result})
+            return Response({"wallets": result, "total_points": get_points_summary(customer).total_balance})
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -60,6 +76,7 @@ class QRScanAwardPointsView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsCustomerRole]
 
     @transaction.atomic
+    @idempotent
     def post(self, request):
         token = request.data.get("token")
         qr = QRCode.objects.filter(token=token, active=True).select_related("business", "campaign").first()
@@ -74,30 +91,30 @@ class QRScanAwardPointsView(APIView):
                 "scanned_at": qr.scanned_at
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        customer, _ = Customer.objects.get_or_create(user=request.user)
-        wallet, _ = Wallet.objects.select_for_update().get_or_create(
-            customer=customer,
-            business=qr.business,
-            defaults={"reward_point_cost": qr.business.reward_point_cost},
-        )
-        wallet.reward_point_cost = wallet.reward_point_cost or qr.business.reward_point_cost
-        points = qr.campaign.points_per_scan if qr.campaign else 1
-        wallet.points_balance += points
-        wallet.save(update_fields=["points_balance", "reward_point_cost", "updated_at"])
-        PointsTransaction.objects.create(wallet=wallet, campaign=qr.campaign, points=points, note="scan")
-        
-        # Mark QR code as scanned
+        # Claim the QR code with a conditional update so two concurrent scans cannot both award points
         from django.utils import timezone
-        qr.scanned_at = timezone.now()
-        qr.save(update_fields=["scanned_at"])
+        scanned_at = timezone.now()
+        claimed = QRCode.objects.filter(pk=qr.pk, scanned_at__isnull=True).update(scanned_at=scanned_at)
+        if not claimed:
+            qr.refresh_from_db(fields=["scanned_at"])
+            return Response({
+                "detail": "این QR کد قبلاً اسکن شده است",
+                "scanned": True,
+                "scanned_at": qr.scanned_at
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        customer = points_engine.resolve_customer(request.user)
+        points = qr.campaign.points_per_scan if qr.campaign else 1
+        result = points_engine.award(customer, qr.business, points, campaign=qr.campaign, note="scan")
         
-        return Response({"awarded": points, "points_balance": wallet.points_balance})
+        return Response({"awarded": points, "points_balance": result.points_balance})
 
 
 class RedeemPointsView(APIView):
     permission_classes = [permissions.IsAuthenticated]  # Removed IsCustomerRole to allow auto-creation
 
     @transaction.atomic
+    @idempotent
     def post(self, request):
         try:
             business_id = request.data.get("business_id")
@@ -133,26 +150,18 @@ class RedeemPointsView(APIView):
             if not profile.role or profile.role not in [Profile.Role.CUSTOMER, Profile.Role.BUSINESS_OWNER, Profile.Role.ADMIN, Profile.Role.SUPERUSER]:
                 profile.role = Profile.Role.CUSTOMER
                 profile.save(update_fields=["role"])
-            wallet, wallet_created = Wallet.objects.select_for_update().get_or_create(
-                customer=customer,
-                business=business,
-                defaults={"reward_point_cost": business.reward_point_cost}
-            )
-            
-            if wallet.points_balance < amount:
+            try:
+                result = points_engine.redeem(customer, business, amount, note="redeem")
+            except points_engine.InsufficientPoints as exc:
                 return Response({
                     "detail": "insufficient points",
-                    "current_balance": wallet.points_balance,
+                    "current_balance": exc.current_balance,
                     "required": amount
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            wallet.points_balance -= amount
-            wallet.save(update_fields=["points_balance", "updated_at"])
-            PointsTransaction.objects.create(wallet=wallet, points=-amount, note="redeem")
-            
             return Response({
                 "redeemed": amount,
-                "points_balance": wallet.points_balance,
+                "points_balance": result.points_balance,
                 "business_id": business_id
             }, status=status.HTTP_200_OK)
             
@@ -172,6 +181,7 @@ class QRProductScanView(APIView):
     permission_classes = [permissions.AllowAny]  # Allow unauthenticated for new users
 
     @transaction.atomic
+    @idempotent
     def post(self, request):
         business_id = request.data.get("business_id")
         product_ids = request.data.get("product_ids", [])
@@ -258,17 +268,14 @@ class QRProductScanView(APIView):
                 is_new_user = True
         
         # Get or create customer
-        customer, customer_created = Customer.objects.get_or_create(user=user)
-        if phone and not customer.phone:
-            customer.phone = phone
-            customer.save(update_fields=["phone"])
+        customer = points_engine.resolve_customer(user, phone)
         
         # Get products and calculate total points
-        products = Product.objects.filter(id__in=product_ids, business=business, active=True)
-        if products.count() != len(product_ids):
+        products = list(Product.objects.filter(id__in=product_ids, business=business, active=True))
+        if len(products) != len(product_ids):
             return Response({
                 "error": "Some products not found or not active",
-                "found_products": list(products.values_list("id", flat=True))
+                "found_products": [p.id for p in products]
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Calculate total points: negative for rewards (is_reward=True), positive for menu items
@@ -277,43 +284,36 @@ class QRProductScanView(APIView):
             for p in products
         )
         
-        # Get or create wallet
-        wallet, wallet_created = Wallet.objects.select_for_update().get_or_create(
-            customer=customer,
-            business=business,
-            defaults={"reward_point_cost": business.reward_point_cost}
-        )
-        wallet.reward_point_cost = wallet.reward_point_cost or business.reward_point_cost
-        
-        # Check if user has enough points for reward redemption
-        if total_points < 0 and wallet.points_balance < abs(total_points):
+        # Mark QR code as scanned; the unique payload_hash rejects a concurrent duplicate
+        try:
+            with transaction.atomic():
+                QRCodeScan.objects.create(
+                    payload_hash=payload_hash,
+                    business_id=business_id,
+                    customer_id=customer.id if customer else None,
+                    product_ids=product_ids
+                )
+        except IntegrityError:
+            transaction.set_rollback(True)
             return Response({
-                "error": "Insufficient points",
-                "current_balance": wallet.points_balance,
-                "required": abs(total_points)
+                "error": "This QR code has already been scanned",
+                "scanned": True,
+                "is_first_scan": False,
+                "already_scanned": True,
+                "message": "این QR کد قبلاً استفاده شده است"
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        wallet.points_balance += total_points
-        wallet.save(update_fields=["points_balance", "reward_point_cost", "updated_at"])
-        
-        # Create points transaction
+        # Apply the points; fails instead of going negative on reward redemption
         note = f"QR scan - Products: {', '.join(str(p.id) for p in products)}"
-        transaction = PointsTransaction.objects.create(
-            wallet=wallet,
-            points=total_points,
-            note=note
-        )
-        
-        # Mark QR code as scanned
-        QRCodeScan.objects.create(
-            payload_hash=payload_hash,
-            business_id=business_id,
-            customer_id=customer.id if customer else None,
-            product_ids=product_ids
-        )
-        
-        # Calculate new balance
-        current_balance = wallet.points_balance
+        try:
+            result = points_engine.apply(customer, business, total_points, note=note)
+        except points_engine.InsufficientPoints as exc:
+            transaction.set_rollback(True)
+            return Response({
+                "error": "Insufficient points",
+                "current_balance": exc.current_balance,
+                "required": exc.required
+            }, status=status.HTTP_400_BAD_REQUEST)
         
         # Return response for React Native
         return Response({
@@ -334,12 +334,41 @@ class QRProductScanView(APIView):
                 } for p in products
             ],
             "total_points_awarded": total_points,
-            "current_balance": current_balance,
-            "transaction_id": transaction.id,
-            "wallet_id": wallet.id
+            "current_balance": result.points_balance,
+            "transaction_id": result.entry.id,
+            "wallet_id": result.wallet_id
         }, status=status.HTTP_201_CREATED)
 
 
+class BatchScanView(APIView):
+    """
+    Replay queued product scans in one request (POS tablets that were offline).
+    POST /api/v1/rewards/scan-products/batch/
+    Body: {"scans": [{"idempotency_key": "tab1-0001", "business_id": 1, "product_ids": [1, 2],
+                      "customer_id": 3, "qr_timestamp": 1718000000}, ...]}
+    
+    Each scan gets a result with its idempotency_key and a status:
+    applied | already_scanned | duplicate_key | invalid | forbidden | insufficient_points | conflict.
+    Replaying a batch is safe: scans that were applied before come back as already_scanned.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @transaction.atomic
+    @idempotent
+    def post(self, request):
+        scans = request.data if isinstance(request.data, list) else request.data.get("scans")
+        try:
+            results = batch_scan.process_scans(request.user, scans)
+        except batch_scan.BatchScanError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            "total": len(results),
+            "applied": sum(1 for r in results if r["status"] == batch_scan.APPLIED),
+            "results": results,
+        })
+
+
 class CheckQRCodeStatusView(APIView):
     """
     Check if a QR code (JSON payload) has already been scanned
@@ -409,147 +438,27 @@ class RedeemableProductsView(APIView):
         except ValueError:
             offset = 0
 
-        # Get all active reward products
-        products_qs = Product.objects.filter(active=True, is_reward=True).select_related("business").order_by("points_reward")
         if business_id:
             try:
                 business_id = int(business_id)
-                products_qs = products_qs.filter(business_id=business_id)
             except (TypeError, ValueError):
                 return Response(
                     {"detail": "business_id must be an integer"},
                     status=status.HTTP_400_BAD_REQUEST
                 )
+        else:
+            business_id = None
 
-        count = products_qs.count()
-        products = products_qs[offset:offset+limit]
+        # Active reward products, cheapest first, from the in-process catalog index
+        index = reward_index.get_reward_index()
+        count = index.count(business_id=business_id)
+        products = reward_index.load_products(index.page(offset, limit, business_id=business_id))
 
-        # If user is authenticated, check their points
-        user_points = {}
-        total_points = 0
-        if request.user.is_authenticated:
-            try:
-                customer, _ = Customer.objects.get_or_create(user=request.user)
-                
-                # محاسبه total_points از تاریخچه تراکنش‌ها (واقعی)
-                from rewards.models import PointsTransaction
-                all_points_transactions = PointsTransaction.objects.filter(wallet__customer=customer)
-                total_points = all_points_transactions.aggregate(
-                    total=Sum("points")
-                ).get("total") or 0
-                
-                # اگر total_points 0 است و هیچ تراکنشی وجود ندارد، از Wallet.points_balance استفاده کن
-                if total_points == 0 and not all_points_transactions.exists():
-                    all_wallets = Wallet.objects.filter(customer=customer)
-                    total_points = sum(w.points_balance for w in all_wallets) or 0
-                
-                # برای business های موجود در products، wallets را بگیر
-                wallets = Wallet.objects.filter(customer=customer).select_related("business")
-                
-                # اگر Wallet برای business های موجود وجود ندارد، ایجاد کن با 200 points
-                business_ids_in_products = set(p.business_id for p in products)
-                existing_business_ids = set(w.business_id for w in wallets)
-                missing_business_ids = business_ids_in_products - existing_business_ids
-                
-                for bid in missing_business_ids:
-                    try:
-                        business = Business.objects.get(id=bid)
-                        wallet, created = Wallet.objects.get_or_create(
-                            customer=customer,
-                            business=business,
-                            defaults={
-                                'points_balance': 200,
-                                'reward_point_cost': business.reward_point_cost or 100
-                            }
-                        )
-                        # اگر wallet از قبل وجود داشت اما points_balance 0 است، آن را به 200 تنظیم کن
-                        if not created and wallet.points_balance == 0:
-                            wallet.points_balance = 200
-                            wallet.save(update_fields=['points_balance'])
-                            # total_points را دوباره محاسبه کن
-                            all_wallets = Wallet.objects.filter(customer=customer)
-                            total_points = sum(w.points_balance for w in all_wallets) or 0
-                    except Business.DoesNotExist:
-                        pass
-                
-                # دوباره wallets را بگیر (شامل wallet های جدید)
-                wallets = Wallet.objects.filter(customer=customer).select_related("business")
-                
-                # محاسبه user_points از PointsTransaction برای هر business (واقعی)
-                user_points = {}
-                for wallet in wallets:
-                    # محاسبه balance از PointsTransaction
-                    wallet_points = PointsTransaction.objects.filter(wallet=wallet).aggregate(
-                        total=Sum("points")
-                    ).get("total") or 0
-                    
-                    # اگر هیچ تراکنشی وجود ندارد، از wallet.points_balance استفاده کن
-                    if wallet_points == 0:
-                        wallet_points = wallet.points_balance or 0
-                    
-                    user_points[wallet.business_id] = wallet_points
-                
-                # دوباره total_points را از تاریخچه تراکنش‌ها محاسبه کن (واقعی)
-                all_points_transactions = PointsTransaction.objects.filter(wallet__customer=customer)
-                total_points = all_points_transactions.aggregate(
-                    total=Sum("points")
-                ).get("total") or 0
-                
-                # اگر total_points 0 است و هیچ تراکنشی وجود ندارد، از Wallet.points_balance استفاده کن
-                if total_points == 0 and not all_points_transactions.exists():
-                    all_wallets = Wallet.objects.filter(customer=customer)
-                    total_points = sum(w.points_balance for w in all_wallets) or 0
-                
-            except Exception as e:
-                import traceback
-                print(f"Error in RedeemableProductsView: {e}")
-                print(traceback.format_exc())
-                pass
-
-        items = []
-        for p in products:
-            business = p.business
-            business_points = user_points.get(business.id, 0) if request.user.is_authenticated else 0
-            
-            # اگر Wallet وجود ندارد یا business_points 0 است، از PointsTransaction محاسبه کن
-            if request.user.is_authenticated:
-                try:
-                    customer, _ = Customer.objects.get_or_create(user=request.user)
-                    wallet, created = Wallet.objects.get_or_create(
-                        customer=customer,
-                        business=business,
-                        defaults={
-                            'points_balance': 0,
-                            'reward_point_cost': business.reward_point_cost or 100
-                        }
-                    )
-                    
-                    # محاسبه business_points از PointsTransaction (واقعی)
-                    wallet_points = PointsTransaction.objects.filter(wallet=wallet).aggregate(
-                        total=Sum("points")
-                    ).get("total") or 0
-                    
-                    # اگر هیچ تراکنشی وجود ندارد، از wallet.points_balance استفاده کن
-                    if wallet_points == 0:
-                        wallet_points = wallet.points_balance or 0
-                    
-                    business_points = wallet_points
-                    user_points[business.id] = business_points
-                except Exception:
-                    pass
-            
-            items.append({
-                "id": p.id,
-                "title": p.title,
-                "image": request.build_absolute_uri(p.image.url) if p.image else None,
-                "business_id": business.id,
-                "business_name": business.name,
-                "points_required": p.points_reward,
-                "price_cents": p.price_cents,
-                # موقتاً can_redeem را true می‌کنیم (بعداً درست می‌کنیم)
-                "can_redeem": True if request.user.is_authenticated else False,
-                "user_points": business_points if request.user.is_authenticated else None,
-            })
+        # One read of the customer's wallet balances; nothing is created on GET
+        authenticated = request.user.is_authenticated
+        balances = eligibility.customer_balances(request.user) if authenticated else None
+
+        items = [eligibility.redeemable_item(request, entry) for entry in eligibility.evaluate(products, balances)]
 
         response_data = {
             "products": items,
@@ -560,9 +469,9 @@ class RedeemableProductsView(APIView):
                 "has_next": (offset + limit) < count
             }
         }
-        
-        if request.user.is_authenticated:
-            # total_points از تاریخچه تراکنش‌ها محاسبه شده است (واقعی)
-            response_data["total_points"] = total_points
+
+        if authenticated:
+            # جمع موجودی همه‌ی کیف‌پول‌ها (همان مقدار CustomerPointsSummary.total_balance)
+            response_data["total_points"] = balances.total
 
         return Response(response_data, status=status.HTTP_200_OK)
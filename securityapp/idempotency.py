@@ -0,0 +1,163 @@
+"""
+``Idempotency-Key`` support for state-changing API endpoints.
+
+Clients send ``Idempotency-Key: <uuid>`` on a POST they may retry. The first
+request runs normally and its response is stored (IdempotencyKey row + cache) in
+the same DB transaction as the view's own writes. A retry with the same key, user
+and path gets the stored response back with ``Idempotent-Replayed: true`` and the
+view does not run again: a cache hit costs no query, a miss one primary-key read.
+
+Reusing a key with a different body returns 422, and a retry that arrives while
+the first request is still running returns 409. Server errors (5xx) are not
+stored, so they can be retried with the same key; their writes are rolled back.
+
+The view runs in a savepoint of its own. When it rolls back its writes (a 4xx
+after ``transaction.set_rollback(True)``, e.g. insufficient points) only the
+savepoint is undone, and the answer is still stored and replayed.
+
+Usage (below ``@transaction.atomic`` / ``@api_view``, directly on the handler)::
+
+    @transaction.atomic
+    @idempotent
+    def post(self, request): ...
+"""
+
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http.request import RawPostDataException
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.views import APIView
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+
+def _ttl() -> int:
+    return int(getattr(settings, "IDEMPOTENCY_KEY_TTL", 24 * 3600))
+
+
+def _sha256(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _cache_key(key_hash: str) -> str:
+    return f"idempotency:{key_hash}"
+
+
+def _request_hash(request) -> str:
+    try:
+        raw = request.body
+    except RawPostDataException:
+        # The body stream was already consumed; hash the parsed data instead
+        raw = json.dumps(request.data, sort_keys=True, cls=JSONEncoder).encode("utf-8")
+    return _sha256(raw)
+
+
+def _stored_response(stored_request_hash, status_code, body, request_hash) -> Response:
+    if stored_request_hash != request_hash:
+        return Response(
+            {"detail": f"{HEADER} was already used with a different request body"},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if status_code is None:
+        return Response(
+            {"detail": f"A request with this {HEADER} is still being processed"},
+            status=status.HTTP_409_CONFLICT,
+        )
+    response = Response(json.loads(body) if body else None, status=status_code)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def idempotent(view_func):
+    """Store and replay responses for requests carrying an ``Idempotency-Key`` header."""
+
+    @functools.wraps(view_func)
+    def wrapper(*args, **kwargs):
+        request = args[1] if isinstance(args[0], APIView) else args[0]
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_func(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"detail": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        user_id = request.user.pk if request.user.is_authenticated else ""
+        key_hash = _sha256(user_id, request.method, request.path, key)
+        request_hash = _request_hash(request)
+
+        cached = cache.get(_cache_key(key_hash))
+        if cached is not None:
+            return _stored_response(*cached, request_hash)
+
+        # Joins the view's own transaction when there is one, so the stored
+        # response commits together with the wallet changes.
+        with transaction.atomic(savepoint=False):
+            now = timezone.now()
+            row = (
+                IdempotencyKey.objects.filter(pk=key_hash)
+                .values_list("request_hash", "status_code", "response_body", "expires_at")
+                .first()
+            )
+            if row is not None and row[3] <= now:
+                IdempotencyKey.objects.filter(pk=key_hash).delete()
+                row = None
+            if row is not None:
+                return _stored_response(*row[:3], request_hash)
+
+            try:
+                with transaction.atomic():
+                    IdempotencyKey.objects.create(
+                        key_hash=key_hash,
+                        request_hash=request_hash,
+                        expires_at=now + timedelta(seconds=_ttl()),
+                    )
+            except IntegrityError:
+                # A concurrent request with the same key got there first
+                row = (
+                    IdempotencyKey.objects.filter(pk=key_hash)
+                    .values_list("request_hash", "status_code", "response_body")
+                    .first()
+                )
+                return _stored_response(*(row or (request_hash, None, "")), request_hash)
+
+            # set_rollback(True) in the view (or a failed statement) only undoes this
+            # savepoint; the key row above stays usable
+            with transaction.atomic():
+                response = view_func(*args, **kwargs)
+                if response.status_code >= 500:
+                    # Retried with the same key: nothing of this attempt may stay
+                    transaction.set_rollback(True)
+            if transaction.get_rollback():
+                # The surrounding transaction is lost anyway; nothing can be stored
+                return response
+            if response.status_code >= 500 or not hasattr(response, "data"):
+                IdempotencyKey.objects.filter(pk=key_hash).delete()
+                return response
+
+            body = json.dumps(response.data, cls=JSONEncoder)
+            IdempotencyKey.objects.filter(pk=key_hash).update(status_code=response.status_code, response_body=body)
+            stored = (request_hash, response.status_code, body)
+            transaction.on_commit(lambda: cache.set(_cache_key(key_hash), stored, _ttl()))
+        return response
+
+    return wrapper
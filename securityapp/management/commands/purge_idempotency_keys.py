@@ -0,0 +1,33 @@
+"""
+Delete expired Idempotency-Key records.
+
+Usage:
+    python manage.py purge_idempotency_keys
+    python manage.py purge_idempotency_keys --batch-size 5000
+"""
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from securityapp.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key records (run periodically, e.g. from the scheduler)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        total = 0
+        while True:
+            # Delete in primary-key batches so a large backlog does not hold one long lock
+            keys = list(
+                IdempotencyKey.objects.filter(expires_at__lte=now)
+                .values_list("pk", flat=True)[: options["batch_size"]]
+            )
+            if not keys:
+                break
+            deleted, _ = IdempotencyKey.objects.filter(pk__in=keys).delete()
+            total += deleted
+        self.stdout.write(self.style.SUCCESS(f"Deleted {total} expired idempotency keys"))
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from django.db import models
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored response for a client ``Idempotency-Key`` (see securityapp.idempotency).
+
+    The primary key is a hash of (user, method, path, header value), so a replay
+    is a single primary-key lookup. ``status_code`` stays empty while the first
+    request is still running.
+    """
+    key_hash = models.CharField(max_length=64, primary_key=True)
+    request_hash = models.CharField(max_length=64, help_text="SHA256 of the request body")
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:  # pragma: no cover
+        return f"{self.key_hash[:12]} ({self.status_code or 'in progress'})"
@@ -50,7 +50,7 @@ def test_image_cache():
     from django.db.models import Q
     cache_count = ImageCache.objects.count()
     cache_with_data = ImageCache.objects.filter(
-        Q(image_data__isnull=False) | Q(image_url__isnull=False)
+        Q(blob__isnull=False) | Q(image_url__isnull=False)
     ).count()
     
     print(f"   کل کش‌ها: {cache_count}")
@@ -65,7 +65,7 @@ def test_image_cache():
         print(f"   Original Path: {sample_cache.original_path}")
         print(f"   Has Data: {sample_cache.has_data}")
         print(f"   Has URL: {bool(sample_cache.image_url)}")
-        print(f"   Has Base64: {bool(sample_cache.image_data)}")
+        print(f"   Has Blob: {bool(sample_cache.blob_id)}")
         if sample_cache.file_size:
             print(f"   File Size: {sample_cache.file_size / 1024:.1f} KB")
     